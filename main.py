@@ -1,62 +1,468 @@
 """Main entry point for Zwift to Garmin activity transfer."""
 
+import argparse
+import contextlib
 import sys
 import os
+import json
+import socket
 import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from services.zwift_service import ZwiftService
+from services.zwift_service import DEFAULT_PAGE_SIZE, ZwiftService
 from services.fit_file_service import FitFileService
 from services.garmin_service import GarminService
 from services.activity_processor import ActivityProcessor
 from services.runalyze_service import RunalyzeService
+from services.archive_service import ArchiveService
+from services import tracing
+from services.log_setup import JSON, TEXT, configure_logging
+from services.fit_cache import FitCache
+from services.rate_limiter import RateLimiter
+from services.retry import Retrier
 
+DESTINATIONS = ["runalyze", "garmin", "archive"]
+DEFAULT_ARCHIVE_DIR = "fit-archive"
+DEFAULT_STATE_DIR = "~/.zwift-to-runalyze"
+DEFAULT_LISTEN = "127.0.0.1:8080"
+DEFAULT_SHARD_INTERVAL = 300
+DEFAULT_FIT_CACHE_MB = 1024
+CREDENTIAL_KEYS = ["ZWIFT_USERNAME", "ZWIFT_PASSWORD", "GARMIN_USERNAME", "GARMIN_PASSWORD", "RUNANLYZE_TOKEN"]
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 
-def main():
-    """Main function to orchestrate the activity transfer process."""
-    # Load environment variables from .env file
+def _date(value: str) -> str:
+    """Validate a YYYY-MM-DD date argument."""
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD") from e
+    return value
+
+
+def _positive_int(value: str) -> int:
+    """Validate a strictly positive integer argument."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def _listen_address(value: str) -> Tuple[str, int]:
+    """Validate a HOST:PORT argument."""
+    host, _, port = value.rpartition(":")
+    if not port.isdigit():
+        raise argparse.ArgumentTypeError(f"invalid address '{value}', expected HOST:PORT")
+    return host or "127.0.0.1", int(port)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    Args:
+        argv: Argument list (defaults to sys.argv[1:])
+
+    Returns:
+        Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Transfer Zwift activities to Runalyze and other destinations.")
+
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--latest", action="store_true",
+                      help="sync the most recent activity (default)")
+    mode.add_argument("--last", type=_positive_int, metavar="N",
+                      help="sync the last N activities")
+    mode.add_argument("--since", type=_date, metavar="YYYY-MM-DD",
+                      help="sync all activities started after the given date")
+    mode.add_argument("--backfill", action="store_true",
+                      help="sync every activity in the Zwift catalog")
+
+    parser.add_argument("--destination", dest="destinations", action="append",
+                        choices=DESTINATIONS, metavar="NAME",
+                        help="upload target, repeat to fan out to several "
+                             f"({', '.join(DESTINATIONS)}; default: runalyze)")
+    parser.add_argument("--archive-dir", default=DEFAULT_ARCHIVE_DIR,
+                        help=f"directory for the archive destination (default: {DEFAULT_ARCHIVE_DIR})")
+    parser.add_argument("--garmin-token-dir", default=None,
+                        help="cached Garmin Connect session directory (defaults to $GARMINTOKENS or ~/.garth)")
+    parser.add_argument("--compress", action="store_true",
+                        help="upload zip archives to Runalyze, packing several rides per request")
+    parser.add_argument("--concurrency", type=_positive_int, default=None, metavar="N",
+                        help="number of parallel workers (defaults to the CPU count)")
+    parser.add_argument("--modify-device", action="store_true",
+                        help="rewrite the device info of each file before uploading")
+    parser.add_argument("--ftp", type=_positive_int, default=None, metavar="WATTS",
+                        help="compute ride metrics (NP, IF, TSS, zones) of each activity with this FTP")
+    parser.add_argument("--max-hr", type=_positive_int, default=None, metavar="BPM",
+                        help="maximum heart rate for the heart rate zones of the ride metrics")
+    parser.add_argument("--power-curve", action="store_true",
+                        help="maintain the all-time power-duration curve of each downloaded activity in the state dir")
+    parser.add_argument("--merge-splits", type=_positive_int, default=None, metavar="MINUTES",
+                        help="merge activities that follow each other within this many minutes "
+                             "(e.g. after a Zwift crash) into one upload")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="download and transform activities without uploading them")
+    parser.add_argument("--cache-dir", default=None,
+                        help="directory for downloaded FIT files (defaults to the temp dir)")
+    parser.add_argument("--fit-cache", default=None, metavar="DIR",
+                        help="keep downloaded FIT files in this local cache and reuse them instead of downloading")
+    parser.add_argument("--fit-cache-mb", type=_positive_int, default=DEFAULT_FIT_CACHE_MB, metavar="MB",
+                        help=f"size budget of the FIT cache, least recently used files are evicted "
+                             f"(default: {DEFAULT_FIT_CACHE_MB})")
+    parser.add_argument("--page-size", type=_positive_int, default=DEFAULT_PAGE_SIZE, metavar="N",
+                        help=f"activities per Zwift catalog request (default: {DEFAULT_PAGE_SIZE})")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help="append trace spans of each activity's listing, download, transform and uploads "
+                             "to this file (OTLP JSON lines)")
+    parser.add_argument("--record-http", default=None, metavar="FILE",
+                        help="record all HTTP traffic of the run, scrubbed of credentials, to this cassette file")
+    parser.add_argument("--replay-http", default=None, metavar="FILE",
+                        help="serve all HTTP requests of the run from a recorded cassette, without network")
+    parser.add_argument("--replay-speed", type=float, default=1.0, metavar="FACTOR",
+                        help="divide the recorded latencies by FACTOR on replay, 0 for no delays (default: 1)")
+    parser.add_argument("--profile", nargs="?", const="cprofile", default=None, choices=["cprofile", "sampling"],
+                        help="profile the run (cProfile by default, or a sampling profiler) and write a report of "
+                             "stage times, top functions and peak memory")
+    parser.add_argument("--profile-dir", default=None, metavar="DIR",
+                        help="directory of the --profile reports (defaults to <state dir>/profiles)")
+    parser.add_argument("--state-dir", default=DEFAULT_STATE_DIR,
+                        help=f"directory for persistent sync state (default: {DEFAULT_STATE_DIR})")
+    parser.add_argument("--queue-db", default=None, metavar="PATH",
+                        help="process activities through a durable SQLite work queue that survives restarts")
+    parser.add_argument("--worker", action="store_true",
+                        help="with --queue-db, only consume queued jobs (run several for parallel workers)")
+    parser.add_argument("--athletes", default=None, metavar="FILE",
+                        help="JSON file mapping athlete ids to their credentials (overriding the environment)")
+    parser.add_argument("--shard-db", default=None, metavar="PATH",
+                        help="sync the --athletes as one of several workers coordinated through this SQLite file")
+    parser.add_argument("--worker-id", default=None,
+                        help="id of this worker in --shard-db mode (defaults to host and pid)")
+    parser.add_argument("--shard-interval", type=_positive_int, default=DEFAULT_SHARD_INTERVAL, metavar="SECONDS",
+                        help=f"seconds between sync rounds in --shard-db mode (default: {DEFAULT_SHARD_INTERVAL})")
+    parser.add_argument("--serve", action="store_true",
+                        help="run as a daemon that syncs when POST /sync is called")
+    parser.add_argument("--listen", type=_listen_address, default=DEFAULT_LISTEN, metavar="HOST:PORT",
+                        help=f"address of the trigger endpoint in --serve mode (default: {DEFAULT_LISTEN})")
+    parser.add_argument("--poll", action="store_true",
+                        help="in --serve mode, also poll Zwift at intervals adapted to your riding times")
+    parser.add_argument("--log-level", default="INFO", type=str.upper,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+                        help="logging level (default: INFO)")
+    parser.add_argument("--log-format", default=TEXT, choices=[TEXT, JSON],
+                        help="log lines as text or as JSON objects (default: text)")
+    args = parser.parse_args(argv)
+    if args.poll and not args.serve:
+        parser.error("--poll requires --serve")
+    if args.worker and not args.queue_db:
+        parser.error("--worker requires --queue-db")
+    if args.queue_db and (args.dry_run or args.serve):
+        parser.error("--queue-db cannot be combined with --dry-run or --serve")
+    if args.profile and (args.serve or args.shard_db):
+        parser.error("--profile cannot be combined with --serve or --shard-db")
+    if args.record_http and args.replay_http:
+        parser.error("--record-http and --replay-http cannot be combined")
+    if args.replay_speed < 0:
+        parser.error("--replay-speed must not be negative")
+    if bool(args.shard_db) != bool(args.athletes):
+        parser.error("--shard-db and --athletes must be used together")
+    if args.shard_db and (args.serve or args.queue_db):
+        parser.error("--shard-db cannot be combined with --serve or --queue-db")
+    # Each destination receives a file once, in the order given
+    args.destinations = list(dict.fromkeys(args.destinations or ["runalyze"]))
+    return args
+
+
+def load_athletes(path: str) -> Dict[str, Dict[str, str]]:
+    """Load the athletes file.
+
+    Args:
+        path: JSON file of the form {"<athlete>": {"ZWIFT_USERNAME": ..., ...}}
+
+    Returns:
+        Credential overrides per athlete id
+
+    Raises:
+        ValueError: If the file is not a JSON object of objects
+    """
+    with open(os.path.expanduser(path), "r", encoding="utf-8") as f:
+        athletes = json.load(f)
+    if not isinstance(athletes, dict) or not all(isinstance(values, dict) for values in athletes.values()):
+        raise ValueError(f"{path} must map athlete ids to objects of credentials")
+    return athletes
+
+
+def load_credentials(args: argparse.Namespace, overrides: Optional[Dict[str, str]] = None,
+                     athlete: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """Collect and validate the credentials needed by the selected destinations.
+
+    Args:
+        args: Parsed command line arguments
+        overrides: Values taking precedence over the environment
+        athlete: Athlete id for error messages
+
+    Returns:
+        Credentials by environment variable name
+
+    Raises:
+        ValueError: If a required credential is missing
+    """
+    credentials = {key: os.getenv(key) for key in CREDENTIAL_KEYS}
+    credentials.update(overrides or {})
+
+    required = ["ZWIFT_USERNAME", "ZWIFT_PASSWORD"]
+    if "garmin" in args.destinations:
+        required += ["GARMIN_USERNAME", "GARMIN_PASSWORD"]
+    if "runalyze" in args.destinations and not args.dry_run:
+        required.append("RUNANLYZE_TOKEN")
+    if not all(credentials.get(key) for key in required):
+        suffix = f" (athlete {athlete})" if athlete else ""
+        raise ValueError(f"Missing required environment variables{suffix}. Please check your .env file.")
+    return credentials
+
+
+def build_processor(args: argparse.Namespace, credentials: Dict[str, Optional[str]], retrier: Retrier,
+                    rate_limiter: RateLimiter, state_dir: str,
+                    garmin_token_dir: Optional[str] = None) -> ActivityProcessor:
+    """Wire the services of one athlete into an ActivityProcessor.
+
+    Args:
+        args: Parsed command line arguments
+        credentials: Credentials by environment variable name
+        retrier: Retry/circuit-breaker component shared by all services
+        rate_limiter: Request rate limiter shared by all services
+        state_dir: Directory for the athlete's persistent sync state
+        garmin_token_dir: Cached Garmin Connect session directory
+
+    Returns:
+        The configured processor
+    """
+    fit_cache = FitCache(args.fit_cache, max_bytes=args.fit_cache_mb * 1024 * 1024) if args.fit_cache else None
+    zwift_service = ZwiftService(credentials["ZWIFT_USERNAME"], credentials["ZWIFT_PASSWORD"],
+                                 cache_dir=args.cache_dir, retrier=retrier, rate_limiter=rate_limiter,
+                                 fit_cache=fit_cache, page_size=args.page_size)
+    fit_file_service = FitFileService(cache_dir=args.cache_dir)
+    destinations = []
+    for name in args.destinations:
+        if name == "runalyze":
+            destinations.append(RunalyzeService(credentials["RUNANLYZE_TOKEN"], index_path=os.path.join(
+                state_dir, "runalyze_uploads.json"), compress=args.compress,
+                retrier=retrier, rate_limiter=rate_limiter))
+        elif name == "garmin":
+            destinations.append(GarminService(credentials["GARMIN_USERNAME"], credentials["GARMIN_PASSWORD"],
+                                              token_dir=garmin_token_dir,
+                                              retrier=retrier, rate_limiter=rate_limiter))
+        elif name == "archive":
+            destinations.append(ArchiveService(args.archive_dir))
+
+    power_curve = None
+    if args.power_curve:
+        # Imports numpy, which other runs do not need
+        from services.power_curve import PowerCurveIndex
+        power_curve = PowerCurveIndex(os.path.join(state_dir, "power_curve.json"))
+
+    return ActivityProcessor(zwift_service, destinations, fit_file_service,
+                             modify_device=args.modify_device,
+                             transform_workers=args.concurrency,
+                             dry_run=args.dry_run, ftp=args.ftp, max_hr=args.max_hr,
+                             power_curve=power_curve,
+                             merge_gap=args.merge_splits * 60 if args.merge_splits else None)
+
+
+def run_sync(processor: ActivityProcessor, args: argparse.Namespace) -> bool:
+    """Run the sync mode selected on the command line.
+
+    Args:
+        processor: Configured activity processor
+        args: Parsed command line arguments
+
+    Returns:
+        True if successful, False otherwise
+    """
+    if args.last:
+        return processor.process_last_x_activities(args.last)
+    if args.since:
+        return processor.process_activities_since_date(args.since)
+    if args.backfill:
+        return processor.process_all_activities()
+    return processor.process_latest_activity()
+
+
+def run_queue(processor: ActivityProcessor, args: argparse.Namespace) -> bool:
+    """Run the sync through the durable work queue.
+
+    Unless running as a pure worker, the activities of the selected mode are
+    listed into the queue first; then queued jobs, including those left over
+    by an interrupted run, are processed.
+
+    Args:
+        processor: Configured activity processor
+        args: Parsed command line arguments
+
+    Returns:
+        True if successful, False otherwise
+    """
+    from services.work_queue import WorkQueue
+
+    work_queue = WorkQueue(os.path.expanduser(args.queue_db))
+    if not args.worker:
+        if args.last:
+            max_count = args.last
+        elif args.since or args.backfill:
+            max_count = None
+        else:
+            max_count = 1
+        processor.enqueue_activities(work_queue, max_count=max_count, since=args.since)
+    return processor.run_queue_worker(work_queue)
+
+
+def run_daemon(processor: ActivityProcessor, args: argparse.Namespace, athlete: str) -> None:
+    """Serve sync triggers until interrupted.
+
+    Each trigger queues a sync in the mode selected on the command line;
+    triggers arriving while a sync is queued are coalesced into it. With
+    --poll, new activities found by the adaptive poll scheduler are queued
+    the same way.
+
+    Args:
+        processor: Configured activity processor
+        args: Parsed command line arguments
+        athlete: Id of the athlete served
+    """
+    # http.server is only needed by the daemon
+    from services.trigger_server import SyncQueue, TriggerServer
+    from services.poll_scheduler import PollScheduler
+
     logger = logging.getLogger(__name__)
-    logger.info("test")
-    load_dotenv()
-
-    # Get credentials from environment variables
-    zwift_username = os.getenv("ZWIFT_USERNAME")
-    zwift_password = os.getenv("ZWIFT_PASSWORD")
-    garmin_username = os.getenv("GARMIN_USERNAME")
-    garmin_password = os.getenv("GARMIN_PASSWORD")
-    runalyze_token = os.getenv("RUNANLYZE_TOKEN")
-
-    # Validate required environment variables
-    if not all([zwift_username, zwift_password, garmin_username, garmin_password]):
-        raise ValueError("Missing required environment variables. Please check your .env file.")
-
-    # Initialize services with dependency injection
-    zwift_service = ZwiftService(zwift_username, zwift_password)
-    fit_file_service = FitFileService()
-#    garmin_service = GarminService(garmin_username, garmin_password)
-    runalyze_service = RunalyzeService(runalyze_token)
-
-    # Create the main processor
-    processor = ActivityProcessor(zwift_service, runalyze_service, fit_file_service)
-
-    # Process the latest activity
-    
-#    success = processor.process_latest_activity()
-    success = processor.process_last_x_activities(2)
-
-    #success = processor.process_activities_since_date("2025-10-15")
-    if success:
-        logger.info("✅ Activity successfully transferred from Zwift to Runalyze!")
-    else:
-        logger.error("❌ Failed to transfer activity. Check the logs for details.")
-        sys.exit(1)
+    sync_queue = SyncQueue(lambda _athlete: run_sync(processor, args))
+    host, port = args.listen
+    server = TriggerServer(sync_queue, [athlete], host=host, port=port, token=os.getenv("TRIGGER_TOKEN"))
+    scheduler = PollScheduler(sync_queue.submit, {athlete: processor.zwift_service.list_activities})
+    sync_queue.start()
+    if args.poll:
+        scheduler.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping the trigger server")
+    finally:
+        server.httpd.server_close()
+        scheduler.stop()
+        sync_queue.stop()
+
+
+def run_sharded(args: argparse.Namespace, athletes: Dict[str, Dict[str, Optional[str]]],
+                retrier: Retrier, rate_limiter: RateLimiter) -> None:
+    """Sync athletes as one of several workers sharing a coordinator database.
+
+    Athletes are mapped to the live workers by consistent hashing and synced
+    under a lease; when a worker dies, its athletes move to the others.
+
+    Args:
+        args: Parsed command line arguments
+        athletes: Validated credentials per athlete id
+        retrier: Retry/circuit-breaker component shared by all services
+        rate_limiter: Request rate limiter shared by all services
+    """
+    from services.shard_coordinator import ShardCoordinator, ShardedWorker
+
+    logger = logging.getLogger(__name__)
+    processors: Dict[str, ActivityProcessor] = {}
+
+    def sync_athlete(athlete: str) -> bool:
+        # Processors are kept so an athlete's logins are reused across rounds
+        if athlete not in processors:
+            state_dir = os.path.join(os.path.expanduser(args.state_dir), "athletes", athlete)
+            processors[athlete] = build_processor(args, athletes[athlete], retrier, rate_limiter, state_dir,
+                                                  garmin_token_dir=os.path.join(state_dir, "garth"))
+        return run_sync(processors[athlete], args)
+
+    worker_id = args.worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    coordinator = ShardCoordinator(os.path.expanduser(args.shard_db), worker_id)
+    worker = ShardedWorker(coordinator, sorted(athletes), sync_athlete)
+    logger.info("Worker %s joining the shard of %s athletes", worker_id, len(athletes))
+    try:
+        worker.run_forever(args.shard_interval)
+    except KeyboardInterrupt:
+        logger.info("Worker %s leaving the shard", worker_id)
+
+
+def _http_cassette(args: argparse.Namespace):
+    """HTTP cassette selected on the command line, or a no-op context."""
+    if not (args.record_http or args.replay_http):
+        return contextlib.nullcontext()
+    # Imports requests, which is otherwise loaded on first use
+    from services.http_cassette import RECORD, REPLAY, HttpCassette
+    if args.record_http:
+        return HttpCassette(args.record_http, RECORD)
+    return HttpCassette(args.replay_http, REPLAY, speed=args.replay_speed)
+
+
+def _tracer(args: argparse.Namespace):
+    """Span tracer writing to the --trace file, or a no-op context."""
+    if not args.trace:
+        return contextlib.nullcontext()
+    return tracing.Tracer(tracing.FileSpanExporter(args.trace))
+
+
+def _run_profiler(args: argparse.Namespace, processor: ActivityProcessor):
+    """Profiler of the run selected on the command line, or a no-op context."""
+    if not args.profile:
+        return contextlib.nullcontext()
+    # cProfile, pstats and tracemalloc are only loaded for profiled runs
+    from services.run_profiler import RunProfiler
+    profiler = RunProfiler(args.profile_dir or os.path.join(os.path.expanduser(args.state_dir), "profiles"),
+                           mode=args.profile)
+    profiler.instrument_processor(processor)
+    return profiler
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main function to orchestrate the activity transfer process.
+
+    Args:
+        argv: Command line arguments (defaults to sys.argv[1:])
+    """
+    args = parse_args(argv)
+
+    # Configure logging; records are written by a background thread
+    configure_logging(args.log_level, args.log_format)
+    logger = logging.getLogger(__name__)
+
+    with _http_cassette(args), _tracer(args):
+        # Load environment variables from .env file
+        load_dotenv()
+
+        # Initialize services with dependency injection; the retrier and rate
+        # limiter are shared so retry budgets, circuit breakers and request rates
+        # cover the whole run (and all athletes of a sharded worker)
+        retrier = Retrier()
+        rate_limiter = RateLimiter()
+
+        if args.shard_db:
+            athletes = {athlete: load_credentials(args, overrides, athlete)
+                        for athlete, overrides in load_athletes(args.athletes).items()}
+            run_sharded(args, athletes, retrier, rate_limiter)
+            return
+
+        # Get credentials from environment variables
+        credentials = load_credentials(args)
+        processor = build_processor(args, credentials, retrier, rate_limiter, os.path.expanduser(args.state_dir),
+                                    garmin_token_dir=args.garmin_token_dir)
+
+        if args.serve:
+            run_daemon(processor, args, credentials["ZWIFT_USERNAME"])
+            return
+
+        with _run_profiler(args, processor):
+            success = run_queue(processor, args) if args.queue_db else run_sync(processor, args)
+        logger.info("Request metrics: %s, throttling: %s", retrier.metrics(), rate_limiter.stats())
+        if success:
+            logger.info("✅ Activity successfully transferred from Zwift to %s!", ', '.join(args.destinations))
+        else:
+            logger.error("❌ Failed to transfer activity. Check the logs for details.")
+            sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,141 @@
+"""Fingerprints of uploaded activities for duplicate detection."""
+
+import os
+import json
+import logging
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from services.fit_encoder import FIT_EPOCH_OFFSET, SESSION, iter_messages
+
+# Tolerances when comparing fingerprints from different sources (FIT file vs.
+# values rounded by the destination)
+DURATION_TOLERANCE_S = 2
+DISTANCE_TOLERANCE_M = 20
+
+
+class ActivityFingerprint(NamedTuple):
+    """Identity of an activity: start time, duration and distance.
+
+    Attributes:
+        start_time: Start time as UTC epoch seconds
+        duration: Total elapsed time in seconds
+        distance: Total distance in meters
+    """
+
+    start_time: int
+    duration: int
+    distance: int
+
+    def matches(self, other: "ActivityFingerprint") -> bool:
+        """Check whether two fingerprints describe the same activity."""
+        return (self.start_time == other.start_time
+                and abs(self.duration - other.duration) <= DURATION_TOLERANCE_S
+                and abs(self.distance - other.distance) <= DISTANCE_TOLERANCE_M)
+
+
+def fingerprint_from_fit(fit_file_path: str) -> Optional[ActivityFingerprint]:
+    """Read the fingerprint from the session message of a FIT file.
+
+    The messages are walked without decoding them, and only the first
+    session message with a start time is unpacked.
+
+    Args:
+        fit_file_path: Path to the FIT file
+
+    Returns:
+        The fingerprint, or None if the file has no usable session message
+    """
+    try:
+        with open(fit_file_path, "rb") as f:
+            data = f.read()
+        for message in iter_messages(data):
+            if message.is_definition or message.definition.global_number != SESSION:
+                continue
+            values = message.definition.values(message.body(data))
+            start_time = values.get("start_time")
+            # FIT date_times below 0x10000000 are relative to the device power-on
+            if not isinstance(start_time, int) or start_time < 0x10000000:
+                continue
+            return ActivityFingerprint(
+                start_time=start_time + FIT_EPOCH_OFFSET,
+                duration=round(values.get("total_elapsed_time") or 0),
+                distance=round(values.get("total_distance") or 0),
+            )
+    except (OSError, ValueError) as e:
+        logging.getLogger(__name__).warning("Cannot fingerprint %s: %s", fit_file_path, e)
+    return None
+
+
+class ActivityIndex:
+    """Set of activity fingerprints, optionally persisted to a JSON file.
+
+    Lookups are keyed by start time, so checking a fingerprint is a dict
+    access plus a tolerance comparison against the few activities that
+    started in the same second.
+    """
+
+    def __init__(self, index_path: Optional[str] = None):
+        """Initialize ActivityIndex and load the persisted fingerprints.
+
+        Args:
+            index_path: JSON file the index is stored in; None keeps it in memory only
+        """
+        self.index_path = index_path
+        self.logger = logging.getLogger(__name__)
+        self._by_start: Dict[int, List[ActivityFingerprint]] = {}
+        self._lock = threading.Lock()
+        if index_path and os.path.exists(index_path):
+            self._load()
+
+    def __len__(self) -> int:
+        return sum(len(fingerprints) for fingerprints in self._by_start.values())
+
+    def __contains__(self, fingerprint: ActivityFingerprint) -> bool:
+        return any(fingerprint.matches(known) for known in self._by_start.get(fingerprint.start_time, ()))
+
+    def add(self, fingerprint: ActivityFingerprint) -> None:
+        """Add a fingerprint and persist the index.
+
+        Args:
+            fingerprint: Fingerprint of an uploaded activity
+        """
+        with self._lock:
+            if fingerprint in self:
+                return
+            self._by_start.setdefault(fingerprint.start_time, []).append(fingerprint)
+            self._save()
+
+    def update(self, fingerprints: Iterable[ActivityFingerprint]) -> None:
+        """Add several fingerprints without persisting them.
+
+        Used for fingerprints fetched from the destination, which is the
+        source of truth for them.
+
+        Args:
+            fingerprints: Fingerprints to add
+        """
+        with self._lock:
+            for fingerprint in fingerprints:
+                if fingerprint not in self:
+                    self._by_start.setdefault(fingerprint.start_time, []).append(fingerprint)
+
+    def _load(self) -> None:
+        """Load fingerprints from the index file."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for entry in json.load(f):
+                    fingerprint = ActivityFingerprint(*entry)
+                    self._by_start.setdefault(fingerprint.start_time, []).append(fingerprint)
+            self.logger.info("Loaded %s activity fingerprints from %s", len(self), self.index_path)
+        except (OSError, ValueError, TypeError) as e:
+            self.logger.warning("Ignoring unreadable activity index %s: %s", self.index_path, e)
+
+    def _save(self) -> None:
+        """Write the index file atomically."""
+        if not self.index_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump([list(fp) for fps in self._by_start.values() for fp in fps], f)
+        os.replace(temp_path, self.index_path)
@@ -1,39 +1,77 @@
 """Activity processor for orchestrating the Zwift to Garmin workflow."""
 
+import os
+import time
+import socket
 import logging
-from typing import Optional
-from services.zwift_service import ZwiftService
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence
+from services import tracing
+from services.activity_record import as_record, split_session_groups
+from services.zwift_service import ZwiftService, date_cutoff
 from services.fit_file_service import FitFileService
-from services.garmin_service import GarminService
-from services.runalyze_service import RunalyzeService
+from services.destination import Destination
+from services.upload_result import RunReport, UploadResult, UploadStatus
+from services.work_queue import DOWNLOADED, FAILED, LISTED, TRANSFORMED, UPLOADED, Job, WorkQueue
+
+if TYPE_CHECKING:
+    # Imports numpy, which is only loaded when rides are analysed
+    from services.power_curve import PowerCurveIndex
+
+# Window of the recent power curve logged next to the all-time curve
+RECENT_CURVE_DAYS = 90
 
 
 class ActivityProcessor:
     """Main orchestrator for processing activities from Zwift to Garmin."""
 
     def __init__(self,
-                 zwift_service: ZwiftService, runalyze_service: RunalyzeService, fit_file_service:FitFileService):
+                 zwift_service: ZwiftService, destinations: Sequence[Destination], fit_file_service:FitFileService,
+                 modify_device: bool = False, transform_workers: Optional[int] = None,
+                 dry_run: bool = False, ftp: Optional[float] = None, max_hr: Optional[float] = None,
+                 power_curve: Optional["PowerCurveIndex"] = None, merge_gap: Optional[int] = None):
         """Initialize ActivityProcessor with injected services.
 
         Args:
             zwift_service: Service for Zwift operations
+            destinations: Upload targets; each downloaded file is fanned out to all of them
             fit_file_service: Service for FIT file operations
-            garmin_service: Service for Garmin operations
+            modify_device: Rewrite the device info of downloaded files before uploading
+            transform_workers: Number of processes used to transform batches
+                (defaults to the CPU count)
+            dry_run: Download and transform activities but skip the uploads
+            ftp: Functional threshold power; when set, ride metrics (NP, IF,
+                TSS, zones) are computed for every downloaded activity
+            max_hr: Maximum heart rate for the heart rate zones of the metrics
+            power_curve: Index updated with the best efforts of every
+                downloaded activity
+            merge_gap: When set, activities of a batch that follow each other
+                within this many seconds are merged into one upload
         """
         self.zwift_service = zwift_service
         self.fit_file_service = fit_file_service
-#        self.garmin_service = garmin_service
-        self.runalyze_service = runalyze_service
+        self.destinations = list(destinations)
+        self.modify_device = modify_device
+        self.transform_workers = transform_workers
+        self.dry_run = dry_run
+        self.ftp = ftp
+        self.max_hr = max_hr
+        self.power_curve = power_curve
+        self.merge_gap = merge_gap
+        # Upload results of the last run
+        self.report = RunReport()
         self.logger = logging.getLogger(__name__)
 
 
+    @tracing.traced("sync.latest_activity")
     def process_latest_activity(self) -> bool:
         """Process the latest activity from Zwift to Garmin.
 
         Returns:
             True if successful, False otherwise
         """
-        original_file_path: Optional[str] = None
+        file_path_list = []
 
         try:
             # Step 1: Authenticate with Zwift and download activity
@@ -45,25 +83,22 @@ class ActivityProcessor:
                 self.logger.info("No activities found to process")
                 return False
 
-
-            response = self.runalyze_service.upload_file_to_runalyze(original_file_path)
-
-            self.logger.info("Activity processing completed successfully")
-            self.logger.debug(f"Upload response: {response}")
-            return True
+            file_path_list.append(original_file_path)
+            return self._process_batch(file_path_list)
 
         except Exception:
             self.logger.exception("Activity processing failed")
             return False
 
         finally:
-           if original_file_path:
-               self.fit_file_service.cleanup_file(original_file_path)
-        #    if modified_file_path:
-        #        self.fit_file_service.cleanup_file(modified_file_path)
+            self._cleanup(file_path_list)
 
+    @tracing.traced("sync.last_x_activities")
     def process_last_x_activities(self, x:int) -> bool:
-        """Process the latest activity from Zwift to Garmin.
+        """Process the last x activities from Zwift.
+
+        Args:
+            x: Number of activities to process
 
         Returns:
             True if successful, False otherwise
@@ -76,22 +111,25 @@ class ActivityProcessor:
             self.zwift_service.authenticate()
 
             file_path_list = self.zwift_service.download_last_x_activities(x)
-
-            for file_path in file_path_list:
-                response = self.runalyze_service.upload_file_to_runalyze(file_path)
-                self.logger.info("Activity processing completed successfully")
-                self.logger.debug(f"Upload response: {response}")
-            return True
+            return self._process_batch(file_path_list)
 
         except Exception:
             self.logger.exception("Activity processing failed")
             return False
 
         finally:
-           for file_path in file_path_list:
-               self.fit_file_service.cleanup_file(file_path)
+            self._cleanup(file_path_list)
 
+    @tracing.traced("sync.activities_since_date")
     def process_activities_since_date(self, start_date:str) -> bool:
+        """Process all activities started after the given date.
+
+        Args:
+            start_date: Date in YYYY-MM-DD format
+
+        Returns:
+            True if successful, False otherwise
+        """
         file_path_list = []
 
         try:
@@ -100,23 +138,332 @@ class ActivityProcessor:
             self.zwift_service.authenticate()
 
             file_path_list = self.zwift_service.download_activities_since_date(start_date)
+            return self._process_batch(file_path_list)
+
+        except Exception:
+            self.logger.exception("Activity processing failed")
+            return False
+
+        finally:
+            self._cleanup(file_path_list)
+
+    @tracing.traced("sync.all_activities")
+    def process_all_activities(self) -> bool:
+        """Process every activity in the Zwift catalog (backfill).
+
+        Returns:
+            True if successful, False otherwise
+        """
+        file_path_list = []
+
+        try:
+            self.logger.info("Starting backfill of all activities...")
+            self.zwift_service.authenticate()
 
-            for file_path in file_path_list:
-                response = self.runalyze_service.upload_file_to_runalyze(file_path)
-                self.logger.info("Activity processing completed successfully")
-                self.logger.debug(f"Upload response: {response}")                
-            return True
+            file_path_list = self.zwift_service.download_all_activities()
+            return self._process_batch(file_path_list)
 
         except Exception:
             self.logger.exception("Activity processing failed")
             return False
 
         finally:
-           for file_path in file_path_list:
-               self.fit_file_service.cleanup_file(file_path)
+            self._cleanup(file_path_list)
+
+    @tracing.traced("sync.batch", lambda self, file_path_list: {"fit.files": len(file_path_list)})
+    def _process_batch(self, file_path_list: List[str]) -> bool:
+        """Transform (optionally) and upload a batch of downloaded files.
+
+        Transformation runs across a process pool before the uploads start,
+        so a backfill uses every core instead of one. Each resulting file is
+        then fanned out to all destinations.
+
+        Args:
+            file_path_list: Paths of the downloaded FIT files; modified copies
+                are appended so the caller cleans them up as well
+
+        Returns:
+            True if every file reached every destination, False otherwise
+        """
+        self.report = RunReport()
+        batch = self._merge_split_sessions(file_path_list) if self.merge_gap is not None else list(file_path_list)
+        for file_path in batch:
+            self._analyse_ride(file_path)
+        self._log_power_curve()
+        success = True
+        upload_paths = list(batch)
+        if self.modify_device and batch:
+            modified_paths = self.fit_file_service.modify_device_info_batch(
+                list(batch), max_workers=self.transform_workers)
+            upload_paths = [modified_paths[path] for path in batch if path in modified_paths]
+            success = len(upload_paths) == len(batch)
+            file_path_list.extend(upload_paths)
+
+        if self.dry_run:
+            for file_path in upload_paths:
+                self.logger.info("Dry run: skipping upload of %s", file_path)
+            return success
+
+        self._upload_to_destinations(upload_paths)
+        self.logger.info("Run report: %s", self.report.summary())
+        return success and self.report.success
+
+    def _merge_split_sessions(self, file_path_list: List[str]) -> List[str]:
+        """Merge the files of rides that Zwift split into several activities.
+
+        Files are grouped by the catalog start and end times of their
+        activities (see split_session_groups). A group that fails to merge
+        is uploaded piece by piece, as without merging.
+
+        Args:
+            file_path_list: Paths of the downloaded FIT files; merged files
+                are appended so the caller cleans them up as well
+
+        Returns:
+            The batch to upload: merged files in place of their pieces
+        """
+        records = {}
+        for file_path in file_path_list:
+            record = self.zwift_service.activity_for(file_path)
+            if record is not None:
+                records[record.id] = (record, file_path)
+        replacements: Dict[str, Optional[str]] = {}
+        for group in split_session_groups([record for record, _ in records.values()], self.merge_gap):
+            if len(group) < 2:
+                continue
+            paths = [records[record.id][1] for record in group]
+            try:
+                merged_path = self.fit_file_service.merge_activities(paths)
+            except (FileNotFoundError, RuntimeError):
+                self.logger.exception("Failed to merge the split ride %s", ', '.join(paths))
+                continue
+            self.logger.info("Merged %s pieces of one ride into %s", len(paths), merged_path)
+            replacements[paths[0]] = merged_path
+            replacements.update((path, None) for path in paths[1:])
+        batch = [replacements.get(path, path) for path in file_path_list]
+        file_path_list.extend(path for path in replacements.values() if path is not None)
+        return [path for path in batch if path is not None]
+
+    def _cleanup(self, file_paths: Iterable[str]) -> None:
+        """Remove files of a finished run or job and forget their activities."""
+        for file_path in file_paths:
+            self.fit_file_service.cleanup_file(file_path)
+            self.zwift_service.forget(file_path)
+
+    def _file_attributes(self, file_path: str) -> Dict:
+        """Span attributes of a downloaded file: its path and activity id."""
+        record = self.zwift_service.activity_for(file_path)
+        return {"fit.file": file_path, tracing.ACTIVITY_ID: record.id if record is not None else None}
+
+    @tracing.traced("ride.analyse", lambda self, file_path: self._file_attributes(file_path))
+    def _analyse_ride(self, file_path: str) -> Optional[Dict]:
+        """Compute ride metrics and update the power curve of a downloaded file.
+
+        Only runs with an FTP or a power curve index configured; the file is
+        parsed once for both. A file that cannot be analysed does not fail
+        the run.
+
+        Args:
+            file_path: Path of the downloaded FIT file
+
+        Returns:
+            The ride metrics as a dict (recorded in the run report), or None
+        """
+        if not self.ftp and self.power_curve is None:
+            return None
+        # numpy is only loaded by runs that analyse rides
+        from services.ride_metrics import compute_metrics, read_streams, resample_power
+
+        try:
+            streams = read_streams(file_path)
+            if self.power_curve is not None and len(streams["timestamp"]):
+                self.power_curve.add(int(streams["timestamp"][0]), resample_power(streams))
+            metrics = compute_metrics(streams, self.ftp, self.max_hr) if self.ftp else None
+        except Exception:
+            self.logger.exception("Analysing the ride %s failed", file_path)
+            return None
+        if metrics is None:
+            return None
+        self.logger.info("Ride metrics of %s: %s", os.path.basename(file_path), metrics.summary())
+        self.report.metrics[file_path] = metrics.to_dict()
+        return self.report.metrics[file_path]
+
+    def _log_power_curve(self) -> None:
+        """Log the all-time and recent power curves if an index is maintained."""
+        if self.power_curve is None or not len(self.power_curve):
+            return
+        self.logger.info("Power curve (all time): %s", self.power_curve.summary())
+        since = int(time.time()) - RECENT_CURVE_DAYS * 24 * 3600
+        self.logger.info("Power curve (last %s days): %s", RECENT_CURVE_DAYS, self.power_curve.summary(since))
+
+    def _upload_to_destinations(self, upload_paths: List[str],
+                                destinations: Optional[Sequence[Destination]] = None) -> List[Dict[str, UploadResult]]:
+        """Upload a batch to all destinations concurrently.
+
+        Every destination receives the whole batch, so destinations with a
+        bulk path (e.g. bounded concurrent Garmin uploads) can use it.
+        Results are recorded in the run report.
+
+        Args:
+            upload_paths: Paths of the FIT files to upload
+            destinations: Destinations to upload to (defaults to all)
+
+        Returns:
+            Per destination, in order, the results by file path
+        """
+        destinations = self.destinations if destinations is None else list(destinations)
+        submitted = time.monotonic()
+        def upload(destination: Destination) -> Dict[str, UploadResult]:
+            # Time between the fan-out and this upload starting in the pool
+            attributes = {"destination": destination.name, "fit.files": len(upload_paths),
+                          "queue.wait_ms": round((time.monotonic() - submitted) * 1000, 3)}
+            if len(upload_paths) == 1:
+                attributes["fit.file"] = upload_paths[0]
+            else:
+                attributes["activity.ids"] = tracing.activity_ids(upload_paths)
+            with tracing.span("upload", attributes) as span:
+                try:
+                    results = destination.upload_batch(upload_paths)
+                except Exception as e:
+                    self.logger.exception("Upload to %s failed", destination.name)
+                    span.record_exception(e)
+                    results = {}
+                    error = str(e)
+                else:
+                    error = "no result returned"
+            # Files the destination did not report on count as failed
+            for file_path in upload_paths:
+                if file_path not in results:
+                    results[file_path] = UploadResult(file_path, destination.name, UploadStatus.FAILED, error=error)
+            return results
+
+        if len(destinations) == 1:
+            batches = [upload(destinations[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(destinations) or 1) as executor:
+                batches = list(executor.map(tracing.propagate(upload), destinations))
+
+        for file_path in upload_paths:
+            for results in batches:
+                self.report.add(results[file_path])
+        return batches
+
+    def enqueue_activities(self, work_queue: WorkQueue, max_count: Optional[int] = None,
+                           since: Optional[str] = None) -> int:
+        """List Zwift activities into the durable work queue.
+
+        Activities that are already queued (in any state) are not added again.
+
+        Args:
+            work_queue: Queue to add the jobs to
+            max_count: Only list the newest max_count activities
+            since: Only list activities started after this YYYY-MM-DD date
+
+        Returns:
+            Number of new jobs
+        """
+        records = [as_record(activity) for activity in self.zwift_service.list_activities(max_count)]
+        if since:
+            cutoff = date_cutoff(since)
+            records = [record for record in records if record.start is not None and record.start > cutoff]
+        added = sum(work_queue.enqueue(record.id, {"activity": record.to_dict()}) for record in records)
+        self.logger.info("Queued %s of %s listed activities", added, len(records))
+        return added
+
+    def run_queue_worker(self, work_queue: WorkQueue, worker_id: Optional[str] = None,
+                         stop_when_idle: bool = True, idle_interval: float = 5.0) -> bool:
+        """Consume jobs from the durable work queue.
+
+        Each job advances through downloaded, transformed and uploaded, and
+        every step is recorded, so a restarted worker resumes where the last
+        one stopped. Several workers (processes) may share one queue.
+
+        Args:
+            work_queue: Queue to consume
+            worker_id: Lease owner id (defaults to host, pid and thread)
+            stop_when_idle: Return once no job is claimable instead of waiting
+            idle_interval: Seconds between claim attempts while idle
+
+        Returns:
+            True if every upload of this worker succeeded, False otherwise
+        """
+        worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self.report = RunReport()
+        failed_jobs = 0
+        while True:
+            job = work_queue.claim(worker_id)
+            if job is None:
+                if stop_when_idle:
+                    break
+                time.sleep(idle_interval)
+                continue
+            # The lease is renewed while the job is worked on, however long its stages take
+            with work_queue.keep_leased(job):
+                state = self._process_job(work_queue, job)
+            if state == FAILED:
+                failed_jobs += 1
+
+        self.logger.info("Queue worker %s done: %s, queue: %s", worker_id, self.report.summary(), work_queue.counts())
+        self._log_power_curve()
+        return failed_jobs == 0 and self.report.success
+
+    @tracing.traced("queue.job", lambda self, work_queue, job: {
+        tracing.ACTIVITY_ID: job.id, "job.state": job.state, "job.attempts": job.attempts,
+        "queue.wait_ms": round(job.waited * 1000, 3)})
+    def _process_job(self, work_queue: WorkQueue, job: Job) -> str:
+        """Advance a claimed job as far as possible.
+
+        Args:
+            work_queue: Queue the job was claimed from
+            job: Claimed job
+
+        Returns:
+            State of the job afterwards
+        """
+        payload = job.payload
+        try:
+            file_path = payload.get("file_path")
+            if job.state == LISTED or not (file_path and os.path.exists(file_path)):
+                self.zwift_service.authenticate()
+                payload["file_path"] = self.zwift_service.download_activity(payload["activity"])
+                payload.pop("upload_path", None)
+                metrics = self._analyse_ride(payload["file_path"])
+                if metrics:
+                    payload["metrics"] = metrics
+                if not work_queue.advance(job, DOWNLOADED):
+                    return job.state
+
+            upload_path = payload.get("upload_path")
+            if job.state == DOWNLOADED or not (upload_path and os.path.exists(upload_path)):
+                upload_path = payload["file_path"]
+                if self.modify_device:
+                    upload_path = self.fit_file_service.modify_device_info(upload_path)
+                payload["upload_path"] = upload_path
+                if not work_queue.advance(job, TRANSFORMED):
+                    return job.state
 
+            # Destinations that already have the file are not uploaded to again
+            uploaded_to = set(payload.get("uploaded_to", []))
+            destinations = [d for d in self.destinations if d.name not in uploaded_to]
+            failed = []
+            for results in self._upload_to_destinations([upload_path], destinations):
+                result = results[upload_path]
+                if result.ok:
+                    uploaded_to.add(result.destination)
+                else:
+                    failed.append(result)
+            payload["uploaded_to"] = sorted(uploaded_to)
+            if failed:
+                error = "; ".join(f"{result.destination}: {result.error}" for result in failed)
+                state = work_queue.fail(job, error, retryable=all(result.retryable for result in failed))
+            elif work_queue.advance(job, UPLOADED):
+                state = UPLOADED
+            else:
+                return job.state
+        except Exception as e:
+            self.logger.exception("Job %s failed in state %s", job.id, job.state)
+            state = work_queue.fail(job, str(e))
 
-    def _download_activity(self, file_path:str) -> None:
-            response = self.runalyze_service.upload_file_to_runalyze(file_path)
-            self.logger.info("Activity processing completed successfully")
-            self.logger.debug(f"Upload response: {response}")
+        if state in (UPLOADED, FAILED):
+            self._cleanup({payload.get("file_path"), payload.get("upload_path")} - {None})
+        return state
@@ -0,0 +1,159 @@
+"""Compact activity metadata parsed from the Zwift activity catalog."""
+
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_timestamp(value: str) -> int:
+    """Parse an ISO-8601 timestamp as used by the Zwift API into epoch seconds.
+
+    Handles "2025-10-14T18:00:00.000+0000" and the variants with a "Z" or
+    "+00:00" offset, without a fraction or without an offset (read as UTC).
+    Fractions of a second are dropped. Much faster than datetime.strptime,
+    which matters when filtering catalogs of thousands of activities.
+
+    Args:
+        value: Timestamp string
+
+    Returns:
+        Seconds since the epoch
+
+    Raises:
+        ValueError: If the string is not an ISO-8601 timestamp
+    """
+    try:
+        if value[4] != "-" or value[7] != "-" or value[10] not in "Tt " or value[13] != ":" or value[16] != ":":
+            raise ValueError
+        days = date(int(value[0:4]), int(value[5:7]), int(value[8:10])).toordinal() - _EPOCH_ORDINAL
+        seconds = int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+        end = 19
+        if value[end:end + 1] == ".":
+            end += 1
+            while end < len(value) and value[end].isdigit():
+                end += 1
+        zone = value[end:]
+        if zone and zone not in ("Z", "z"):
+            digits = zone[1:].replace(":", "")
+            if zone[0] not in "+-" or len(digits) != 4 or not digits.isdigit():
+                raise ValueError
+            offset = int(digits[:2]) * 3600 + int(digits[2:]) * 60
+            seconds -= offset if zone[0] == "+" else -offset
+    except (ValueError, IndexError, TypeError):
+        raise ValueError(f"Invalid ISO-8601 timestamp: {value!r}") from None
+    return days * 86400 + seconds
+
+
+def format_timestamp(epoch: int) -> str:
+    """Format epoch seconds the way the Zwift API does (UTC)."""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000+0000")
+
+
+class ActivityRecord:
+    """The catalog fields the pipeline needs, without the rest of the API response.
+
+    A Zwift catalog entry carries dozens of fields (snapshots, images,
+    social counters); a record keeps eight in slots, with the dates as
+    epoch seconds so filtering is an integer comparison.
+    """
+
+    __slots__ = ("id", "start", "end", "fit_file_bucket", "fit_file_key", "sport", "duration_ms", "distance")
+
+    def __init__(self, id: Any, start: Optional[int] = None, end: Optional[int] = None,
+                 fit_file_bucket: Optional[str] = None, fit_file_key: Optional[str] = None,
+                 sport: Optional[str] = None, duration_ms: Optional[int] = None,
+                 distance: Optional[float] = None):
+        """Initialize ActivityRecord.
+
+        Args:
+            id: Zwift activity id
+            start: Start time as epoch seconds
+            end: End time as epoch seconds
+            fit_file_bucket: S3 bucket of the FIT file
+            fit_file_key: S3 key of the FIT file
+            sport: Sport, e.g. "CYCLING"
+            duration_ms: Moving time in milliseconds
+            distance: Distance in meters
+        """
+        self.id = id
+        self.start = start
+        self.end = end
+        self.fit_file_bucket = fit_file_bucket
+        self.fit_file_key = fit_file_key
+        self.sport = sport
+        self.duration_ms = duration_ms
+        self.distance = distance
+
+    @classmethod
+    def from_dict(cls, activity: Dict[str, Any]) -> "ActivityRecord":
+        """Build a record from a Zwift catalog entry (or from to_dict output)."""
+        start, end = activity.get("startDate"), activity.get("endDate")
+        return cls(activity["id"],
+                   parse_timestamp(start) if start else None,
+                   parse_timestamp(end) if end else None,
+                   activity.get("fitFileBucket"),
+                   activity.get("fitFileKey"),
+                   activity.get("sport"),
+                   activity.get("movingTimeInMs"),
+                   activity.get("distanceInMeters"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Catalog entry with the Zwift API keys, e.g. for JSON job payloads."""
+        values = {
+            "id": self.id,
+            "startDate": format_timestamp(self.start) if self.start is not None else None,
+            "endDate": format_timestamp(self.end) if self.end is not None else None,
+            "fitFileBucket": self.fit_file_bucket,
+            "fitFileKey": self.fit_file_key,
+            "sport": self.sport,
+            "movingTimeInMs": self.duration_ms,
+            "distanceInMeters": self.distance,
+        }
+        return {key: value for key, value in values.items() if value is not None}
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, ActivityRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"ActivityRecord(id={self.id!r}, start={self.start!r}, sport={self.sport!r})"
+
+
+def as_record(activity: Union[ActivityRecord, Dict[str, Any]]) -> ActivityRecord:
+    """Return a record for either a record or a raw Zwift catalog entry."""
+    return activity if isinstance(activity, ActivityRecord) else ActivityRecord.from_dict(activity)
+
+
+def split_session_groups(records: Iterable[ActivityRecord], max_gap: int) -> List[List[ActivityRecord]]:
+    """Group activities that are pieces of one ride.
+
+    A Zwift crash or an event reconnect ends the activity and starts a new
+    one, so a ride shows up as consecutive catalog entries. An activity of
+    the same sport starting at most max_gap seconds after the previous one
+    ended continues its group.
+
+    Args:
+        records: Catalog activities in any order
+        max_gap: Longest pause in seconds between two pieces of a ride
+
+    Returns:
+        The groups, oldest first, each in chronological order; activities
+        without start or end time form groups of their own
+    """
+    groups: List[List[ActivityRecord]] = []
+    timed = []
+    for record in records:
+        if record.start is None or record.end is None:
+            groups.append([record])
+        else:
+            timed.append(record)
+    last: Optional[ActivityRecord] = None
+    for record in sorted(timed, key=lambda record: record.start):
+        if last is not None and record.sport == last.sport and 0 <= record.start - last.end <= max_gap:
+            groups[-1].append(record)
+        else:
+            groups.append([record])
+        last = record
+    return groups
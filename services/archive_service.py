@@ -0,0 +1,44 @@
+"""Archive service for keeping a local copy of every processed activity."""
+
+import os
+import shutil
+import logging
+from services.destination import Destination
+from services.upload_result import UploadResult, UploadStatus
+
+
+class ArchiveService(Destination):
+    """Destination that copies FIT files into a local directory."""
+
+    name = "archive"
+
+    def __init__(self, archive_dir: str):
+        """Initialize ArchiveService with the target directory.
+
+        Args:
+            archive_dir: Directory the FIT files are copied to
+        """
+        self.archive_dir = archive_dir
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+    def upload(self, fit_file_path: str) -> UploadResult:
+        """Copy a FIT file into the archive directory.
+
+        Args:
+            fit_file_path: Path to the FIT file to archive
+
+        Returns:
+            Outcome of the copy; the response holds the archived path
+
+        Raises:
+            FileNotFoundError: If the input file doesn't exist
+        """
+        if not os.path.exists(fit_file_path):
+            raise FileNotFoundError(f"FIT file not found: {fit_file_path}")
+
+        archive_path = os.path.join(self.archive_dir, os.path.basename(fit_file_path))
+        shutil.copyfile(fit_file_path, archive_path)
+        self.logger.info("Archived %s to %s", fit_file_path, archive_path)
+        return UploadResult(fit_file_path, self.name, UploadStatus.SUCCESS,
+                            bytes_sent=os.path.getsize(archive_path), response=archive_path)
@@ -0,0 +1,52 @@
+"""Destination interface for uploading processed activities."""
+
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List
+from services.upload_result import UploadResult, UploadStatus
+
+
+class Destination(ABC):
+    """A target that processed FIT files are uploaded to.
+
+    ActivityProcessor downloads and transforms each activity once and hands
+    the resulting file to every configured destination.
+    """
+
+    #: Short name used in logs and per-destination results
+    name: str = "destination"
+
+    @abstractmethod
+    def upload(self, fit_file_path: str) -> UploadResult:
+        """Upload a FIT file to this destination.
+
+        Args:
+            fit_file_path: Path to the FIT file to upload
+
+        Returns:
+            Outcome of the upload
+
+        Raises:
+            FileNotFoundError: If the input file doesn't exist
+        """
+
+    def upload_batch(self, fit_file_paths: List[str]) -> Dict[str, UploadResult]:
+        """Upload several FIT files to this destination.
+
+        Uploads one file after the other; destinations with a cheaper bulk
+        path (concurrent uploads, archives) override this.
+
+        Args:
+            fit_file_paths: Paths to the FIT files to upload
+
+        Returns:
+            Mapping of file path to upload result, one entry per file
+        """
+        results: Dict[str, UploadResult] = {}
+        for fit_file_path in fit_file_paths:
+            try:
+                results[fit_file_path] = self.upload(fit_file_path)
+            except Exception as e:
+                logging.getLogger(__name__).exception("Upload of %s to %s failed", fit_file_path, self.name)
+                results[fit_file_path] = UploadResult(fit_file_path, self.name, UploadStatus.FAILED, error=str(e))
+        return results
@@ -0,0 +1,199 @@
+"""Bounded, content-addressed local cache of downloaded FIT files."""
+
+import os
+import gzip
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    stored_size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_lru ON objects (last_access);
+CREATE TABLE IF NOT EXISTS keys (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+"""
+
+
+def _codec():
+    """Best available compression: zstd if installed, gzip otherwise.
+
+    Returns:
+        File suffix, compress and decompress functions
+    """
+    try:
+        import zstandard
+    except ImportError:
+        return ".gz", lambda data: gzip.compress(data, compresslevel=6), gzip.decompress
+    return ".zst", zstandard.ZstdCompressor(level=10).compress, zstandard.ZstdDecompressor().decompress
+
+
+def _decompressor(file_name: str) -> Callable[[bytes], bytes]:
+    """Decompress function matching a stored object's suffix."""
+    if file_name.endswith(".zst"):
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress
+    if file_name.endswith(".gz"):
+        return gzip.decompress
+    return lambda data: data
+
+
+class FitCache:
+    """Local FIT file cache with a size budget and LRU eviction.
+
+    Files are stored once per content hash (sha256) under objects/, and
+    keys such as "zwift:<activity id>" point at them. When the stored size
+    exceeds the budget, the least recently used objects are evicted.
+    """
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_BYTES, compress: bool = True,
+                 clock: Callable[[], float] = time.time):
+        """Initialize FitCache and create its directory.
+
+        Args:
+            root: Cache directory
+            max_bytes: Budget of the stored (compressed) bytes
+            compress: Compress stored files (zstd if installed, else gzip)
+            clock: Wall clock used for the LRU order
+        """
+        self.root = os.path.expanduser(root)
+        self.max_bytes = max_bytes
+        self._clock = clock
+        if compress:
+            self._suffix, self._compress, _ = _codec()
+        else:
+            self._suffix, self._compress = "", None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """SQLite connection of the calling thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(os.path.join(self.root, "index.sqlite"), timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _object_path(self, file_name: str) -> str:
+        return os.path.join(self.root, "objects", file_name[:2], file_name)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Read a cached file and mark it as recently used.
+
+        Args:
+            key: Cache key, e.g. "zwift:<activity id>"
+
+        Returns:
+            The file content, or None on a cache miss
+        """
+        connection = self._connection()
+        row = connection.execute("SELECT o.digest, o.file_name FROM keys k JOIN objects o ON o.digest = k.digest "
+                                 "WHERE k.key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        digest, file_name = row
+        try:
+            with open(self._object_path(file_name), "rb") as f:
+                data = _decompressor(file_name)(f.read())
+        except (OSError, ValueError) as e:
+            self.logger.warning("Dropping unreadable cache entry %s: %s", key, e)
+            self._remove_object(digest, file_name)
+            return None
+        connection.execute("UPDATE objects SET last_access = ? WHERE digest = ?", (self._clock(), digest))
+        return data
+
+    def get_file(self, key: str, file_path: str) -> bool:
+        """Write a cached file to file_path.
+
+        Args:
+            key: Cache key
+            file_path: Destination path
+
+        Returns:
+            True on a cache hit, False on a miss
+        """
+        data = self.get(key)
+        if data is None:
+            return False
+        with open(file_path, "wb") as f:
+            f.write(data)
+        return True
+
+    def put(self, key: str, data: bytes) -> str:
+        """Store a file under a key, evicting old files beyond the budget.
+
+        Args:
+            key: Cache key
+            data: File content
+
+        Returns:
+            The content digest
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        file_name = digest + ".fit" + self._suffix
+        connection = self._connection()
+        now = self._clock()
+        with self._lock:
+            known = connection.execute("SELECT 1 FROM objects WHERE digest = ?", (digest,)).fetchone()
+            if known is None:
+                stored = self._compress(data) if self._compress else data
+                path = self._object_path(file_name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(stored)
+                os.replace(temp_path, path)
+                connection.execute("INSERT OR REPLACE INTO objects (digest, file_name, stored_size, last_access) "
+                                   "VALUES (?, ?, ?, ?)", (digest, file_name, len(stored), now))
+            else:
+                connection.execute("UPDATE objects SET last_access = ? WHERE digest = ?", (now, digest))
+            connection.execute("INSERT OR REPLACE INTO keys (key, digest) VALUES (?, ?)", (key, digest))
+            self._evict()
+        return digest
+
+    def _evict(self) -> None:
+        """Remove least recently used objects until the budget is met."""
+        connection = self._connection()
+        total = connection.execute("SELECT COALESCE(SUM(stored_size), 0) FROM objects").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for digest, file_name, size in connection.execute(
+                "SELECT digest, file_name, stored_size FROM objects ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._remove_object(digest, file_name)
+            total -= size
+            self.logger.debug("Evicted %s from the FIT cache", file_name)
+
+    def _remove_object(self, digest: str, file_name: str) -> None:
+        """Delete an object and the keys pointing at it."""
+        connection = self._connection()
+        connection.execute("DELETE FROM keys WHERE digest = ?", (digest,))
+        connection.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+        try:
+            os.remove(self._object_path(file_name))
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        """Number of keys and objects and the stored bytes."""
+        connection = self._connection()
+        objects, stored = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(stored_size), 0) FROM objects").fetchone()
+        keys = connection.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+        return {"keys": keys, "objects": objects, "stored_bytes": stored}
@@ -0,0 +1,675 @@
+"""Struct-based FIT encoder and stream rewriter.
+
+Each message definition is compiled into a struct.Struct once; rows are
+packed into a single growing buffer, in bulk from numpy columns where
+possible. The rewriter copies unchanged stretches of a file as whole slices
+and only unpacks and repacks the messages it transforms.
+"""
+
+import sys
+import struct
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+# Seconds between the Unix epoch and the FIT epoch (1989-12-31T00:00:00Z)
+FIT_EPOCH_OFFSET = 631065600
+HEADER_SIZE = 14
+PROTOCOL_VERSION = 0x20
+PROFILE_VERSION = 2132
+
+# Base types: struct format, size and invalid value
+ENUM, SINT8, UINT8, SINT16, UINT16, SINT32, UINT32 = 0x00, 0x01, 0x02, 0x83, 0x84, 0x85, 0x86
+STRING, FLOAT32, FLOAT64, UINT8Z, UINT16Z, UINT32Z, BYTE = 0x07, 0x88, 0x89, 0x0A, 0x8B, 0x8C, 0x0D
+SINT64, UINT64, UINT64Z = 0x8E, 0x8F, 0x90
+BASE_TYPES: Dict[int, Tuple[str, int, Any]] = {
+    ENUM: ("B", 1, 0xFF), SINT8: ("b", 1, 0x7F), UINT8: ("B", 1, 0xFF),
+    SINT16: ("h", 2, 0x7FFF), UINT16: ("H", 2, 0xFFFF), SINT32: ("i", 4, 0x7FFFFFFF),
+    UINT32: ("I", 4, 0xFFFFFFFF), STRING: ("s", 1, b""), FLOAT32: ("f", 4, float("nan")),
+    FLOAT64: ("d", 8, float("nan")), UINT8Z: ("B", 1, 0), UINT16Z: ("H", 2, 0), UINT32Z: ("I", 4, 0),
+    BYTE: ("B", 1, 0xFF), SINT64: ("q", 8, 0x7FFFFFFFFFFFFFFF), UINT64: ("Q", 8, 0xFFFFFFFFFFFFFFFF),
+    UINT64Z: ("Q", 8, 0),
+}
+_NUMPY_TYPES = {"B": "u1", "b": "i1", "H": "u2", "h": "i2", "I": "u4", "i": "i4",
+                "f": "f4", "d": "f8", "q": "i8", "Q": "u8"}
+
+# Global message numbers
+FILE_ID, SESSION, LAP, RECORD, EVENT, DEVICE_INFO, ACTIVITY = 0, 18, 19, 20, 21, 23, 34
+
+# Fields of the messages this project writes: name -> (number, base type, scale, offset)
+PROFILE: Dict[int, Dict[str, Tuple[int, int, float, float]]] = {
+    FILE_ID: {"type": (0, ENUM, 1, 0), "manufacturer": (1, UINT16, 1, 0), "product": (2, UINT16, 1, 0),
+              "serial_number": (3, UINT32Z, 1, 0), "time_created": (4, UINT32, 1, 0)},
+    DEVICE_INFO: {"timestamp": (253, UINT32, 1, 0), "device_index": (0, UINT8, 1, 0),
+                  "manufacturer": (2, UINT16, 1, 0), "serial_number": (3, UINT32Z, 1, 0),
+                  "product": (4, UINT16, 1, 0), "software_version": (5, UINT16, 100, 0)},
+    RECORD: {"timestamp": (253, UINT32, 1, 0), "altitude": (2, UINT16, 5, 500), "heart_rate": (3, UINT8, 1, 0),
+             "cadence": (4, UINT8, 1, 0), "distance": (5, UINT32, 100, 0), "speed": (6, UINT16, 1000, 0),
+             "power": (7, UINT16, 1, 0)},
+    EVENT: {"timestamp": (253, UINT32, 1, 0), "event": (0, ENUM, 1, 0), "event_type": (1, ENUM, 1, 0),
+            "data": (3, UINT32, 1, 0)},
+    LAP: {"timestamp": (253, UINT32, 1, 0), "message_index": (254, UINT16, 1, 0), "event": (0, ENUM, 1, 0),
+          "event_type": (1, ENUM, 1, 0), "start_time": (2, UINT32, 1, 0),
+          "total_elapsed_time": (7, UINT32, 1000, 0), "total_timer_time": (8, UINT32, 1000, 0),
+          "total_distance": (9, UINT32, 100, 0), "avg_heart_rate": (15, UINT8, 1, 0),
+          "max_heart_rate": (16, UINT8, 1, 0), "avg_power": (19, UINT16, 1, 0), "max_power": (20, UINT16, 1, 0)},
+    SESSION: {"timestamp": (253, UINT32, 1, 0), "message_index": (254, UINT16, 1, 0), "event": (0, ENUM, 1, 0),
+              "event_type": (1, ENUM, 1, 0), "start_time": (2, UINT32, 1, 0), "sport": (5, ENUM, 1, 0),
+              "sub_sport": (6, ENUM, 1, 0), "total_elapsed_time": (7, UINT32, 1000, 0),
+              "total_timer_time": (8, UINT32, 1000, 0), "total_distance": (9, UINT32, 100, 0),
+              "avg_heart_rate": (16, UINT8, 1, 0), "max_heart_rate": (17, UINT8, 1, 0),
+              "avg_power": (20, UINT16, 1, 0), "max_power": (21, UINT16, 1, 0),
+              "first_lap_index": (25, UINT16, 1, 0), "num_laps": (26, UINT16, 1, 0)},
+    ACTIVITY: {"timestamp": (253, UINT32, 1, 0), "total_timer_time": (0, UINT32, 1000, 0),
+               "num_sessions": (1, UINT16, 1, 0), "type": (2, ENUM, 1, 0), "event": (3, ENUM, 1, 0),
+               "event_type": (4, ENUM, 1, 0)},
+}
+
+
+def fit_timestamp(epoch: float) -> int:
+    """Unix epoch seconds as a FIT date_time."""
+    return int(epoch) - FIT_EPOCH_OFFSET
+
+
+_CRC_TABLE = (0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+              0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400)
+_crc_words: Optional[array] = None
+
+
+def _crc_word_table() -> array:
+    """CRC of every 16-bit value, so the checksum advances two bytes per lookup."""
+    global _crc_words
+    if _crc_words is None:
+        byte_table = []
+        for byte in range(256):
+            crc = 0
+            for nibble in (byte & 0xF, byte >> 4):
+                crc = (crc >> 4) ^ _CRC_TABLE[crc & 0xF] ^ _CRC_TABLE[nibble]
+            byte_table.append(crc)
+        words = array("H", bytes(2 * 65536))
+        for value in range(65536):
+            crc = (value >> 8) ^ byte_table[value & 0xFF]
+            words[value] = (crc >> 8) ^ byte_table[crc & 0xFF]
+        _crc_words = words
+    return _crc_words
+
+
+def crc16(data, crc: int = 0) -> int:
+    """FIT CRC-16 of a bytes-like object.
+
+    Args:
+        data: Bytes to checksum
+        crc: CRC of the preceding bytes
+
+    Returns:
+        The updated CRC
+    """
+    table = _crc_word_table()
+    with memoryview(data) as view:
+        even = len(view) & ~1
+        words = array("H")
+        words.frombytes(view[:even])
+        if sys.byteorder == "big":
+            words.byteswap()
+        for word in words:
+            crc = table[crc ^ word]
+        if even != len(view):
+            crc = _crc_byte(crc, view[-1])
+    return crc
+
+
+def _crc_byte(crc: int, byte: int) -> int:
+    for nibble in (byte & 0xF, byte >> 4):
+        crc = (crc >> 4) ^ _CRC_TABLE[crc & 0xF] ^ _CRC_TABLE[nibble]
+    return crc
+
+
+class FieldDefinition(NamedTuple):
+    """One field of a message definition.
+
+    Attributes:
+        number: Field definition number
+        name: Field name (field_<number> for fields not in PROFILE)
+        size: Size in bytes
+        base_type: FIT base type
+        scale: Raw value = (value + offset) * scale
+        offset: See scale
+    """
+
+    number: int
+    name: str
+    size: int
+    base_type: int
+    scale: float = 1
+    offset: float = 0
+
+    @property
+    def format(self) -> str:
+        """struct format of the field; arrays and strings stay raw bytes."""
+        fmt, size, _ = BASE_TYPES.get(self.base_type, ("B", 1, 0xFF))
+        return fmt if size == self.size and fmt != "s" else f"{self.size}s"
+
+    @property
+    def invalid(self) -> Any:
+        """Raw value encoding "no value"."""
+        if self.format.endswith("s"):
+            return b"\xff" * self.size if self.base_type != STRING else b"\x00" * self.size
+        return BASE_TYPES[self.base_type][2]
+
+
+class MessageDefinition:
+    """A message layout compiled into a struct.Struct."""
+
+    def __init__(self, global_number: int, fields: Sequence[FieldDefinition], big_endian: bool = False,
+                 developer_fields: bytes = b""):
+        """Initialize MessageDefinition.
+
+        Args:
+            global_number: Global message number
+            fields: Field layout in file order
+            big_endian: Byte order of the field values
+            developer_fields: Raw developer field definitions (3 bytes each)
+        """
+        self.global_number = global_number
+        self.fields = list(fields)
+        self.big_endian = big_endian
+        self.developer_fields = developer_fields
+        self.names = [field.name for field in self.fields]
+        self.struct = struct.Struct((">" if big_endian else "<") + "".join(f.format for f in self.fields))
+        self.developer_size = sum(developer_fields[i + 1] for i in range(0, len(developer_fields), 3))
+        # Bytes of a data message after its header
+        self.size = self.struct.size + self.developer_size
+
+    @classmethod
+    def from_profile(cls, global_number: int, names: Sequence[str]) -> "MessageDefinition":
+        """Definition of the named PROFILE fields of a message."""
+        profile = PROFILE[global_number]
+        fields = []
+        for name in names:
+            number, base_type, scale, offset = profile[name]
+            fields.append(FieldDefinition(number, name, BASE_TYPES[base_type][1], base_type, scale, offset))
+        return cls(global_number, fields)
+
+    @classmethod
+    def from_bytes(cls, record: bytes, has_developer_fields: bool) -> "MessageDefinition":
+        """Parse a definition message (without its header byte)."""
+        big_endian = record[1] == 1
+        global_number = struct.unpack(">H" if big_endian else "<H", record[2:4])[0]
+        profile = {number: (name, scale, offset)
+                   for name, (number, _, scale, offset) in PROFILE.get(global_number, {}).items()}
+        fields = []
+        for i in range(record[4]):
+            number, size, base_type = record[5 + 3 * i:8 + 3 * i]
+            name, scale, offset = profile.get(number, (f"field_{number}", 1, 0))
+            fields.append(FieldDefinition(number, name, size, base_type, scale, offset))
+        developer_fields = b""
+        if has_developer_fields:
+            start = 5 + 3 * record[4]
+            developer_fields = bytes(record[start + 1:start + 1 + 3 * record[start]])
+        return cls(global_number, fields, big_endian, developer_fields)
+
+    def with_fields(self, names: Sequence[str]) -> "MessageDefinition":
+        """Copy of the definition with the named PROFILE fields appended if missing."""
+        profile = PROFILE[self.global_number]
+        fields = list(self.fields)
+        for name in names:
+            if name not in self.names:
+                number, base_type, scale, offset = profile[name]
+                fields.append(FieldDefinition(number, name, BASE_TYPES[base_type][1], base_type, scale, offset))
+        return MessageDefinition(self.global_number, fields, self.big_endian, self.developer_fields)
+
+    def to_bytes(self, local_type: int) -> bytes:
+        """Definition message for a local message type."""
+        header = 0x40 | local_type | (0x20 if self.developer_fields else 0)
+        body = struct.pack(">BBBHB" if self.big_endian else "<BBBHB", header, 0, int(self.big_endian),
+                           self.global_number, len(self.fields))
+        body += b"".join(bytes((field.number, field.size, field.base_type)) for field in self.fields)
+        if self.developer_fields:
+            body += bytes((len(self.developer_fields) // 3,)) + self.developer_fields
+        return body
+
+    def raw(self, values: Mapping[str, Any]) -> List[Any]:
+        """Raw field values from values in physical units (missing ones invalid)."""
+        raw = []
+        for field in self.fields:
+            value = values.get(field.name)
+            if value is None:
+                raw.append(field.invalid)
+            elif field.scale != 1 or field.offset:
+                raw.append(int(round((value + field.offset) * field.scale)))
+            elif isinstance(value, float) and not field.format.endswith("s") and field.format not in "fd":
+                raw.append(int(round(value)))
+            else:
+                raw.append(value)
+        return raw
+
+    def decode(self, body: bytes) -> Dict[str, Any]:
+        """Raw field values of a data message body, by field name."""
+        return dict(zip(self.names, self.struct.unpack_from(body)))
+
+    def values(self, body: bytes) -> Dict[str, Any]:
+        """Field values of a data message body in physical units, None for invalid values."""
+        values = {}
+        for field, raw in zip(self.fields, self.struct.unpack_from(body)):
+            if raw == field.invalid or raw != raw:
+                values[field.name] = None
+            elif field.scale != 1 or field.offset:
+                values[field.name] = raw / field.scale - field.offset
+            else:
+                values[field.name] = raw
+        return values
+
+    def pack_raw(self, values: Mapping[str, Any]) -> bytes:
+        """Pack raw field values (missing ones invalid)."""
+        return self.struct.pack(*[values.get(field.name, field.invalid) for field in self.fields])
+
+    def numpy_dtype(self):
+        """numpy dtype of a data message including its header byte and developer fields."""
+        import numpy as np
+
+        order = ">" if self.big_endian else "<"
+        fields = [("_header", "u1")]
+        for field in self.fields:
+            fmt = field.format
+            fields.append((field.name, f"V{field.size}" if fmt.endswith("s") else order + _NUMPY_TYPES[fmt]))
+        if self.developer_size:
+            fields.append(("_developer", f"V{self.developer_size}"))
+        return np.dtype(fields)
+
+
+class FitEncoder:
+    """Writes a FIT file into one preallocated, growing buffer."""
+
+    def __init__(self, capacity: int = 64 * 1024, protocol_version: int = PROTOCOL_VERSION,
+                 profile_version: int = PROFILE_VERSION):
+        """Initialize FitEncoder.
+
+        Args:
+            capacity: Initial buffer size in bytes
+            protocol_version: Protocol version written to the header
+            profile_version: Profile version written to the header
+        """
+        self.protocol_version = protocol_version
+        self.profile_version = profile_version
+        self._buffer = bytearray(max(capacity, HEADER_SIZE + 2))
+        self._size = HEADER_SIZE
+        self._definitions: Dict[int, MessageDefinition] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, size: int) -> int:
+        """Make room for size more bytes and return their offset."""
+        needed = self._size + size
+        if needed > len(self._buffer):
+            self._buffer.extend(bytes(max(needed, 2 * len(self._buffer)) - len(self._buffer)))
+        offset = self._size
+        self._size = needed
+        return offset
+
+    def write_bytes(self, data) -> None:
+        """Append already encoded messages."""
+        offset = self._reserve(len(data))
+        self._buffer[offset:offset + len(data)] = data
+
+    def define(self, local_type: int, definition: MessageDefinition) -> None:
+        """Write a definition message and use it for a local message type.
+
+        Args:
+            local_type: Local message type (0-15)
+            definition: Message layout
+        """
+        self._definitions[local_type] = definition
+        self.write_bytes(definition.to_bytes(local_type))
+
+    def write(self, local_type: int, values: Mapping[str, Any]) -> None:
+        """Write one data message.
+
+        Args:
+            local_type: Local message type defined before
+            values: Field values in physical units (e.g. meters, m/s)
+        """
+        definition = self._definitions[local_type]
+        offset = self._reserve(1 + definition.struct.size)
+        self._buffer[offset] = local_type
+        definition.struct.pack_into(self._buffer, offset + 1, *definition.raw(values))
+
+    def write_rows(self, local_type: int, columns: Mapping[str, Any]) -> int:
+        """Write many data messages from columns, packed in bulk with numpy.
+
+        The rows are laid out as a structured array directly in the output
+        buffer, so each column is converted and copied in one operation.
+        NaN and missing columns are written as invalid values.
+
+        Args:
+            local_type: Local message type defined before
+            columns: Equally long sequences or arrays per field, in physical units
+
+        Returns:
+            Number of messages written
+        """
+        import numpy as np
+
+        definition = self._definitions[local_type]
+        count = len(next(iter(columns.values()))) if columns else 0
+        dtype = definition.numpy_dtype()
+        offset = self._reserve(count * dtype.itemsize)
+        rows = np.ndarray(count, dtype=dtype, buffer=self._buffer, offset=offset)
+        rows["_header"] = local_type
+        target = None
+        for field in definition.fields:
+            if field.format.endswith("s"):
+                rows[field.name] = np.frombuffer(field.invalid * count, dtype=f"V{field.size}")
+                continue
+            target = rows[field.name]
+            if field.name not in columns:
+                target[...] = field.invalid
+                continue
+            values = np.asarray(columns[field.name], dtype=np.float64)
+            if field.scale != 1 or field.offset:
+                values = (values + field.offset) * field.scale
+            if target.dtype.kind == "f":
+                target[...] = values
+            else:
+                missing = np.isnan(values)
+                target[...] = np.where(missing, field.invalid, np.rint(np.nan_to_num(values)))
+        # Release the views so the buffer can grow again
+        rows = target = None
+        return count
+
+    def getvalue(self) -> bytes:
+        """The complete file: header, messages and CRC."""
+        data_size = self._size - HEADER_SIZE
+        header = struct.pack("<BBHI4s", HEADER_SIZE, self.protocol_version, self.profile_version, data_size, b".FIT")
+        self._buffer[:12] = header
+        self._buffer[12:14] = struct.pack("<H", crc16(header))
+        body = memoryview(self._buffer)[:self._size]
+        try:
+            return bytes(body) + struct.pack("<H", crc16(body))
+        finally:
+            body.release()
+
+    def to_file(self, file_path: str) -> None:
+        """Write the complete file."""
+        with open(file_path, "wb") as f:
+            f.write(self.getvalue())
+
+
+class FitMessage(NamedTuple):
+    """Position of one message in a FIT file.
+
+    Attributes:
+        offset: Offset of the message header byte
+        size: Size including the header byte
+        local_type: Local message type
+        definition: Definition of the message (for a definition message, the
+            one it declares)
+        is_definition: Whether this is a definition message
+    """
+
+    offset: int
+    size: int
+    local_type: int
+    definition: MessageDefinition
+    is_definition: bool
+
+    def body(self, data: bytes) -> bytes:
+        """Field bytes of a data message (without header and developer fields)."""
+        start = self.offset + 1
+        return data[start:start + self.definition.struct.size]
+
+
+def read_header(data: bytes) -> Tuple[int, int, int, int]:
+    """Parse the file header.
+
+    Args:
+        data: FIT file content
+
+    Returns:
+        Header size, protocol version, profile version and end of the messages
+
+    Raises:
+        ValueError: If the data is not a valid FIT file
+    """
+    if len(data) < 12 or data[8:12] != b".FIT":
+        raise ValueError("Invalid FIT file: missing .FIT signature")
+    header_size = data[0]
+    protocol_version, profile_version, data_size = struct.unpack_from("<BHI", data, 1)
+    end = header_size + data_size
+    if end > len(data):
+        raise ValueError("Invalid FIT file: truncated")
+    return header_size, protocol_version, profile_version, end
+
+
+def iter_messages(data: bytes) -> Iterator[FitMessage]:
+    """Walk the messages of a FIT file without decoding data messages.
+
+    Args:
+        data: FIT file content
+
+    Yields:
+        The definition and data messages in file order
+
+    Raises:
+        ValueError: If the data is not a valid FIT file
+    """
+    header_size, _, _, end = read_header(data)
+    definitions: Dict[int, MessageDefinition] = {}
+    pos = header_size
+    try:
+        while pos < end:
+            header = data[pos]
+            if not header & 0x80 and header & 0x40:
+                local_type = header & 0x0F
+                size = 6 + 3 * data[pos + 5]
+                if header & 0x20:
+                    size += 1 + 3 * data[pos + size]
+                definition = MessageDefinition.from_bytes(data[pos + 1:pos + size], bool(header & 0x20))
+                definitions[local_type] = definition
+                yield FitMessage(pos, size, local_type, definition, True)
+            else:
+                # Compressed timestamp headers carry the local type in bits 5-6
+                local_type = (header >> 5) & 0x03 if header & 0x80 else header & 0x0F
+                definition = definitions[local_type]
+                size = 1 + definition.size
+                yield FitMessage(pos, size, local_type, definition, False)
+            pos += size
+    except (KeyError, IndexError, struct.error) as e:
+        raise ValueError(f"Invalid FIT file: malformed message at byte {pos}: {e!r}") from None
+    if pos != end:
+        raise ValueError("Invalid FIT file: message crosses the end of the data")
+
+
+class _Copier:
+    """Copies stretches of a source file into an encoder in as few slices as possible."""
+
+    def __init__(self, encoder: FitEncoder, data: bytes):
+        self.encoder = encoder
+        self.data = data
+        self.start = self.end = 0
+
+    def copy(self, message: FitMessage) -> None:
+        if message.offset != self.end:
+            self.flush()
+            self.start = message.offset
+        self.end = message.offset + message.size
+
+    def flush(self) -> None:
+        if self.end > self.start:
+            self.encoder.write_bytes(self.data[self.start:self.end])
+        self.start = self.end
+
+
+def rewrite(data: bytes, transforms: Mapping[int, Callable[[Dict[str, Any]], Dict[str, Any]]],
+            add_fields: Optional[Mapping[int, Sequence[str]]] = None) -> bytes:
+    """Rewrite selected messages of a FIT file, copying everything else as is.
+
+    Definitions of transformed messages are recompiled (with add_fields
+    appended if missing); their data messages are unpacked into raw values,
+    passed to the transform and repacked. All other bytes are copied in
+    contiguous slices.
+
+    Args:
+        data: FIT file content
+        transforms: Per global message number, a function receiving and
+            returning the raw field values of a message
+        add_fields: Per global message number, PROFILE fields to add to its
+            definitions so the transform can set them
+
+    Returns:
+        The rewritten FIT file
+
+    Raises:
+        ValueError: If the data is not a valid FIT file
+    """
+    add_fields = add_fields or {}
+    _, protocol_version, profile_version, _ = read_header(data)
+    encoder = FitEncoder(len(data) + 1024, protocol_version, profile_version)
+    copier = _Copier(encoder, data)
+    rewritten: Dict[int, MessageDefinition] = {}
+    for message in iter_messages(data):
+        global_number = message.definition.global_number
+        if global_number not in transforms:
+            copier.copy(message)
+            continue
+        copier.flush()
+        if message.is_definition:
+            rewritten[message.local_type] = message.definition.with_fields(add_fields.get(global_number, ()))
+            encoder.write_bytes(rewritten[message.local_type].to_bytes(message.local_type))
+        else:
+            values = transforms[global_number](message.definition.decode(message.body(data)))
+            encoder.write_bytes(data[message.offset:message.offset + 1])
+            encoder.write_bytes(rewritten[message.local_type].pack_raw(values))
+            encoder.write_bytes(data[message.offset + 1 + message.definition.struct.size:
+                                     message.offset + message.size])
+        copier.start = copier.end = message.offset + message.size
+    copier.flush()
+    return encoder.getvalue()
+
+
+# Messages recomputed by merge() and messages taken from every merged file
+SUMMARY_MESSAGES = (SESSION, LAP, ACTIVITY)
+MERGED_MESSAGES = (RECORD, EVENT)
+# Profile values of the merged summary messages
+_EVENT_LAP, _EVENT_SESSION, _EVENT_ACTIVITY, _EVENT_TYPE_STOP = 9, 8, 26, 1
+_SPORT_CYCLING = 2
+
+
+class _RideTotals:
+    """Running totals over the record messages of the merged files."""
+
+    def __init__(self):
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self.timer_time = 0
+        self.distance = 0
+        self.power_sum = self.power_count = self.max_power = 0
+        self.heart_rate_sum = self.heart_rate_count = self.max_heart_rate = 0
+
+    def add(self, values: Dict[str, Any]) -> None:
+        power = values.get("power", 0xFFFF)
+        if power != 0xFFFF:
+            self.power_sum += power
+            self.power_count += 1
+            self.max_power = max(self.max_power, power)
+        heart_rate = values.get("heart_rate", 0xFF)
+        if heart_rate not in (0xFF, 0):
+            self.heart_rate_sum += heart_rate
+            self.heart_rate_count += 1
+            self.max_heart_rate = max(self.max_heart_rate, heart_rate)
+        distance = values.get("distance", 0xFFFFFFFF)
+        if distance != 0xFFFFFFFF:
+            self.distance = max(self.distance, distance)
+
+    def summary(self) -> Dict[str, Any]:
+        """Summary fields shared by the lap and session message (physical units)."""
+        return {
+            "timestamp": self.end, "start_time": self.start, "message_index": 0,
+            "event_type": _EVENT_TYPE_STOP,
+            "total_elapsed_time": float(self.end - self.start), "total_timer_time": float(self.timer_time),
+            "total_distance": self.distance / 100,
+            "avg_power": round(self.power_sum / self.power_count) if self.power_count else None,
+            "max_power": self.max_power if self.power_count else None,
+            "avg_heart_rate": round(self.heart_rate_sum / self.heart_rate_count) if self.heart_rate_count else None,
+            "max_heart_rate": self.max_heart_rate if self.heart_rate_count else None,
+        }
+
+
+def merge(contents: Sequence[bytes]) -> bytes:
+    """Merge consecutive recordings of one activity into a single FIT file.
+
+    All messages of the first file are kept except its summaries; of the
+    later files only the record and event messages are appended, with their
+    distance continuing from the previous file. The lap, session and
+    activity summaries are recomputed from the records in the same pass.
+    Messages are copied as byte slices; only records that need a distance
+    offset are repacked.
+
+    Args:
+        contents: FIT file contents in chronological order
+
+    Returns:
+        The merged FIT file
+
+    Raises:
+        ValueError: If no file is given or a file is not a valid FIT file
+    """
+    if not contents:
+        raise ValueError("Nothing to merge")
+    _, protocol_version, profile_version, _ = read_header(contents[0])
+    encoder = FitEncoder(sum(len(data) for data in contents) + 1024, protocol_version, profile_version)
+    totals = _RideTotals()
+    sport: Dict[str, Any] = {}
+    for index, data in enumerate(contents):
+        copier = _Copier(encoder, data)
+        distance_offset = totals.distance if index else 0
+        file_start = file_end = None
+        for message in iter_messages(data):
+            global_number = message.definition.global_number
+            if global_number in SUMMARY_MESSAGES or (index and global_number not in MERGED_MESSAGES):
+                if global_number == SESSION and not message.is_definition and not sport:
+                    values = message.definition.decode(message.body(data))
+                    sport = {name: values[name] for name in ("sport", "sub_sport") if name in values}
+                copier.flush()
+                copier.start = copier.end = message.offset + message.size
+                continue
+            if global_number != RECORD or message.is_definition:
+                copier.copy(message)
+                continue
+
+            values = message.definition.decode(message.body(data))
+            timestamp = values.get("timestamp")
+            if timestamp is not None:
+                file_start = timestamp if file_start is None else file_start
+                file_end = timestamp
+            if distance_offset and values.get("distance", 0xFFFFFFFF) != 0xFFFFFFFF:
+                values["distance"] += distance_offset
+                copier.flush()
+                encoder.write_bytes(data[message.offset:message.offset + 1])
+                encoder.write_bytes(message.definition.pack_raw(values))
+                encoder.write_bytes(data[message.offset + 1 + message.definition.struct.size:
+                                         message.offset + message.size])
+                copier.start = copier.end = message.offset + message.size
+            else:
+                copier.copy(message)
+            totals.add(values)
+        copier.flush()
+        if file_start is not None:
+            totals.start = file_start if totals.start is None else totals.start
+            totals.end = file_end
+            totals.timer_time += file_end - file_start
+    if totals.start is None:
+        raise ValueError("Nothing to merge: the files have no timestamped records")
+
+    summary = totals.summary()
+    lap = MessageDefinition.from_profile(LAP, [name for name in PROFILE[LAP] if name in summary or name == "event"])
+    encoder.define(13, lap)
+    encoder.write(13, dict(summary, event=_EVENT_LAP))
+    session = MessageDefinition.from_profile(SESSION, list(PROFILE[SESSION]))
+    encoder.define(14, session)
+    encoder.write(14, dict(summary, event=_EVENT_SESSION, first_lap_index=0, num_laps=1,
+                           sport=sport.get("sport", _SPORT_CYCLING), sub_sport=sport.get("sub_sport")))
+    activity = MessageDefinition.from_profile(ACTIVITY, list(PROFILE[ACTIVITY]))
+    encoder.define(15, activity)
+    encoder.write(15, {"timestamp": totals.end, "total_timer_time": float(totals.timer_time), "num_sessions": 1,
+                       "type": 0, "event": _EVENT_ACTIVITY, "event_type": _EVENT_TYPE_STOP})
+    return encoder.getvalue()
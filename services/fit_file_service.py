@@ -1,24 +1,83 @@
 """FIT file service for handling file modifications."""
 
 import os
+import time
 import tempfile
 import logging
-from typing import Optional
-from fit_tool.fit_file import FitFile
-from fit_tool.profile.messages.device_info_message import DeviceInfoMessage
-from fit_tool.profile.messages.file_id_message import FileIdMessage
-from fit_tool.profile.profile_type import Manufacturer, GarminProduct
-from fit_tool.fit_file_builder import FitFileBuilder
+from typing import Dict, List, Optional, Tuple
+from services import tracing
+from services.fit_encoder import DEVICE_INFO, FILE_ID, merge, rewrite
+
+# Manufacturer and product ids of the FIT profile
+GARMIN_MANUFACTURER = 1
+EDGE_530_PRODUCT = 3122
+
+
+def _modify_device_info_worker(cache_dir: str,
+                               fit_file_path: str,
+                               manufacturer: Optional[int],
+                               product: Optional[int],
+                               software_version: Optional[float]) -> Tuple[Optional[str], Optional[str], int, int]:
+    """Process pool entry point for FIT transformation.
+
+    Only the file paths cross the process boundary; the file content is
+    read and rewritten inside the worker process. Spans ended in a worker
+    are not exported, so the worker returns its timing and the parent
+    records the transform span.
+
+    Returns:
+        Modified file path (None on failure), error message, and start and
+        end of the transformation as epoch nanoseconds
+    """
+    started = time.time_ns()
+    try:
+        modified_path = FitFileService(cache_dir).modify_device_info(
+            fit_file_path, manufacturer, product, software_version)
+    except (FileNotFoundError, RuntimeError) as e:
+        return None, f"{type(e).__name__}: {e}", started, time.time_ns()
+    return modified_path, None, started, time.time_ns()
 
 
 class FitFileService:
     """Service for modifying FIT files."""
 
-    def __init__(self):
-        """Initialize FitFileService."""
+    def __init__(self, cache_dir: Optional[str] = None):
+        """Initialize FitFileService.
+
+        Args:
+            cache_dir: Directory for the modified and merged FIT files
+                (defaults to the temp dir)
+        """
         self.logger = logging.getLogger(__name__)
-        self.logger.info("RunalyzeService initialized successfully.")
-        
+        self.cache_dir = cache_dir or tempfile.gettempdir()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.logger.info("FitFileService initialized successfully.")
+
+    def _write_output(self, prefix: str, source_path: str, content: bytes) -> str:
+        """Write a derived FIT file under a unique name in the cache dir.
+
+        Concurrent runs and workers deriving files from the same source get
+        different files instead of overwriting each other's.
+
+        Args:
+            prefix: Name prefix, e.g. "modified_"
+            source_path: File the content was derived from
+            content: FIT file content
+
+        Returns:
+            Path of the written file
+        """
+        stem, extension = os.path.splitext(os.path.basename(source_path))
+        fd, path = tempfile.mkstemp(prefix=f"{prefix}{stem}_", suffix=extension, dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    @tracing.traced("fit.transform", lambda self, fit_file_path, *args, **kwargs: {"fit.file": fit_file_path})
     def modify_device_info(self, fit_file_path: str,
                           manufacturer: Optional[int] = None,
                           product: Optional[int] = None,
@@ -41,50 +100,151 @@ class FitFileService:
         if not os.path.exists(fit_file_path):
             raise FileNotFoundError(f"FIT file not found: {fit_file_path}")
 
-
-
-
         # Set defaults
-        manufacturer = manufacturer or Manufacturer.GARMIN.value
-        product = product or GarminProduct.EDGE_530.value
+        manufacturer = manufacturer or GARMIN_MANUFACTURER
+        product = product or EDGE_530_PRODUCT
         software_version = software_version or 9.75
 
-        self.logger.info(f"Modifying FIT file: {fit_file_path}")
+        self.logger.info("Modifying FIT file: %s", fit_file_path)
 
-        try:
-            fit_file = FitFile.from_file(fit_file_path)
+        def set_creator(values: Dict) -> Dict:
+            values["manufacturer"] = manufacturer
+            values["product"] = product
+            return values
 
-            builder = FitFileBuilder(auto_define=False)
-
-            for record in fit_file.records:
-                message = record.message
-                include_record = True
-                if include_record:
-                    builder.add(message)
+        def set_device(values: Dict) -> Dict:
+            set_creator(values)
+            values["software_version"] = round(software_version * 100)
+            return values
 
+        try:
+            with open(fit_file_path, "rb") as f:
+                content = f.read()
 
-            # Save the modified FIT file
-            temp_dir = tempfile.gettempdir()
-            modified_fit_file_path = os.path.join(temp_dir, "modified_" + os.path.basename(fit_file_path))
+            # Only the file_id and device_info messages are re-encoded; the
+            # records are copied unchanged
+            modified = rewrite(content, {FILE_ID: set_creator, DEVICE_INFO: set_device},
+                               add_fields={FILE_ID: ("manufacturer", "product"),
+                                           DEVICE_INFO: ("manufacturer", "product", "software_version")})
 
-            modified_file = builder.build()
-            modified_file.to_file(modified_fit_file_path)
+            modified_fit_file_path = self._write_output("modified_", fit_file_path, modified)
+            tracing.link_file(modified_fit_file_path, tracing.activity_of(fit_file_path))
 
-            self.logger.info(f"Modified FIT file saved to {modified_fit_file_path}")
+            self.logger.info("Modified FIT file saved to %s", modified_fit_file_path)
             return modified_fit_file_path
 
         except Exception as e:
             raise RuntimeError(f"Failed to modify FIT file: {e}") from e
 
+    @tracing.traced("fit.transform_batch", lambda self, fit_file_paths, *args, **kwargs: {
+        "fit.files": len(fit_file_paths)})
+    def modify_device_info_batch(self, fit_file_paths: List[str],
+                                 max_workers: Optional[int] = None,
+                                 manufacturer: Optional[int] = None,
+                                 product: Optional[int] = None,
+                                 software_version: Optional[float] = None) -> Dict[str, str]:
+        """Modifies the device info of several FIT files in parallel.
+
+        Rewriting is CPU work, so the files are spread over a process pool.
+        Workers receive and return file paths only.
+
+        Args:
+            fit_file_paths: Paths to the original FIT files
+            max_workers: Number of worker processes (defaults to the CPU count);
+                1 transforms the files in the current process
+            manufacturer: Device manufacturer (defaults to Garmin)
+            product: Device product (defaults to Edge 530)
+            software_version: Software version (defaults to 9.75)
+
+        Returns:
+            Mapping of original file path to modified file path. Files that
+            failed to transform are logged and left out of the mapping.
+        """
+        workers = min(max_workers or os.cpu_count() or 1, len(fit_file_paths))
+        modified_paths: Dict[str, str] = {}
+
+        if workers <= 1:
+            for fit_file_path in fit_file_paths:
+                try:
+                    modified_paths[fit_file_path] = self.modify_device_info(
+                        fit_file_path, manufacturer, product, software_version)
+                except (FileNotFoundError, RuntimeError):
+                    self.logger.exception("Failed to transform %s", fit_file_path)
+            return modified_paths
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.logger.info("Transforming %s FIT files with %s processes", len(fit_file_paths), workers)
+        submitted = time.time_ns()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                fit_file_path: executor.submit(_modify_device_info_worker, self.cache_dir, fit_file_path,
+                                               manufacturer, product, software_version)
+                for fit_file_path in fit_file_paths
+            }
+            for fit_file_path, future in futures.items():
+                try:
+                    modified_path, error, started, ended = future.result()
+                except Exception:
+                    self.logger.exception("Failed to transform %s", fit_file_path)
+                    continue
+                tracing.record("fit.transform", started, ended,
+                               {"fit.file": fit_file_path, "queue.wait_ms": round((started - submitted) / 1e6, 3)},
+                               RuntimeError(error) if error else None)
+                if error:
+                    self.logger.error("Failed to transform %s: %s", fit_file_path, error)
+                    continue
+                tracing.link_file(modified_path, tracing.activity_of(fit_file_path))
+                modified_paths[fit_file_path] = modified_path
+        return modified_paths
+
+    @tracing.traced("fit.merge", lambda self, fit_file_paths: {
+        "fit.file": fit_file_paths[0] if fit_file_paths else None, "fit.files": len(fit_file_paths),
+        "activity.ids": tracing.activity_ids(fit_file_paths)})
+    def merge_activities(self, fit_file_paths: List[str]) -> str:
+        """Merges the pieces of a split ride into a single FIT file.
+
+        The record and event messages are streamed into one file and the
+        lap, session and activity summaries are recomputed over all pieces.
+
+        Args:
+            fit_file_paths: Paths to the FIT files in chronological order
+
+        Returns:
+            Path to the merged FIT file
+
+        Raises:
+            FileNotFoundError: If an input file doesn't exist
+            RuntimeError: If merging fails
+        """
+        for fit_file_path in fit_file_paths:
+            if not os.path.exists(fit_file_path):
+                raise FileNotFoundError(f"FIT file not found: {fit_file_path}")
+
+        self.logger.info("Merging %s FIT files: %s", len(fit_file_paths), ', '.join(fit_file_paths))
+        try:
+            contents = []
+            for fit_file_path in fit_file_paths:
+                with open(fit_file_path, "rb") as f:
+                    contents.append(f.read())
+            merged_fit_file_path = self._write_output("merged_", fit_file_paths[0], merge(contents))
+            tracing.link_file(merged_fit_file_path, tracing.activity_of(fit_file_paths[0]))
+        except Exception as e:
+            raise RuntimeError(f"Failed to merge FIT files: {e}") from e
+
+        self.logger.info("Merged FIT file saved to %s", merged_fit_file_path)
+        return merged_fit_file_path
+
     def cleanup_file(self, file_path: str) -> None:
         """Clean up a temporary file.
 
         Args:
             file_path: Path to the file to remove
         """
+        tracing.unlink_file(file_path)
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                self.logger.info(f"Cleaned up file: {file_path}")
+                self.logger.info("Cleaned up file: %s", file_path)
         except OSError as e:
-            self.logger.warning(f"Failed to cleanup file {file_path}: {e}")
+            self.logger.warning("Failed to cleanup file %s: %s", file_path, e)
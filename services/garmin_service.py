@@ -1,46 +1,101 @@
 """Garmin service for handling authentication and activity uploads."""
 
+import os
+import time
 import logging
-from typing import Dict, Any
-from garminconnect import (
-    Garmin,
-    GarminConnectAuthenticationError,
-    GarminConnectTooManyRequestsError,
-    GarminConnectConnectionError
-)
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from services import tracing
+from services.destination import Destination
+from services.rate_limiter import RateLimiter
+from services.retry import CircuitOpenError, Retrier, is_transient_error, status_code_of
+from services.upload_result import UploadResult, UploadStatus
 
 TOKEN_FILE="~/.garth"
+GARMIN_API_HOST = "connectapi.garmin.com"
 
 
-class GarminService:
+def _is_rate_limited(error: Exception) -> bool:
+    """Check whether an upload error is a Garmin Connect 429 response."""
+    from garminconnect import GarminConnectTooManyRequestsError
+
+    return isinstance(error, GarminConnectTooManyRequestsError) or status_code_of(error) == 429
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Check whether a failed Garmin Connect upload is worth retrying."""
+    return _is_rate_limited(error) or is_transient_error(error)
+
+
+def _activity_id(response: Any) -> Optional[str]:
+    """Extract the Garmin activity id from an upload response."""
+    try:
+        data = response.json() if hasattr(response, "json") else response
+        return str(data["detailedImportResult"]["successes"][0]["internalId"])
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+class GarminService(Destination):
     """Service for interacting with Garmin Connect."""
 
-    def __init__(self, username: str, password: str):
+    name = "garmin"
+
+    def __init__(self, username: str, password: str, token_dir: Optional[str] = None,
+                 max_workers: int = 4, retrier: Optional[Retrier] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
         """Initialize GarminService with credentials.
 
         Args:
             username: Garmin Connect username
             password: Garmin Connect password
+            token_dir: Directory of the cached garth session (defaults to
+                $GARMINTOKENS or ~/.garth)
+            max_workers: Maximum number of concurrent uploads in a batch
+            retrier: Shared retry/circuit-breaker component for the uploads
+            rate_limiter: Shared per-host request rate limiter
         """
         self.username = username
         self.password = password
-        self.client: Garmin = Garmin()
+        self.token_dir = os.path.expanduser(token_dir or os.getenv("GARMINTOKENS") or TOKEN_FILE)
+        self.max_workers = max_workers
+        self.retrier = retrier or Retrier()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # garminconnect (and garth with its pydantic models) is imported on
+        # first authentication, see authenticate()
+        self.client: Optional[Any] = None
         self.logger = logging.getLogger(__name__)
         self._authenticated = False
 
     def authenticate(self) -> None:
         """Authenticate with Garmin Connect.
 
+        Reuses the cached garth session in token_dir when it is valid and only
+        falls back to a credential login (saving the new session) otherwise.
+
         Raises:
             GarminConnectAuthenticationError: Invalid credentials
             GarminConnectTooManyRequestsError: Rate limit exceeded
             GarminConnectConnectionError: Network connection issues
             RuntimeError: Other authentication failures
         """
+        from garminconnect import (
+            Garmin,
+            GarminConnectAuthenticationError,
+            GarminConnectTooManyRequestsError,
+            GarminConnectConnectionError
+        )
+
         self.logger.info("Logging in to Garmin Connect...")
 
         try:
-            self.client.login("/home/peter/.garth")
+            if self.client is None:
+                self.client = Garmin(self.username, self.password)
+            if not self._login_from_cache():
+                self.logger.info("Logging in to Garmin Connect with credentials")
+                self.client.garth.login(self.username, self.password)
+                self._save_session()
+                self._load_profile()
             self._authenticated = True
             self.logger.info("Successfully authenticated with Garmin Connect")
         except GarminConnectAuthenticationError:
@@ -53,9 +108,47 @@ class GarminService:
             self.logger.exception("Connection error. Check your internet connection.")
             raise
         except Exception as e:
-            self.logger.exception(f"Failed to login to Garmin Connect: {e}")
+            self.logger.exception("Failed to login to Garmin Connect: %s", e)
             raise RuntimeError(f"Authentication failed: {e}") from e
 
+    def _login_from_cache(self) -> bool:
+        """Try to resume the cached garth session.
+
+        Returns:
+            True if the cached session was loaded, False if a credential login is needed
+        """
+        from garminconnect import GarminConnectAuthenticationError
+        from garth.exc import GarthException
+
+        if not os.path.isdir(self.token_dir):
+            self.logger.info("No cached Garmin session in %s", self.token_dir)
+            return False
+        try:
+            self.client.login(self.token_dir)
+            self.logger.info("Reusing cached Garmin session from %s", self.token_dir)
+            return True
+        # Expired tokens fail the profile request, damaged token files fail
+        # to parse; both are replaced by a credential login. Connection
+        # errors propagate, a credential login would fail the same way.
+        except (FileNotFoundError, ValueError, KeyError, TypeError, AssertionError, GarthException,
+                GarminConnectAuthenticationError) as e:
+            self.logger.warning("Cached Garmin session in %s is invalid: %s", self.token_dir, e)
+            return False
+
+    def _load_profile(self) -> None:
+        """Load the user profile over the freshly logged in garth session."""
+        profile = self.client.garth.profile
+        self.client.display_name = profile.get("displayName")
+        self.client.full_name = profile.get("fullName")
+
+    def _save_session(self) -> None:
+        """Persist the garth session, including refreshed tokens, to token_dir."""
+        try:
+            os.makedirs(self.token_dir, exist_ok=True)
+            self.client.garth.dump(self.token_dir)
+        except Exception as e:
+            self.logger.warning("Failed to save Garmin session to %s: %s", self.token_dir, e)
+
     def upload_activity(self, fit_file_path: str) -> Dict[str, Any]:
         """Upload a .fit file to Garmin Connect.
 
@@ -71,18 +164,88 @@ class GarminService:
         if not self._authenticated:
             raise RuntimeError("Must authenticate before uploading activities")
 
-        self.logger.info(f"Uploading {fit_file_path} to Garmin Connect...")
+        self.logger.info("Uploading %s to Garmin Connect...", fit_file_path)
 
         try:
-            print(fit_file_path)
-            response = self.client.upload_activity(fit_file_path)
+            response = self.retrier.call("garmin.upload", self._send_upload, fit_file_path,
+                                         is_retryable=_is_retryable)
             self.logger.info("Upload successful")
-            self.logger.debug(f"Upload response: {response}")
+            self.logger.debug("Upload response: %s", response)
             return response
         except Exception as e:
-            self.logger.exception(f"Failed to upload activity: {e}")
+            self.logger.exception("Failed to upload activity: %s", e)
             raise RuntimeError(f"Upload failed: {e}") from e
 
+    def _send_upload(self, fit_file_path: str) -> Any:
+        """Send one upload request within the Garmin Connect rate limit."""
+        self.rate_limiter.acquire(GARMIN_API_HOST)
+        return self.client.upload_activity(fit_file_path)
+
+    def upload_activities(self, fit_file_paths: List[str]) -> Dict[str, UploadResult]:
+        """Upload several .fit files to Garmin Connect with bounded concurrency.
+
+        Authenticates on first use and saves the (possibly refreshed) session
+        afterwards, so the next run can skip the login.
+
+        Args:
+            fit_file_paths: Paths to the FIT files to upload
+
+        Returns:
+            Mapping of file path to upload result, one entry per file
+        """
+        if not fit_file_paths:
+            return {}
+        if not self._authenticated:
+            self.authenticate()
+
+        workers = min(self.max_workers, len(fit_file_paths))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(zip(fit_file_paths, executor.map(tracing.propagate(self.upload), fit_file_paths)))
+        self._save_session()
+        return results
+
+    @tracing.traced("garmin.upload", lambda self, fit_file_path: {"fit.file": fit_file_path})
+    def upload(self, fit_file_path: str) -> UploadResult:
+        """Upload a FIT file to Garmin Connect (Destination interface).
+
+        Authenticates on first use.
+
+        Args:
+            fit_file_path: Path to the FIT file to upload
+
+        Returns:
+            Outcome of the upload; Garmin's 409 response for an already
+            known activity is reported as a duplicate
+        """
+        if not self._authenticated:
+            self.authenticate()
+
+        started = time.monotonic()
+        try:
+            response = self.upload_activity(fit_file_path)
+        except RuntimeError as e:
+            cause = e.__cause__
+            status = UploadStatus.DUPLICATE if status_code_of(cause) == 409 else UploadStatus.FAILED
+            return UploadResult(fit_file_path, self.name, status,
+                                latency=time.monotonic() - started,
+                                retryable=isinstance(cause, CircuitOpenError) or _is_retryable(cause),
+                                error=None if status is UploadStatus.DUPLICATE else str(e))
+        return UploadResult(fit_file_path, self.name, UploadStatus.SUCCESS,
+                            activity_id=_activity_id(response),
+                            latency=time.monotonic() - started,
+                            bytes_sent=os.path.getsize(fit_file_path), response=response)
+
+    def upload_batch(self, fit_file_paths: List[str]) -> Dict[str, UploadResult]:
+        """Upload several FIT files to Garmin Connect (Destination interface).
+
+        Args:
+            fit_file_paths: Paths to the FIT files to upload
+
+        Returns:
+            Mapping of file path to upload result
+        """
+        return self.upload_activities(fit_file_paths)
+
     def is_authenticated(self) -> bool:
         """Check if the service is authenticated.
 
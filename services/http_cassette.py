@@ -0,0 +1,207 @@
+"""Record and replay of the HTTP traffic of a run, for offline pipeline runs."""
+
+import io
+import os
+import re
+import json
+import time
+import base64
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+from typing import Any, Callable, Deque, Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+RECORD = "record"
+REPLAY = "replay"
+SCRUBBED = "<scrubbed>"
+
+# Headers whose values are never written to a cassette
+SENSITIVE_HEADERS = ("authorization", "proxy-authorization", "cookie", "set-cookie", "token", "x-api-key")
+# Headers describing the wire encoding, which no longer applies to the stored (decoded) body
+_WIRE_HEADERS = ("content-encoding", "transfer-encoding", "content-length")
+# JSON keys, form fields and query parameters holding credentials or session tokens
+_SECRET_NAMES = ("access_token|refresh_token|id_token|oauth_token|oauth_token_secret|token|password|username|"
+                 "client_secret|session_state|ticket|mfa_token|_csrf")
+_JSON_SECRET = re.compile(rf'("(?:{_SECRET_NAMES})"\s*:\s*)"[^"]*"', re.IGNORECASE)
+_FORM_SECRET = re.compile(rf'(\b(?:{_SECRET_NAMES})=)[^&\s"\'<>]+', re.IGNORECASE)
+
+
+class CassetteMissError(requests.RequestException):
+    """Raised in replay mode for a request the cassette has no response for."""
+
+
+def scrub(text: str) -> str:
+    """Replace credentials and tokens in JSON, form data, URLs and HTML."""
+    return _FORM_SECRET.sub(rf"\1{SCRUBBED}", _JSON_SECRET.sub(rf'\1"{SCRUBBED}"', text))
+
+
+def _request_key(request: requests.PreparedRequest) -> Tuple[str, str]:
+    """Key a request is matched by: method and scrubbed URL."""
+    return request.method.upper(), scrub(request.url)
+
+
+class HttpCassette:
+    """Records the HTTP traffic of a run to a file, or replays it from one.
+
+    The cassette hooks requests' HTTPAdapter.send, which every session
+    goes through: the Runalyze session, garth's Garmin Connect session
+    (whose adapters garth re-mounts on each login) and the module-level
+    requests calls of zwift-client and the S3 downloads. Each interaction
+    is one JSON line with the response, its latency and the request size;
+    request bodies (uploaded FIT files) are not stored.
+
+    Credentials and tokens are scrubbed before anything is written, and
+    live requests are scrubbed the same way before matching, so a replay
+    run matches requests carrying scrubbed tokens from earlier responses.
+    Requests are matched by method and URL, in recorded order per URL.
+
+    Only network latency is simulated on replay; local processing time
+    is spent by the replayed run itself.
+    """
+
+    def __init__(self, path: str, mode: str = REPLAY, speed: float = 1.0,
+                 sleep: Callable[[float], None] = time.sleep):
+        """Initialize HttpCassette; the traffic of a replay cassette is loaded.
+
+        Args:
+            path: Cassette file (JSON lines)
+            mode: RECORD to capture live traffic, REPLAY to serve it offline
+            speed: Replay latencies divided by this factor; 0 replays
+                without any delay
+            sleep: Sleep function used to simulate latency
+
+        Raises:
+            ValueError: If the mode is unknown
+            OSError: If a replay cassette cannot be read
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = os.path.expanduser(path)
+        self.mode = mode
+        self.speed = speed
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._file = None
+        self._original_send = None
+        self._responses: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = {}
+        self.interactions = 0
+        self.logger = logging.getLogger(__name__)
+        if mode == REPLAY:
+            self._load()
+
+    def __enter__(self) -> "HttpCassette":
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.uninstall()
+
+    def install(self) -> None:
+        """Route all requests sessions of the process through the cassette."""
+        if self._original_send is not None:
+            return
+        if self.mode == RECORD:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "w", encoding="utf-8")
+        original_send = self._original_send = HTTPAdapter.send
+        cassette = self
+
+        def send(adapter: HTTPAdapter, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+            if cassette.mode == RECORD:
+                return cassette._record(original_send, adapter, request, **kwargs)
+            return cassette._replay(request)
+
+        HTTPAdapter.send = send
+        self.logger.info("HTTP cassette %s installed (%s%s)", self.path, self.mode,
+                         f", speed {self.speed:g}x" if self.mode == REPLAY else "")
+
+    def uninstall(self) -> None:
+        """Restore live HTTP and close a recorded cassette."""
+        if self._original_send is None:
+            return
+        HTTPAdapter.send = self._original_send
+        self._original_send = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.logger.info("HTTP cassette %s: %s interactions %sed", self.path, self.interactions, self.mode)
+
+    def _record(self, send: Callable, adapter: HTTPAdapter, request: requests.PreparedRequest,
+                **kwargs) -> requests.Response:
+        """Send a request live and append the scrubbed interaction to the cassette."""
+        method, url = _request_key(request)
+        body = request.body or b""
+        entry: Dict[str, Any] = {"method": method, "url": url, "request_bytes": len(body)}
+        started = time.monotonic()
+        try:
+            response = send(adapter, request, **kwargs)
+            content = response.content
+        except requests.RequestException as e:
+            entry.update(error=type(e).__name__, message=scrub(str(e)),
+                         elapsed=round(time.monotonic() - started, 4))
+            self._write(entry)
+            raise
+        entry.update(elapsed=round(time.monotonic() - started, 4), status=response.status_code,
+                     reason=response.reason,
+                     headers={name: SCRUBBED if name.lower() in SENSITIVE_HEADERS else scrub(value)
+                              for name, value in response.headers.items() if name.lower() not in _WIRE_HEADERS})
+        try:
+            entry["body"] = scrub(content.decode("utf-8"))
+        except UnicodeDecodeError:
+            entry["body_base64"] = base64.b64encode(content).decode("ascii")
+        self._write(entry)
+        return response
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.interactions += 1
+
+    def _replay(self, request: requests.PreparedRequest) -> requests.Response:
+        """Serve the next recorded response for a request."""
+        key = _request_key(request)
+        with self._lock:
+            queue = self._responses.get(key)
+            if not queue:
+                raise CassetteMissError(f"No recorded response for {key[0]} {key[1]} in {self.path}",
+                                        request=request)
+            entry = queue.popleft()
+            self.interactions += 1
+        if self.speed > 0:
+            self._sleep(entry.get("elapsed", 0.0) / self.speed)
+        if "error" in entry:
+            error = getattr(requests.exceptions, entry["error"], requests.ConnectionError)
+            raise error(entry.get("message", ""), request=request)
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason")
+        response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        content = (entry["body"].encode("utf-8") if "body" in entry
+                   else base64.b64decode(entry.get("body_base64", "")))
+        # Read already, like a response whose body was loaded; iter_content
+        # and stream=True callers get the body from the content
+        response._content, response._content_consumed = content, True
+        response.raw = io.BytesIO(content)
+        response.encoding = "utf-8" if "body" in entry else None
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=entry.get("elapsed", 0.0))
+        return response
+
+    def _load(self) -> None:
+        """Read the recorded interactions, queued per request key."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._responses.setdefault((entry["method"], entry["url"]), deque()).append(entry)
+        self.logger.info("Loaded %s interactions from %s", sum(map(len, self._responses.values())), self.path)
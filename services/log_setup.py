@@ -0,0 +1,142 @@
+"""Logging through a background writer thread, as text or JSON lines."""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, TextIO
+
+from services import tracing
+
+TEXT = "text"
+JSON = "json"
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Argument types whose rendering cannot change between the logging call and
+# the writer thread formatting the message
+_IMMUTABLE_TYPES = (str, int, float, bool, bytes, type(None))
+# Attributes of every LogRecord; anything else was passed with extra=...
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["LazyQueueHandler"] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line.
+
+    Fields are the timestamp, level, logger, message and thread, the trace
+    and span ids of the span the record was logged in, the exception, and
+    any extra=... attributes.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queues records for the writer thread without formatting them.
+
+    The standard QueueHandler formats every message in the logging thread.
+    Here a record whose arguments are immutable primitives is queued as is
+    and formatted by the writer thread; only records with other arguments
+    (which may change before the writer gets to them) and exceptions are
+    rendered in the logging thread. Forked worker processes have no writer
+    thread, so they write their records directly.
+    """
+
+    def __init__(self, records: queue.SimpleQueue, writer: logging.Handler):
+        super().__init__(records)
+        self.writer = writer
+        self.pid = os.getpid()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if os.getpid() != self.pid:
+            self.writer.handle(record)
+        else:
+            super().emit(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        if record.args and not all(isinstance(arg, _IMMUTABLE_TYPES) for arg in _iter_args(record.args)):
+            record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        span = tracing.current_span()
+        if isinstance(span, tracing.Span):
+            record.trace_id, record.span_id = span.trace_id, span.span_id
+        return record
+
+
+def _iter_args(args: Any):
+    return args.values() if isinstance(args, dict) else args
+
+
+def configure_logging(level: str = "INFO", fmt: str = TEXT, stream: Optional[TextIO] = None) -> None:
+    """Route all logging through a queue to a background writer thread.
+
+    Logging calls only put the record on a queue; the writer thread formats
+    it and writes it to the stream. Calling this again replaces the previous
+    setup, and the queue is drained when the process exits.
+
+    Args:
+        level: Level of the root logger
+        fmt: TEXT for the classic log lines, JSON for one JSON object per line
+        stream: Stream written to (defaults to stderr)
+
+    Raises:
+        ValueError: If the format is unknown
+    """
+    global _listener, _handler
+    if fmt not in (TEXT, JSON):
+        raise ValueError(f"Unknown log format: {fmt}")
+    stop_logging()
+
+    writer = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    writer.setFormatter(JsonFormatter() if fmt == JSON else logging.Formatter(TEXT_FORMAT))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _handler = LazyQueueHandler(records, writer)
+    _listener = logging.handlers.QueueListener(records, writer)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_handler)
+
+
+def stop_logging() -> None:
+    """Write the queued records, stop the writer thread and detach its handler."""
+    global _listener, _handler
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        owner, _handler = _handler, None
+        if owner.pid != os.getpid():
+            # A forked process has a copy of the listener without its thread
+            _listener = None
+    if _listener is not None:
+        _listener.stop()
+        _listener.handlers[0].flush()
+        _listener = None
+
+
+atexit.register(stop_logging)
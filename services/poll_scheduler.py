@@ -0,0 +1,249 @@
+"""Adaptive polling of the Zwift activity catalog for the daemon mode."""
+
+import time
+import heapq
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from services.activity_record import ActivityRecord, parse_timestamp
+
+WEEK_S = 7 * 24 * 3600
+
+
+def ride_end_time(activity: Union[ActivityRecord, Dict[str, Any]]) -> Optional[float]:
+    """End of a catalog activity as epoch seconds (start time if the end is unknown)."""
+    if isinstance(activity, ActivityRecord):
+        return activity.end if activity.end is not None else activity.start
+    for key in ("endDate", "startDate"):
+        value = activity.get(key)
+        if value:
+            try:
+                return parse_timestamp(value)
+            except ValueError:
+                continue
+    return None
+
+
+def _activity_id(activity: Union[ActivityRecord, Dict[str, Any]]) -> Any:
+    return activity.id if isinstance(activity, ActivityRecord) else activity.get("id")
+
+
+class RidePattern:
+    """Weekly pattern of an athlete's ride end times.
+
+    Ride ends are folded onto one week (UTC time of week), so a rider who
+    usually finishes around 19:00 on Tuesdays and Thursdays yields a high
+    likelihood there and a low one elsewhere.
+    """
+
+    def __init__(self, end_times: Iterable[float], window: float = 1800.0, history_weeks: int = 12):
+        """Initialize RidePattern.
+
+        Args:
+            end_times: Ride end times as epoch seconds
+            window: Half-width in seconds of the window around a time of week
+                that counts as "riding time"
+            history_weeks: Only rides within this many weeks of the newest
+                ride are learned from
+        """
+        end_times = sorted(end_times)
+        if end_times:
+            end_times = [t for t in end_times if t >= end_times[-1] - history_weeks * WEEK_S]
+        self.window = window
+        self.weeks = max(1.0, (end_times[-1] - end_times[0]) / WEEK_S) if end_times else 1.0
+        self._offsets = sorted(t % WEEK_S for t in end_times)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def likelihood(self, now: float) -> float:
+        """Share of weeks with a ride ending near this time of week (0..1).
+
+        Args:
+            now: Point in time as epoch seconds
+        """
+        if not self._offsets:
+            return 0.0
+        offset = now % WEEK_S
+        hits = 0
+        # The window may wrap around the start of the week
+        for low, high in ((offset - self.window, offset + self.window),
+                          (offset - self.window + WEEK_S, offset + self.window + WEEK_S),
+                          (offset - self.window - WEEK_S, offset + self.window - WEEK_S)):
+            hits += bisect_right(self._offsets, high) - bisect_left(self._offsets, low)
+        return min(1.0, hits / self.weeks)
+
+    def until_window(self, now: float, min_likelihood: float = 0.0) -> Optional[float]:
+        """Seconds until the next ride-end window opens.
+
+        Only windows around ride ends with at least min_likelihood count.
+
+        Args:
+            now: Point in time as epoch seconds
+            min_likelihood: Likelihood a window must reach to count
+
+        Returns:
+            Seconds until the window starts, or None if no window qualifies
+        """
+        offset = now % WEEK_S
+        waits = [(ride - self.window - offset) % WEEK_S for ride in set(self._offsets)
+                 if self.likelihood(ride) >= min_likelihood]
+        return min(waits) if waits else None
+
+
+class PollScheduler:
+    """Polls each athlete's newest activity at an adaptive interval.
+
+    The interval moves geometrically between min_interval (where rides
+    usually end) and max_interval (where they never do), but never sleeps
+    past the start of the next likely ride-end window. A poll fetches
+    only the first catalog page and queues a sync when a new activity
+    shows up.
+    """
+
+    def __init__(self, submit: Callable[[str], Any],
+                 catalogs: Dict[str, Callable[[Optional[int]], List[ActivityRecord]]],
+                 min_interval: float = 300.0, max_interval: float = 6 * 3600.0,
+                 window: float = 1800.0, relearn_interval: float = 24 * 3600.0,
+                 window_likelihood: float = 0.25, clock: Callable[[], float] = time.time):
+        """Initialize PollScheduler.
+
+        Args:
+            submit: Queues a sync of an athlete (e.g. SyncQueue.submit)
+            catalogs: Per athlete, a function returning the newest activities
+                (up to the given count, or all of them for None)
+            min_interval: Shortest poll interval in seconds
+            max_interval: Longest poll interval in seconds
+            window: Half-width of the ride-end window, see RidePattern
+            relearn_interval: Seconds after which the pattern is rebuilt
+                from the full catalog
+            window_likelihood: Likelihood of a ride-end window that the
+                interval is cut short for
+            clock: Wall clock (epoch seconds)
+        """
+        self.submit = submit
+        self.catalogs = dict(catalogs)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.window = window
+        self.relearn_interval = relearn_interval
+        self.window_likelihood = window_likelihood
+        self._clock = clock
+        self.logger = logging.getLogger(__name__)
+        self._patterns: Dict[str, RidePattern] = {}
+        self._learned_at: Dict[str, float] = {}
+        self._last_seen: Dict[str, Any] = {}
+        # Every athlete is due on the first tick
+        self._due: List[Tuple[float, str]] = [(0.0, athlete) for athlete in sorted(self.catalogs)]
+        self._stats = {"polls": 0, "syncs": 0, "errors": 0}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def learn(self, athlete: str, activities: Iterable[Dict[str, Any]]) -> RidePattern:
+        """Build the ride pattern of an athlete from their activity catalog.
+
+        Args:
+            athlete: Athlete id
+            activities: Activity records or Zwift catalog entries
+
+        Returns:
+            The learned pattern
+        """
+        end_times = [t for t in map(ride_end_time, activities) if t is not None]
+        pattern = RidePattern(end_times, window=self.window)
+        self._patterns[athlete] = pattern
+        self._learned_at[athlete] = self._clock()
+        self.logger.info("Learned ride pattern of %s from %s activities", athlete, len(pattern))
+        return pattern
+
+    def next_interval(self, athlete: str, now: Optional[float] = None) -> float:
+        """Seconds until the next poll of an athlete.
+
+        Args:
+            athlete: Athlete id
+            now: Point in time as epoch seconds (defaults to the clock)
+        """
+        now = self._clock() if now is None else now
+        pattern = self._patterns.get(athlete)
+        if not pattern:
+            return self.max_interval
+        interval = self.max_interval * (self.min_interval / self.max_interval) ** pattern.likelihood(now)
+        until_window = pattern.until_window(now, self.window_likelihood)
+        if until_window is not None:
+            interval = min(interval, max(self.min_interval, until_window))
+        return interval
+
+    def poll(self, athlete: str) -> bool:
+        """Check an athlete's newest activity and queue a sync if it is new.
+
+        The first poll after start always queues a sync, so rides finished
+        while the daemon was down are picked up.
+
+        Args:
+            athlete: Athlete id
+
+        Returns:
+            True if a sync was queued
+        """
+        now = self._clock()
+        self._stats["polls"] += 1
+        try:
+            if now - self._learned_at.get(athlete, float("-inf")) >= self.relearn_interval:
+                activities = self.catalogs[athlete](None)
+                self.learn(athlete, activities)
+            else:
+                activities = self.catalogs[athlete](1)
+        except Exception as e:
+            self._stats["errors"] += 1
+            self.logger.warning("Polling the activities of %s failed: %s", athlete, e)
+            return False
+
+        newest = _activity_id(activities[0]) if activities else None
+        if athlete in self._last_seen and newest == self._last_seen[athlete]:
+            return False
+        self._last_seen[athlete] = newest
+        self._stats["syncs"] += 1
+        self.logger.info("New activity %s of %s, queueing a sync", newest, athlete)
+        self.submit(athlete)
+        return True
+
+    def tick(self, now: Optional[float] = None) -> float:
+        """Poll the athletes that are due and reschedule them.
+
+        Args:
+            now: Point in time as epoch seconds (defaults to the clock)
+
+        Returns:
+            Seconds until the next athlete is due
+        """
+        now = self._clock() if now is None else now
+        while self._due and self._due[0][0] <= now:
+            _, athlete = heapq.heappop(self._due)
+            self.poll(athlete)
+            interval = self.next_interval(athlete, now)
+            self.logger.debug("Next poll of %s in %.0fs", athlete, interval)
+            heapq.heappush(self._due, (now + interval, athlete))
+        return max(0.0, self._due[0][0] - now) if self._due else self.max_interval
+
+    def stats(self) -> Dict[str, int]:
+        """Poll, sync and error counters."""
+        return dict(self._stats)
+
+    def run(self) -> None:
+        """Poll until stop() is called."""
+        while not self._stop.is_set():
+            self._stop.wait(self.tick())
+
+    def start(self) -> None:
+        """Poll in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="poll-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,152 @@
+"""Incrementally maintained power-duration curve across an athlete's rides."""
+
+import os
+import json
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Best-effort durations in seconds: 1s, 5s, 15s, 30s, 1, 2, 5, 10, 20, 30, 60, 90 min, 2 h
+DEFAULT_DURATIONS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 5400, 7200)
+
+
+def best_efforts(power_1hz: np.ndarray, durations: Sequence[int] = DEFAULT_DURATIONS) -> List[Optional[float]]:
+    """Maximal mean power for each duration.
+
+    One cumulative sum serves all durations; each duration is then a
+    vectorized difference of shifted sums, O(n) per duration.
+
+    Args:
+        power_1hz: Power samples on a 1 Hz grid
+        durations: Durations in seconds
+
+    Returns:
+        Best mean power per duration (None where the ride is shorter)
+    """
+    sums = np.cumsum(np.concatenate(([0.0], np.asarray(power_1hz, dtype=np.float64))))
+    efforts: List[Optional[float]] = []
+    for duration in durations:
+        if duration > len(power_1hz):
+            efforts.append(None)
+            continue
+        efforts.append(round(float(np.max(sums[duration:] - sums[:-duration]) / duration), 1))
+    return efforts
+
+
+def format_duration(seconds: int) -> str:
+    """Short label of a duration, e.g. "5s", "20min" or "2h"."""
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600 or seconds % 3600:
+        return f"{seconds // 60}min"
+    return f"{seconds // 3600}h"
+
+
+class PowerCurveIndex:
+    """Best efforts of every processed ride, persisted to a JSON file.
+
+    Each ride adds one row of best efforts keyed by its start time, so
+    re-processing a ride replaces its row instead of counting it twice.
+    The all-time curve is kept up to date as rows are added; curves of a
+    time window are a maximum over the rows in that window.
+    """
+
+    def __init__(self, index_path: Optional[str] = None, durations: Sequence[int] = DEFAULT_DURATIONS):
+        """Initialize PowerCurveIndex and load the persisted efforts.
+
+        Args:
+            index_path: JSON file the index is stored in; None keeps it in memory only
+            durations: Best-effort durations in seconds
+        """
+        self.index_path = index_path
+        self.durations = tuple(durations)
+        self.logger = logging.getLogger(__name__)
+        self._rides: Dict[int, List[Optional[float]]] = {}
+        self._all_time: Dict[int, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+        if index_path and os.path.exists(index_path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._rides)
+
+    def add(self, start_time: int, power_1hz: np.ndarray) -> List[Optional[float]]:
+        """Add the best efforts of a ride and persist the index.
+
+        Args:
+            start_time: Start of the ride as epoch seconds (identifies the ride)
+            power_1hz: Power samples of the ride on a 1 Hz grid
+
+        Returns:
+            The ride's best efforts, aligned with durations
+        """
+        efforts = best_efforts(power_1hz, self.durations)
+        with self._lock:
+            replaced = start_time in self._rides
+            self._rides[start_time] = efforts
+            if replaced:
+                self._all_time = self._best(self._rides.items())
+            else:
+                self._merge(self._all_time, start_time, efforts)
+            self._save()
+        return efforts
+
+    def curve(self, since: Optional[int] = None, until: Optional[int] = None) -> Dict[int, Tuple[float, int]]:
+        """Best effort per duration over the rides in a time window.
+
+        Args:
+            since: Only rides started at or after this epoch second
+            until: Only rides started before this epoch second
+
+        Returns:
+            Per duration, the best mean power and the start time of the ride
+            it was set in (durations no ride reached are left out)
+        """
+        with self._lock:
+            if since is None and until is None:
+                return dict(self._all_time)
+            rides = [(start, efforts) for start, efforts in self._rides.items()
+                     if (since is None or start >= since) and (until is None or start < until)]
+            return self._best(rides)
+
+    def summary(self, since: Optional[int] = None) -> str:
+        """One-line curve for the run log, e.g. "5s 900 W, 1min 520 W"."""
+        curve = self.curve(since)
+        return ", ".join(f"{format_duration(duration)} {curve[duration][0]:.0f} W"
+                         for duration in self.durations if duration in curve)
+
+    def _best(self, rides: Iterable[Tuple[int, List[Optional[float]]]]) -> Dict[int, Tuple[float, int]]:
+        best: Dict[int, Tuple[float, int]] = {}
+        for start, efforts in rides:
+            self._merge(best, start, efforts)
+        return best
+
+    def _merge(self, best: Dict[int, Tuple[float, int]], start: int, efforts: List[Optional[float]]) -> None:
+        for duration, watts in zip(self.durations, efforts):
+            if watts is not None and (duration not in best or watts > best[duration][0]):
+                best[duration] = (watts, start)
+
+    def _load(self) -> None:
+        """Load the efforts from the index file."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if tuple(data["durations"]) != self.durations:
+                raise ValueError("different durations, the curve is rebuilt from new rides")
+            self._rides = {int(start): efforts for start, efforts in data["rides"].items()}
+            self._all_time = self._best(self._rides.items())
+            self.logger.info("Loaded the power curve of %s rides from %s", len(self), self.index_path)
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            self.logger.warning("Ignoring unreadable power curve index %s: %s", self.index_path, e)
+
+    def _save(self) -> None:
+        """Write the index file atomically."""
+        if not self.index_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"durations": list(self.durations), "rides": self._rides}, f)
+        os.replace(temp_path, self.index_path)
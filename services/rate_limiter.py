@@ -0,0 +1,134 @@
+"""Token-bucket rate limiting of API requests, keyed by host."""
+
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+
+@dataclass
+class RateLimit:
+    """Sustained request rate and burst size of one host.
+
+    Attributes:
+        rate: Requests per second that the host tolerates over time
+        burst: Requests that may be sent back to back after an idle period
+    """
+
+    rate: float
+    burst: int = 1
+
+
+# Conservative limits of the APIs this tool talks to; a host matches its own
+# entry or the entry of a parent domain (bucket.s3.amazonaws.com -> s3.amazonaws.com)
+DEFAULT_LIMITS: Dict[str, RateLimit] = {
+    "us-or-rly101.zwift.com": RateLimit(rate=2.0, burst=5),
+    "s3.amazonaws.com": RateLimit(rate=10.0, burst=20),
+    "runalyze.com": RateLimit(rate=1.0, burst=3),
+    "connectapi.garmin.com": RateLimit(rate=1.0, burst=3),
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    Callers reserve a token and sleep outside the lock until it becomes
+    available, so concurrent callers are served in arrival order at the
+    sustained rate instead of racing for refilled tokens.
+    """
+
+    def __init__(self, limit: RateLimit, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """Initialize a full TokenBucket.
+
+        Args:
+            limit: Rate and burst size
+            clock: Monotonic time source
+            sleep: Sleep function (injectable for tests)
+        """
+        self.limit = limit
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(limit.burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, waiting until it is available.
+
+        Returns:
+            Seconds waited
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.limit.burst, self._tokens + (now - self._updated) * self.limit.rate)
+            self._updated = now
+            # Tokens may go negative: each waiting caller has reserved its slot
+            self._tokens -= 1
+            wait = -self._tokens / self.limit.rate if self._tokens < 0 else 0.0
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """Request rate limiter shared by all services (and athletes) of a process."""
+
+    def __init__(self, limits: Optional[Dict[str, RateLimit]] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """Initialize RateLimiter.
+
+        Args:
+            limits: Rate limit per host (defaults to DEFAULT_LIMITS); requests
+                to hosts without a limit are not throttled
+            clock: Monotonic time source
+            sleep: Sleep function (injectable for tests)
+        """
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._waits: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _limit_key(self, host: str) -> Optional[str]:
+        """Limit entry of a host: the host itself or its closest parent domain."""
+        parts = host.lower().split(".")
+        for i in range(len(parts) - 1):
+            key = ".".join(parts[i:])
+            if key in self.limits:
+                return key
+        return None
+
+    def acquire(self, host: str) -> float:
+        """Wait until a request to host is allowed.
+
+        Args:
+            host: Host name the request goes to
+
+        Returns:
+            Seconds waited
+        """
+        key = self._limit_key(host)
+        if key is None:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.limits[key], self._clock, self._sleep)
+        wait = bucket.acquire()
+        with self._lock:
+            count, total = self._waits.get(key, (0, 0.0))
+            self._waits[key] = (count + 1, total + wait)
+        if wait:
+            self.logger.debug("Throttled request to %s for %.2fs", host, wait)
+        return wait
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Requests and total throttling time per rate-limited host."""
+        with self._lock:
+            return {key: {"requests": count, "wait_seconds": round(total, 3)}
+                    for key, (count, total) in self._waits.items()}
@@ -0,0 +1,297 @@
+"""Retries with jittered exponential backoff and per-endpoint circuit breakers."""
+
+import re
+import sys
+import time
+import random
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Optional
+
+_STATUS_PREFIX = re.compile(r"^(\d{3}) - ")
+
+
+def status_code_of(error: Optional[BaseException]) -> Optional[int]:
+    """HTTP status code carried by a request error, if any.
+
+    Understands requests' HTTPError, garth's wrapped errors and zwift-client's
+    "<status> - <reason>" exceptions.
+    """
+    # requests.Response is falsy for 4xx/5xx, so compare against None explicitly
+    response = getattr(getattr(error, "error", None), "response", None)
+    if response is None:
+        response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None and error is not None:
+        match = _STATUS_PREFIX.match(str(error))
+        status = int(match.group(1)) if match else None
+    return status
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Check whether an error is worth retrying.
+
+    Connection errors, timeouts, HTTP 429 and 5xx responses are transient;
+    everything else (bad credentials, invalid files, ...) is not.
+    """
+    # requests is only checked if something already imported it
+    requests = sys.modules.get("requests")
+    if requests and isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    status = status_code_of(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is short-circuited because the endpoint is failing."""
+
+
+@dataclass
+class RetryPolicy:
+    """Retry budget of one endpoint.
+
+    Attributes:
+        max_attempts: Attempts per call, including the first one
+        base_delay: Backoff before the first retry in seconds, doubled per retry
+        max_delay: Upper bound of the backoff in seconds
+        retry_ratio: Retries allowed per call across the run, so a failing
+            endpoint cannot multiply the request volume
+        min_retries: Retries always allowed regardless of the ratio
+        failure_threshold: Consecutive failures that open the circuit
+        reset_timeout: Seconds the circuit stays open before a trial call
+    """
+
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    retry_ratio: float = 0.5
+    min_retries: int = 3
+    failure_threshold: int = 5
+    reset_timeout: float = 60.0
+
+
+@dataclass
+class EndpointMetrics:
+    """Counters of one endpoint."""
+
+    calls: int = 0
+    successes: int = 0
+    failures: int = 0
+    retries: int = 0
+    short_circuits: int = 0
+    backoff_seconds: float = 0.0
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed, open, half-open)."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float,
+                 clock: Callable[[], float] = time.monotonic):
+        """Initialize CircuitBreaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds before an open circuit lets a trial call through
+            clock: Monotonic time source
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Current state of the circuit."""
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Check whether a call may proceed; half-open admits one trial call."""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        """Count a failed call, opening the circuit at the threshold."""
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+
+# Budgets for the endpoints used by the services; others use RetryPolicy()
+DEFAULT_POLICIES: Dict[str, RetryPolicy] = {
+    "zwift.activities": RetryPolicy(max_attempts=4, base_delay=1.0),
+    "zwift.s3": RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=10.0),
+    "runalyze.upload": RetryPolicy(max_attempts=4, base_delay=2.0),
+    "runalyze.activities": RetryPolicy(max_attempts=2, base_delay=1.0),
+    "garmin.upload": RetryPolicy(max_attempts=6, base_delay=2.0, max_delay=60.0, failure_threshold=8),
+}
+
+
+class Retrier:
+    """Shared retry and circuit-breaker component, keyed by endpoint.
+
+    One instance is shared by all services of a run so that the budgets,
+    breakers and metrics of an endpoint (e.g. "runalyze.upload") are global.
+    """
+
+    def __init__(self, policies: Optional[Dict[str, RetryPolicy]] = None,
+                 default_policy: Optional[RetryPolicy] = None,
+                 sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic,
+                 jitter: Callable[[float, float], float] = random.uniform):
+        """Initialize Retrier.
+
+        Args:
+            policies: Retry policy per endpoint name (defaults to DEFAULT_POLICIES)
+            default_policy: Policy for endpoints without their own
+            sleep: Sleep function (injectable for tests)
+            clock: Monotonic time source for the circuit breakers
+            jitter: Random source for the backoff, called with (0, delay)
+        """
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.default_policy = default_policy or RetryPolicy()
+        self._sleep = sleep
+        self._clock = clock
+        self._jitter = jitter
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._metrics: Dict[str, EndpointMetrics] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def policy(self, endpoint: str) -> RetryPolicy:
+        """Retry policy of an endpoint."""
+        return self.policies.get(endpoint, self.default_policy)
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        """Circuit breaker of an endpoint, created on first use."""
+        with self._lock:
+            if endpoint not in self._breakers:
+                policy = self.policy(endpoint)
+                self._breakers[endpoint] = CircuitBreaker(policy.failure_threshold, policy.reset_timeout,
+                                                          self._clock)
+                self._metrics[endpoint] = EndpointMetrics()
+            return self._breakers[endpoint]
+
+    def call(self, endpoint: str, fn: Callable[..., Any], *args,
+             is_retryable: Callable[[BaseException], bool] = is_transient_error,
+             retry_result: Optional[Callable[[Any], bool]] = None, **kwargs) -> Any:
+        """Call fn with retries and circuit breaking.
+
+        Args:
+            endpoint: Endpoint name the budget, breaker and metrics are keyed by
+            fn: Function performing the request
+            *args: Positional arguments for fn
+            is_retryable: Decides whether a raised exception is retried
+            retry_result: Decides whether a returned value is a transient
+                failure (for services that report errors as results)
+            **kwargs: Keyword arguments for fn
+
+        Returns:
+            The return value of fn (the last one if all attempts failed
+            with a retryable result)
+
+        Raises:
+            CircuitOpenError: If the endpoint's circuit is open
+            Exception: The last exception raised by fn
+        """
+        policy = self.policy(endpoint)
+        breaker = self.breaker(endpoint)
+        metrics = self._metrics[endpoint]
+        with self._lock:
+            metrics.calls += 1
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                with self._lock:
+                    metrics.short_circuits += 1
+                raise CircuitOpenError(f"Circuit for {endpoint} is open, skipping call")
+
+            attempt += 1
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                transient = is_retryable(e)
+                if transient:
+                    breaker.record_failure()
+                else:
+                    # The endpoint answered; the request itself was bad
+                    breaker.record_success()
+                if not transient or not self._may_retry(endpoint, policy, attempt):
+                    with self._lock:
+                        metrics.failures += 1
+                    raise
+                self._backoff(endpoint, policy, attempt, e)
+                continue
+
+            if retry_result is not None and retry_result(result):
+                breaker.record_failure()
+                if not self._may_retry(endpoint, policy, attempt):
+                    with self._lock:
+                        metrics.failures += 1
+                    return result
+                self._backoff(endpoint, policy, attempt, result)
+                continue
+
+            breaker.record_success()
+            with self._lock:
+                metrics.successes += 1
+            return result
+
+    def _may_retry(self, endpoint: str, policy: RetryPolicy, attempt: int) -> bool:
+        """Check the per-call attempt limit and the endpoint's retry budget."""
+        if attempt >= policy.max_attempts:
+            return False
+        metrics = self._metrics[endpoint]
+        with self._lock:
+            if metrics.retries >= policy.min_retries + policy.retry_ratio * metrics.calls:
+                self.logger.warning("Retry budget of %s exhausted", endpoint)
+                return False
+            metrics.retries += 1
+            return True
+
+    def _backoff(self, endpoint: str, policy: RetryPolicy, attempt: int, reason: Any) -> None:
+        """Sleep a jittered exponential delay before the next attempt."""
+        delay = self._jitter(0, min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1)))
+        with self._lock:
+            self._metrics[endpoint].backoff_seconds += delay
+        self.logger.warning("%s attempt %s failed (%s), retrying in %.2fs", endpoint, attempt, reason, delay)
+        self._sleep(delay)
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Counters and circuit state per endpoint."""
+        with self._lock:
+            snapshot = {endpoint: asdict(metrics) for endpoint, metrics in self._metrics.items()}
+        for endpoint, values in snapshot.items():
+            values["circuit"] = self._breakers[endpoint].state
+        return snapshot
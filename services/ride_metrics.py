@@ -0,0 +1,253 @@
+"""Ride summary metrics (NP, IF, TSS, zones, decoupling) computed with numpy."""
+
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.fit_encoder import FIT_EPOCH_OFFSET, RECORD, MessageDefinition, iter_messages
+
+# A sample counts until the next one, but at most this long (pauses are not ridden time)
+MAX_SAMPLE_GAP_S = 5
+NP_WINDOW_S = 30
+# Coggan power zones as fractions of FTP (zone 1 below 55%, zone 7 above 150%)
+POWER_ZONE_BOUNDS = (0.55, 0.75, 0.90, 1.05, 1.20, 1.50)
+# Heart rate zones as fractions of the maximum heart rate
+HR_ZONE_BOUNDS = (0.60, 0.70, 0.80, 0.90)
+
+STREAM_FIELDS = ("power", "heart_rate", "cadence", "speed")
+
+
+@dataclass
+class RideMetrics:
+    """Summary of one ride.
+
+    Attributes:
+        duration: Ridden time in seconds (pauses excluded)
+        average_power: Time-weighted mean power in watts
+        normalized_power: 4th-power mean of the 30 s rolling power, or None
+            for rides shorter than 30 s
+        intensity_factor: Normalized power / FTP
+        tss: Training stress score
+        average_heart_rate: Time-weighted mean heart rate, or None without HR
+        power_zones: Seconds in each power zone (7 zones)
+        hr_zones: Seconds in each heart rate zone (5 zones), empty without HR
+            or maximum heart rate
+        decoupling: Aerobic (Pw:HR) decoupling between the halves in percent
+    """
+
+    duration: int
+    average_power: float
+    normalized_power: Optional[float] = None
+    intensity_factor: Optional[float] = None
+    tss: Optional[float] = None
+    average_heart_rate: Optional[float] = None
+    power_zones: List[int] = field(default_factory=list)
+    hr_zones: List[int] = field(default_factory=list)
+    decoupling: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Metrics as a JSON-serializable dict."""
+        return asdict(self)
+
+    def summary(self) -> str:
+        """One-line summary for the run log."""
+        parts = [f"{self.duration // 60} min", f"avg {self.average_power:.0f} W"]
+        if self.normalized_power is not None:
+            parts.append(f"NP {self.normalized_power:.0f} W")
+        if self.intensity_factor is not None:
+            parts.append(f"IF {self.intensity_factor:.2f}")
+        if self.tss is not None:
+            parts.append(f"TSS {self.tss:.0f}")
+        if self.decoupling is not None:
+            parts.append(f"decoupling {self.decoupling:.1f}%")
+        return ", ".join(parts)
+
+
+def read_streams(fit_file_path: str) -> Dict[str, np.ndarray]:
+    """Read the record messages of a FIT file into columnar arrays.
+
+    The messages are walked without decoding them; the record messages of
+    each definition are then gathered into a structured array (the
+    definition's numpy dtype), so every column is converted in one
+    operation instead of per record.
+
+    Args:
+        fit_file_path: Path to the FIT file
+
+    Returns:
+        "timestamp" (epoch seconds) plus one float array per STREAM_FIELDS
+        entry; missing values are NaN. Records without a timestamp are
+        left out.
+
+    Raises:
+        OSError: If the file cannot be read
+        ValueError: If the file is not a valid FIT file
+    """
+    with open(fit_file_path, "rb") as f:
+        data = f.read()
+    records: Dict[int, Tuple[MessageDefinition, List[int]]] = {}
+    compressed: Dict[int, int] = {}
+    stamped: Dict[int, bool] = {}
+    last_stamped, last_timestamp = None, None
+    for message in iter_messages(data):
+        if message.is_definition:
+            continue
+        definition = message.definition
+        if data[message.offset] & 0x80:
+            # Compressed timestamp header: 5 bits of the time after the last full timestamp
+            if last_timestamp is None and last_stamped is not None:
+                last_timestamp = last_stamped.definition.decode(last_stamped.body(data)).get("timestamp")
+            if last_timestamp is not None:
+                last_timestamp += ((data[message.offset] & 0x1F) - last_timestamp) & 0x1F
+                compressed[message.offset] = last_timestamp
+        else:
+            if id(definition) not in stamped:
+                stamped[id(definition)] = any(field.number == 253 for field in definition.fields)
+            if stamped[id(definition)]:
+                last_stamped, last_timestamp = message, None
+        if definition.global_number == RECORD:
+            records.setdefault(id(definition), (definition, []))[1].append(message.offset)
+
+    raw = np.frombuffer(data, dtype=np.uint8)
+    offsets, columns = [], {name: [] for name in ("timestamp",) + STREAM_FIELDS}
+    for definition, message_offsets in records.values():
+        dtype = definition.numpy_dtype()
+        starts = np.asarray(message_offsets, dtype=np.int64)
+        rows = raw[starts[:, None] + np.arange(dtype.itemsize)].view(dtype)[:, 0]
+        offsets.append(starts)
+        for name, column in columns.items():
+            column.append(_column(definition, rows, name))
+        if compressed:
+            timestamps = columns["timestamp"][-1]
+            for i, start in enumerate(message_offsets):
+                if start in compressed:
+                    timestamps[i] = compressed[start] + FIT_EPOCH_OFFSET
+    if not offsets:
+        return {name: np.zeros(0) for name in columns}
+
+    order = np.argsort(np.concatenate(offsets), kind="stable")
+    streams = {name: np.concatenate(column)[order] for name, column in columns.items()}
+    timed = ~np.isnan(streams["timestamp"])
+    return {name: values[timed] for name, values in streams.items()}
+
+
+def _column(definition: MessageDefinition, rows: np.ndarray, name: str) -> np.ndarray:
+    """One field of decoded record rows in physical units, NaN where invalid or missing."""
+    field = next((field for field in definition.fields if field.name == name), None)
+    if field is None or field.format.endswith("s"):
+        return np.full(len(rows), np.nan)
+    values = rows[name].astype(np.float64)
+    values[rows[name] == field.invalid] = np.nan
+    if field.scale != 1 or field.offset:
+        values = values / field.scale - field.offset
+    if name == "timestamp":
+        values += FIT_EPOCH_OFFSET
+    return values
+
+
+def sample_seconds(timestamps: np.ndarray) -> np.ndarray:
+    """Seconds each sample counts for: until the next one, capped at MAX_SAMPLE_GAP_S."""
+    gaps = np.diff(timestamps, append=timestamps[-1] + 1) if len(timestamps) else np.zeros(0)
+    return np.clip(np.rint(gaps), 0, MAX_SAMPLE_GAP_S).astype(np.int64)
+
+
+def resample_power(streams: Dict[str, np.ndarray]) -> np.ndarray:
+    """Power on a 1 Hz grid; missing power counts as coasting (0 W)."""
+    return np.repeat(np.nan_to_num(streams["power"], nan=0.0), sample_seconds(streams["timestamp"]))
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing rolling mean over full windows, via cumulative sums."""
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    return (sums[window:] - sums[:-window]) / window
+
+
+def zone_times(values: np.ndarray, weights: np.ndarray, bounds: np.ndarray) -> List[int]:
+    """Seconds spent in each zone delimited by bounds."""
+    zones = np.bincount(np.searchsorted(bounds, values, side="right"), weights=weights, minlength=len(bounds) + 1)
+    return [int(round(seconds)) for seconds in zones]
+
+
+def compute_metrics(streams: Dict[str, np.ndarray], ftp: Optional[float] = None,
+                    max_hr: Optional[float] = None) -> Optional[RideMetrics]:
+    """Compute the summary metrics of a ride from its record streams.
+
+    Samples are expanded onto a 1 Hz grid (each sample repeated for the
+    seconds until the next one, capped at MAX_SAMPLE_GAP_S), so the result
+    does not depend on the recording interval.
+
+    Args:
+        streams: Columnar record data, see read_streams
+        ftp: Functional threshold power in watts; needed for IF, TSS and
+            the power zones
+        max_hr: Maximum heart rate; needed for the heart rate zones
+
+    Returns:
+        The metrics, or None if the ride has no samples
+    """
+    timestamps = streams["timestamp"]
+    if len(timestamps) == 0:
+        return None
+    seconds = sample_seconds(timestamps)
+    # Missing power is coasting
+    power = np.nan_to_num(streams["power"], nan=0.0)
+    power_1hz = np.repeat(power, seconds)
+    duration = len(power_1hz)
+    if duration == 0:
+        return None
+
+    metrics = RideMetrics(duration=duration, average_power=round(float(power_1hz.mean()), 1))
+    if duration >= NP_WINDOW_S:
+        metrics.normalized_power = round(float(np.mean(rolling_mean(power_1hz, NP_WINDOW_S) ** 4) ** 0.25), 1)
+    if ftp:
+        metrics.power_zones = zone_times(power, seconds, np.asarray(POWER_ZONE_BOUNDS) * ftp)
+        if metrics.normalized_power is not None:
+            intensity = metrics.normalized_power / ftp
+            metrics.intensity_factor = round(intensity, 3)
+            metrics.tss = round(duration * metrics.normalized_power * intensity / (ftp * 3600) * 100, 1)
+
+    heart_rate = streams.get("heart_rate")
+    if heart_rate is not None:
+        heart_rate_1hz = np.repeat(np.nan_to_num(heart_rate, nan=0.0), seconds)
+        has_hr = heart_rate_1hz > 0
+        if has_hr.any():
+            metrics.average_heart_rate = round(float(heart_rate_1hz[has_hr].mean()), 1)
+            if max_hr:
+                metrics.hr_zones = zone_times(heart_rate_1hz[has_hr], np.ones(int(has_hr.sum())),
+                                              np.asarray(HR_ZONE_BOUNDS) * max_hr)
+            metrics.decoupling = _decoupling(power_1hz[has_hr], heart_rate_1hz[has_hr])
+    return metrics
+
+
+def _decoupling(power_1hz: np.ndarray, heart_rate_1hz: np.ndarray) -> Optional[float]:
+    """Pw:HR decoupling: drop of the power to heart rate ratio from the first to the second half."""
+    half = len(power_1hz) // 2
+    if half < NP_WINDOW_S:
+        return None
+    first = power_1hz[:half].mean() / heart_rate_1hz[:half].mean()
+    second = power_1hz[half:].mean() / heart_rate_1hz[half:].mean()
+    if first == 0:
+        return None
+    return round(float((first - second) / first * 100), 2)
+
+
+def ride_metrics_from_fit(fit_file_path: str, ftp: Optional[float] = None,
+                          max_hr: Optional[float] = None) -> Optional[RideMetrics]:
+    """Read a FIT file and compute its ride metrics.
+
+    Args:
+        fit_file_path: Path to the FIT file
+        ftp: Functional threshold power in watts
+        max_hr: Maximum heart rate
+
+    Returns:
+        The metrics, or None if the file has no usable records
+    """
+    try:
+        streams = read_streams(fit_file_path)
+    except (OSError, ValueError) as e:
+        logging.getLogger(__name__).warning("Cannot compute metrics of %s: %s", fit_file_path, e)
+        return None
+    return compute_metrics(streams, ftp, max_hr)
@@ -0,0 +1,299 @@
+"""Profiling of a sync run: per-stage timings, top functions and peak memory."""
+
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import functools
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+CPROFILE = "cprofile"
+SAMPLING = "sampling"
+DEFAULT_SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 10
+# From Python 3.12 cProfile runs on sys.monitoring: one profiler sees every
+# thread, and a second one cannot be enabled while it runs
+_PROFILER_PER_THREAD = sys.version_info < (3, 12)
+
+
+@dataclass
+class StageStats:
+    """Accumulated cost of one pipeline stage.
+
+    Attributes:
+        calls: Number of calls
+        wall: Wall time in seconds, summed over calls (concurrent calls
+            add up, so this can exceed the run time)
+        cpu: CPU time of the calling threads in seconds (work done in
+            worker processes is not included)
+        bytes: Bytes downloaded, transformed or uploaded
+    """
+
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    bytes: int = 0
+
+
+def _file_size(path: Any) -> int:
+    return os.path.getsize(path) if isinstance(path, str) and os.path.exists(path) else 0
+
+
+def _total_file_size(paths: Any) -> int:
+    return sum(_file_size(path) for path in paths or ())
+
+
+def _bytes_sent(results: Any) -> int:
+    return sum(getattr(result, "bytes_sent", 0) for result in (results or {}).values())
+
+
+class _Sampler:
+    """Statistical profiler sampling the stacks of all threads at an interval."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = 0
+        self.own: Counter = Counter()
+        self.total: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.samples += 1
+                self.own[self._key(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    key = self._key(frame)
+                    if key not in seen:
+                        seen.add(key)
+                        self.total[key] += 1
+                    frame = frame.f_back
+
+    @staticmethod
+    def _key(frame) -> Tuple[str, int, str]:
+        code = frame.f_code
+        return code.co_filename, code.co_firstlineno, code.co_name
+
+    def report(self, top: int) -> str:
+        lines = [f"{'total s':>9} {'own s':>9}  function ({self.samples} samples, {self.interval * 1000:g} ms interval)"]
+        for key, count in self.total.most_common(top):
+            filename, line, name = key
+            lines.append(f"{count * self.interval:9.3f} {self.own[key] * self.interval:9.3f}  "
+                         f"{name} ({filename}:{line})")
+        return "\n".join(lines)
+
+
+class RunProfiler:
+    """Profiles one run and writes a report of where its time and memory went.
+
+    Stages are measured by wrapping service methods of the instances the
+    run uses (see instrument), so the services themselves stay unaware of
+    profiling. Function-level detail comes from cProfile (covering every
+    thread started during the run) or from a sampling profiler with lower
+    overhead; tracemalloc tracks the peak memory and its allocation sites.
+    """
+
+    def __init__(self, report_dir: str, mode: str = CPROFILE, trace_memory: bool = True,
+                 sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """Initialize RunProfiler.
+
+        Args:
+            report_dir: Directory the report is written to
+            mode: CPROFILE for deterministic profiling, SAMPLING for a
+                statistical profile of all threads
+            trace_memory: Track the peak memory with tracemalloc
+            sample_interval: Seconds between stack samples in SAMPLING mode
+
+        Raises:
+            ValueError: If the mode is unknown
+        """
+        if mode not in (CPROFILE, SAMPLING):
+            raise ValueError(f"Unknown profiler mode: {mode}")
+        self.report_dir = os.path.expanduser(report_dir)
+        self.mode = mode
+        self.trace_memory = trace_memory
+        self.sample_interval = sample_interval
+        self.stages: Dict[str, StageStats] = {}
+        self.report_path: Optional[str] = None
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._active = threading.local()
+        self._profiles: List[cProfile.Profile] = []
+        self._sampler: Optional[_Sampler] = None
+        self._started = self._started_cpu = 0.0
+        self._wall = self._cpu = 0.0
+        self._peak_memory = 0
+        self._allocations: List[Any] = []
+
+    def instrument(self, target: Any, method_name: str, stage: str,
+                   bytes_of: Optional[Callable[[Tuple, Any], int]] = None) -> None:
+        """Measure the calls of a method of one object as a stage.
+
+        Calls made while the same stage is already running in the thread
+        (e.g. a batch method calling its single-item variant) are counted
+        once.
+
+        Args:
+            target: Object whose method is wrapped
+            method_name: Name of the method
+            stage: Stage name in the report
+            bytes_of: Computes the bytes moved from the call arguments and
+                the return value
+        """
+        method = getattr(target, method_name)
+
+        @functools.wraps(method)
+        def measured(*args, **kwargs):
+            active = self._active.__dict__.setdefault("stages", set())
+            if stage in active:
+                return method(*args, **kwargs)
+            active.add(stage)
+            started, started_cpu = time.perf_counter(), time.thread_time()
+            result = None
+            try:
+                result = method(*args, **kwargs)
+                return result
+            finally:
+                active.discard(stage)
+                moved = 0
+                if bytes_of is not None:
+                    try:
+                        moved = bytes_of(args, result)
+                    except (OSError, TypeError, AttributeError):
+                        pass
+                self._add(stage, time.perf_counter() - started, time.thread_time() - started_cpu, moved)
+
+        setattr(target, method_name, measured)
+
+    def instrument_processor(self, processor: Any) -> None:
+        """Instrument the stages of an ActivityProcessor and its services."""
+        zwift_service, fit_file_service = processor.zwift_service, processor.fit_file_service
+        self.instrument(zwift_service, "_get_activities", "zwift.list")
+        self.instrument(zwift_service, "download_activity", "zwift.download",
+                        lambda args, result: _file_size(result))
+        self.instrument(fit_file_service, "modify_device_info_batch", "fit.transform",
+                        lambda args, result: _total_file_size(args[0]))
+        self.instrument(fit_file_service, "merge_activities", "fit.merge",
+                        lambda args, result: _file_size(result))
+        self.instrument(processor, "_analyse_ride", "analyse", lambda args, result: _file_size(args[0]))
+        for destination in processor.destinations:
+            self.instrument(destination, "upload_batch", f"upload.{destination.name}",
+                            lambda args, result: _bytes_sent(result))
+
+    def _add(self, stage: str, wall: float, cpu: float, moved: int) -> None:
+        with self._lock:
+            stats = self.stages.setdefault(stage, StageStats())
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.bytes += moved
+
+    def __enter__(self) -> "RunProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Start profiling the current thread and the threads started from now on."""
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.mode == CPROFILE:
+            if _PROFILER_PER_THREAD:
+                threading.setprofile(self._profile_thread)
+            profile = cProfile.Profile()
+            self._profiles.append(profile)
+            profile.enable()
+        else:
+            self._sampler = _Sampler(self.sample_interval)
+            self._sampler.start()
+        self._started, self._started_cpu = time.perf_counter(), time.process_time()
+
+    def _profile_thread(self, *_) -> None:
+        """First profile event of a new thread: replace this hook by a profiler of the thread.
+
+        Only used before Python 3.12, where a cProfile profiler sees just the
+        thread that enabled it.
+        """
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def stop(self) -> str:
+        """Stop profiling and write the report.
+
+        Returns:
+            Path of the report
+        """
+        self._wall, self._cpu = time.perf_counter() - self._started, time.process_time() - self._started_cpu
+        if self.mode == CPROFILE:
+            if _PROFILER_PER_THREAD:
+                threading.setprofile(None)
+            self._profiles[0].disable()
+        else:
+            self._sampler.stop()
+        if self.trace_memory:
+            self._peak_memory = tracemalloc.get_traced_memory()[1]
+            self._allocations = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]
+            tracemalloc.stop()
+        return self._write_report()
+
+    def report(self) -> str:
+        """The report text of the stopped run."""
+        lines = [f"Run profile ({self.mode}), {datetime.now().isoformat(timespec='seconds')}",
+                 f"Wall time {self._wall:.3f} s, CPU time {self._cpu:.3f} s (this process)"]
+        if self.trace_memory:
+            lines.append(f"Peak traced memory {self._peak_memory / 1024 / 1024:.1f} MiB")
+
+        lines += ["", "Stages", f"{'stage':<24} {'calls':>6} {'wall s':>9} {'cpu s':>9} {'MiB':>9} {'MiB/s':>8}"]
+        for stage, stats in sorted(self.stages.items(), key=lambda item: -item[1].wall):
+            rate = stats.bytes / stats.wall / 1024 / 1024 if stats.wall else 0.0
+            lines.append(f"{stage:<24} {stats.calls:>6} {stats.wall:>9.3f} {stats.cpu:>9.3f} "
+                         f"{stats.bytes / 1024 / 1024:>9.2f} {rate:>8.2f}")
+
+        lines += ["", "Top functions"]
+        if self.mode == CPROFILE:
+            stream = io.StringIO()
+            with self._lock:
+                profiles = list(self._profiles)
+            stats = pstats.Stats(*profiles, stream=stream)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+            lines.append(stream.getvalue().strip())
+        else:
+            lines.append(self._sampler.report(TOP_FUNCTIONS))
+
+        if self._allocations:
+            lines += ["", "Top allocation sites (at the end of the run)"]
+            lines += [str(statistic) for statistic in self._allocations]
+        return "\n".join(lines) + "\n"
+
+    def _write_report(self) -> str:
+        os.makedirs(self.report_dir, exist_ok=True)
+        self.report_path = os.path.join(self.report_dir, f"profile-{datetime.now():%Y%m%d-%H%M%S}.txt")
+        with open(self.report_path, "w", encoding="utf-8") as f:
+            f.write(self.report())
+        self.logger.info("Run profile written to %s", self.report_path)
+        return self.report_path
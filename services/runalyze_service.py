@@ -1,55 +1,382 @@
 """Runalyze"""
 
+import io
 import logging
-import requests
 import os
+import time
+import zipfile
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from services import tracing
+from services.activity_index import ActivityFingerprint, ActivityIndex, fingerprint_from_fit
+from services.destination import Destination
+from services.rate_limiter import RateLimiter
+from services.retry import CircuitOpenError, Retrier
+from services.upload_result import UploadResult, UploadStatus
 
 RUNALYZE_API_URL = "https://runalyze.com/api/v1/activities/uploads"
+RUNALYZE_ACTIVITIES_URL = "https://runalyze.com/api/v1/activities"
+RUNALYZE_HOST = "runalyze.com"
+DEFAULT_MAX_ARCHIVE_BYTES = 8 * 1024 * 1024
+DEFAULT_MAX_ARCHIVE_FILES = 20
+# Seconds to connect and between received bytes; a stalled connection fails
+# the attempt so the retrier and circuit breaker see it
+REQUEST_TIMEOUT = 30
+UPLOAD_TIMEOUT = (10, 120)
+# Pages of the remote activity list read per run, newest first
+MAX_ACTIVITY_PAGES = 100
 
-class RunalyzeService:
-    """Service for interacting with Garmin Connect."""
 
-    def __init__(self, token: str):
+def _activity_id(data: Any) -> Optional[str]:
+    """Extract the activity id from a Runalyze upload response body."""
+    if isinstance(data, dict):
+        for key in ("activity_id", "activityId", "id"):
+            if data.get(key) is not None:
+                return str(data[key])
+    return None
+
+
+def _is_transient_response(response: Any) -> bool:
+    """Check whether a Runalyze response is a rate limit or server error."""
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def _fingerprint_from_remote(activity: Any) -> Optional[ActivityFingerprint]:
+    """Build a fingerprint from an activity listed by the Runalyze API.
+
+    Runalyze reports the start as epoch seconds ("time") or an ISO date,
+    the duration in seconds ("s") and the distance in kilometers.
+    """
+    if not isinstance(activity, dict):
+        return None
+    start = activity.get("time", activity.get("date_time", activity.get("start_time")))
+    duration = activity.get("s", activity.get("duration", activity.get("elapsed_time")))
+    distance_km = activity.get("distance")
+    try:
+        if isinstance(start, str):
+            start = datetime.fromisoformat(start.replace("Z", "+00:00")).timestamp()
+        return ActivityFingerprint(int(start), round(float(duration)), round(float(distance_km or 0) * 1000))
+    except (TypeError, ValueError):
+        return None
+
+
+class RunalyzeService(Destination):
+    """Service for interacting with Runalyze."""
+
+    name = "runalyze"
+
+    def __init__(self, token: str, index_path: Optional[str] = None, check_remote: bool = True,
+                 compress: bool = False, max_archive_bytes: int = DEFAULT_MAX_ARCHIVE_BYTES,
+                 max_archive_files: int = DEFAULT_MAX_ARCHIVE_FILES, retrier: Optional[Retrier] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
         """Initialize RunalyzeService with token.
 
         Args:
             token: Runalyze token
+            index_path: JSON file of fingerprints of already uploaded
+                activities; None keeps the index in memory for this run only
+            check_remote: Fetch the activities already on Runalyze once per
+                run and skip uploads that match one of them
+            compress: Upload zip archives instead of raw FIT files; batches
+                pack several rides into one archive per request
+            max_archive_bytes: Uncompressed size limit of one packed archive
+            max_archive_files: Number of rides per packed archive
+            retrier: Shared retry/circuit-breaker component for the API requests
+            rate_limiter: Shared per-host request rate limiter
         """
         self.token = token
         self.logger = logging.getLogger(__name__)
+        self.index = ActivityIndex(index_path)
+        self.check_remote = check_remote
+        self.compress = compress
+        self.max_archive_bytes = max_archive_bytes
+        self.max_archive_files = max_archive_files
+        self.retrier = retrier or Retrier()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._remote_fetched = False
         self.logger.info("RunalyzeService initialized successfully.")
-        self.session = requests.Session()
-        self.session.headers.update({"token":self.token})
+        self._session = None
+
+    @property
+    def session(self):
+        """HTTP session for the Runalyze API, created on first use."""
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            self._session.headers.update({"token":self.token})
+        return self._session
+
+
+    @tracing.traced("runalyze.upload", lambda self, file_path: {"fit.file": file_path})
+    def upload_file_to_runalyze(self, file_path:str) -> UploadResult:
+        """Upload a FIT file to Runalyze.
+
+        Args:
+            file_path: Path to the FIT file to upload
+
+        Returns:
+            Outcome of the upload; request errors are reported as a failed
+            result instead of being raised
 
+        Raises:
+            FileNotFoundError: If the input file doesn't exist
+        """
+        import requests
 
-    def upload_file_to_runalyze(self, file_path:str):
         if not os.path.exists(file_path):
-            raise FileNotFoundError()
-        
-        self.logger.info(f"Would upload file {file_path}")
-        #print(f"Would upload file {file_path}")
+            raise FileNotFoundError(f"FIT file not found: {file_path}")
+
+        fingerprint = fingerprint_from_fit(file_path)
+        if fingerprint and self.is_known(fingerprint):
+            return self._skipped(file_path)
+        if self.compress:
+            return self._upload_archive([file_path], {file_path: fingerprint})[file_path]
+
+        bytes_sent = os.path.getsize(file_path)
+        self.logger.info("Uploading file %s to Runalyze...", file_path)
+        started = time.monotonic()
 
         try:
             with open(file_path, 'rb') as f:
-                files = {
-                    'file': (os.path.basename(file_path), f, 'application/octet-stream')
-                }
-
-                print(f"Uploading file: {os.path.basename(file_path)}...")
-                
-                # 4. Make the POST request
-                response = self.session.post(RUNALYZE_API_URL, files=files)
-
-            # 5. Handle the response
-            if response.status_code == 201:
-                print("✅ Upload successful!")
-                # The response body should contain details about the uploaded activity
-                print("Response Data:", response.json())
+                body = f.read()
+            response = self._post(os.path.basename(file_path), body, 'application/octet-stream')
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            self.logger.error("Upload of %s failed: %s", file_path, e)
+            return UploadResult(file_path, self.name, UploadStatus.FAILED,
+                                latency=time.monotonic() - started, retryable=True, error=str(e))
+
+        result = self._result_from_response(file_path, response, time.monotonic() - started, bytes_sent)
+        tracing.current_span().set_attribute("upload.status", result.status.value)
+        if result.status is UploadStatus.FAILED:
+            self.logger.error("Upload of %s failed: %s", file_path, result.error)
+        else:
+            self.logger.info("Upload of %s finished: %s", file_path, result.status.value)
+            if fingerprint:
+                self.index.add(fingerprint)
+        return result
+
+    def upload_batch(self, fit_file_paths: List[str]) -> Dict[str, UploadResult]:
+        """Upload several FIT files to Runalyze (Destination interface).
+
+        With compression enabled, the files that are not known duplicates
+        are packed into zip archives of up to max_archive_files rides /
+        max_archive_bytes, and each archive is sent in a single request.
+
+        Args:
+            fit_file_paths: Paths to the FIT files to upload
+
+        Returns:
+            Mapping of file path to upload result, one entry per file
+        """
+        if not self.compress:
+            return super().upload_batch(fit_file_paths)
+
+        results: Dict[str, UploadResult] = {}
+        pending: Dict[str, Optional[ActivityFingerprint]] = {}
+        for file_path in fit_file_paths:
+            if not os.path.exists(file_path):
+                results[file_path] = UploadResult(file_path, self.name, UploadStatus.FAILED,
+                                                  error=f"FIT file not found: {file_path}")
+                continue
+            fingerprint = fingerprint_from_fit(file_path)
+            if fingerprint and self.is_known(fingerprint):
+                results[file_path] = self._skipped(file_path)
             else:
-                print(f"❌ Upload failed with status code {response.status_code}")
-                print("Error Response:", response.text)
+                pending[file_path] = fingerprint
+
+        for group in self._pack(list(pending)):
+            results.update(self._upload_archive(group, pending))
+        return {file_path: results[file_path] for file_path in fit_file_paths}
+
+    def _pack(self, file_paths: List[str]) -> List[List[str]]:
+        """Group files into archives within the configured size and count limits."""
+        groups: List[List[str]] = []
+        group_bytes = 0
+        for file_path in file_paths:
+            size = os.path.getsize(file_path)
+            if not groups or len(groups[-1]) >= self.max_archive_files \
+                    or group_bytes + size > self.max_archive_bytes:
+                groups.append([])
+                group_bytes = 0
+            groups[-1].append(file_path)
+            group_bytes += size
+        return groups
+
+    @tracing.traced("runalyze.upload_archive", lambda self, file_paths, fingerprints: {
+        "fit.files": len(file_paths), "activity.ids": tracing.activity_ids(file_paths)})
+    def _upload_archive(self, file_paths: List[str],
+                        fingerprints: Dict[str, Optional[ActivityFingerprint]]) -> Dict[str, UploadResult]:
+        """Upload files as one zip archive.
+
+        Runalyze answers once per request, so every file of the archive gets
+        that outcome; bytes_sent is each file's compressed share.
+
+        Args:
+            file_paths: Paths of the FIT files to pack
+            fingerprints: Fingerprints to index after a successful upload
+
+        Returns:
+            Mapping of file path to upload result
+        """
+        import requests
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for file_path in file_paths:
+                archive.write(file_path, arcname=os.path.basename(file_path))
+            compressed_sizes = {info.filename: info.compress_size for info in archive.infolist()}
+        body = buffer.getvalue()
+        raw_bytes = sum(os.path.getsize(file_path) for file_path in file_paths)
+        archive_name = os.path.splitext(os.path.basename(file_paths[0]))[0]
+        archive_name += ".zip" if len(file_paths) == 1 else f"_and_{len(file_paths) - 1}_more.zip"
+
+        tracing.current_span().set_attribute("upload.bytes", len(body))
+        self.logger.info("Uploading %s files to Runalyze as %s (%s of %s bytes)",
+                         len(file_paths), archive_name, len(body), raw_bytes)
+        started = time.monotonic()
+        try:
+            response = self._post(archive_name, body, 'application/zip')
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            self.logger.error("Upload of %s failed: %s", archive_name, e)
+            response, error = None, e
+        latency = time.monotonic() - started
+
+        results: Dict[str, UploadResult] = {}
+        for file_path in file_paths:
+            bytes_sent = compressed_sizes[os.path.basename(file_path)]
+            if response is None:
+                results[file_path] = UploadResult(file_path, self.name, UploadStatus.FAILED, latency=latency,
+                                                  retryable=True, error=str(error))
+                continue
+            result = self._result_from_response(file_path, response, latency, bytes_sent)
+            if len(file_paths) > 1:
+                result = replace(result, activity_id=None)
+            if result.ok and fingerprints.get(file_path):
+                self.index.add(fingerprints[file_path])
+            results[file_path] = result
+        if response is not None:
+            self.logger.info("Upload of %s finished: %s", archive_name, results[file_paths[0]].status.value)
+        return results
+
+    def _post(self, file_name: str, body: bytes, content_type: str):
+        """POST an upload, retrying connection errors, 429 and 5xx responses.
+
+        Returns:
+            The last response of the Runalyze API
+
+        Raises:
+            RequestException: If the last attempt failed without a response
+            CircuitOpenError: If Runalyze uploads keep failing
+        """
+        return self.retrier.call("runalyze.upload", self._request, "POST", RUNALYZE_API_URL,
+                                 files={'file': (file_name, body, content_type)},
+                                 timeout=UPLOAD_TIMEOUT, retry_result=_is_transient_response)
+
+    def _request(self, method: str, url: str, timeout: Any = REQUEST_TIMEOUT, **kwargs):
+        """Send one API request within the Runalyze rate limit."""
+        self.rate_limiter.acquire(RUNALYZE_HOST)
+        return self.session.request(method, url, timeout=timeout, **kwargs)
+
+    def _skipped(self, file_path: str) -> UploadResult:
+        """Result for a file that is skipped as a known duplicate."""
+        self.logger.info("Skipping %s: activity is already on Runalyze", file_path)
+        return UploadResult(file_path, self.name, UploadStatus.DUPLICATE, response="skipped: known activity")
+
+    def is_known(self, fingerprint: ActivityFingerprint) -> bool:
+        """Check whether an activity has already been uploaded to Runalyze.
+
+        Consults the local index and, on first use per run, the activity
+        list from the Runalyze API.
+
+        Args:
+            fingerprint: Fingerprint of the activity
+
+        Returns:
+            True if the activity is a known duplicate
+        """
+        if self.check_remote and not self._remote_fetched:
+            self._remote_fetched = True
+            self.index.update(self.fetch_remote_fingerprints())
+        return fingerprint in self.index
+
+    def fetch_remote_fingerprints(self) -> List[ActivityFingerprint]:
+        """Fetch fingerprints of the activities already stored on Runalyze.
+
+        The list is read page by page until an empty page, a page repeating
+        the previous one (an API ignoring the page parameter) or
+        MAX_ACTIVITY_PAGES pages; older activities are only known from the
+        local index. This is best effort: if the API does not offer the
+        activity list for the token, the local index alone is used.
+
+        Returns:
+            Fingerprints of the remote activities (empty if unavailable)
+        """
+        fingerprints: List[ActivityFingerprint] = []
+        previous = None
+        for page in range(1, MAX_ACTIVITY_PAGES + 1):
+            activities = self._fetch_activity_page(page)
+            if not activities or activities == previous:
+                break
+            fingerprints.extend(fp for fp in map(_fingerprint_from_remote, activities) if fp)
+            previous = activities
+        else:
+            self.logger.warning("Read the first %s pages of Runalyze activities only", MAX_ACTIVITY_PAGES)
+        self.logger.info("Found %s activities on Runalyze", len(fingerprints))
+        return fingerprints
+
+    def _fetch_activity_page(self, page: int) -> List[Any]:
+        """One page of the Runalyze activity list, empty if unavailable."""
+        import requests
 
-        except requests.exceptions.RequestException as e:
-            print(f"An error occurred during the request: {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
\ No newline at end of file
+        try:
+            response = self.retrier.call("runalyze.activities", self._request, "GET", RUNALYZE_ACTIVITIES_URL,
+                                         params={"page": page}, retry_result=_is_transient_response)
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            self.logger.warning("Cannot list Runalyze activities: %s", e)
+            return []
+        if response.status_code != 200:
+            self.logger.info("Runalyze activity list unavailable (HTTP %s), using the local index only",
+                             response.status_code)
+            return []
+        try:
+            data = response.json()
+        except ValueError:
+            return []
+        if isinstance(data, dict):
+            data = data.get("data", data.get("activities", []))
+        return data if isinstance(data, list) else []
+
+    def _result_from_response(self, file_path: str, response, latency: float,
+                              bytes_sent: int) -> UploadResult:
+        """Translate a Runalyze upload response into an UploadResult."""
+        text = response.text or ""
+        # Only an error response can be a rejected duplicate; a success body
+        # may well contain the word (e.g. in the activity name)
+        if response.status_code == 409 or (response.status_code == 400 and "duplicate" in text.lower()):
+            return UploadResult(file_path, self.name, UploadStatus.DUPLICATE, latency=latency,
+                                bytes_sent=bytes_sent, response=text)
+        if response.status_code in (200, 201):
+            try:
+                data = response.json()
+            except ValueError:
+                data = text
+            return UploadResult(file_path, self.name, UploadStatus.SUCCESS,
+                                activity_id=_activity_id(data), latency=latency,
+                                bytes_sent=bytes_sent, response=data)
+        return UploadResult(file_path, self.name, UploadStatus.FAILED, latency=latency,
+                            bytes_sent=bytes_sent,
+                            retryable=_is_transient_response(response),
+                            error=f"HTTP {response.status_code}: {text[:200]}", response=text)
+
+    def upload(self, fit_file_path: str) -> UploadResult:
+        """Upload a FIT file to Runalyze (Destination interface).
+
+        Args:
+            fit_file_path: Path to the FIT file to upload
+
+        Returns:
+            Outcome of the upload
+        """
+        return self.upload_file_to_runalyze(fit_file_path)
@@ -0,0 +1,226 @@
+"""Sharding of athletes across sync workers with consistent hashing and leases."""
+
+import os
+import time
+import bisect
+import hashlib
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    athlete TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def _hash(key: str) -> int:
+    """Stable 64-bit hash (Python's hash() differs between processes)."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping athletes to workers.
+
+    Each worker owns several virtual nodes, so when a worker joins or leaves
+    only about 1/N of the athletes move.
+    """
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 64):
+        """Initialize HashRing.
+
+        Args:
+            nodes: Worker ids
+            replicas: Virtual nodes per worker
+        """
+        self.nodes = sorted(set(nodes))
+        self._ring = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._keys = [key for key, _ in self._ring]
+
+    def node_for(self, key: str) -> Optional[str]:
+        """Worker responsible for a key, or None if the ring is empty."""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+class ShardCoordinator:
+    """Worker membership and athlete leases in a shared SQLite database.
+
+    Workers heartbeat into the database; the live workers form the hash
+    ring. An athlete is synced only under a lease, so two workers that
+    briefly disagree on the membership never sync the same athlete, and the
+    athletes of a dead worker are taken over once its heartbeat and leases
+    expire.
+    """
+
+    def __init__(self, db_path: str, worker_id: str, worker_timeout: float = 60.0,
+                 lease_ttl: float = 900.0, clock: Callable[[], float] = time.time):
+        """Initialize ShardCoordinator.
+
+        Args:
+            db_path: Path of the shared SQLite database
+            worker_id: Id of this worker
+            worker_timeout: Seconds without heartbeat after which a worker is dead
+            lease_ttl: Seconds an athlete lease lasts unless renewed
+            clock: Wall clock (epoch seconds), shared by all workers
+        """
+        self.db_path = db_path
+        self.worker_id = worker_id
+        self.worker_timeout = worker_timeout
+        self.lease_ttl = lease_ttl
+        self._clock = clock
+        self._local = threading.local()
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """SQLite connection of the calling thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def heartbeat(self) -> None:
+        """Register this worker as alive and renew its leases."""
+        now = self._clock()
+        connection = self._connection()
+        connection.execute("INSERT INTO workers (worker_id, heartbeat) VALUES (?, ?) "
+                           "ON CONFLICT (worker_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                           (self.worker_id, now))
+        connection.execute("UPDATE leases SET expires = ? WHERE owner = ? AND expires > ?",
+                           (now + self.lease_ttl, self.worker_id, now))
+
+    def leave(self) -> None:
+        """Deregister this worker and release its leases (clean shutdown)."""
+        connection = self._connection()
+        connection.execute("DELETE FROM leases WHERE owner = ?", (self.worker_id,))
+        connection.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+
+    def live_workers(self) -> List[str]:
+        """Ids of the workers with a recent heartbeat."""
+        rows = self._connection().execute("SELECT worker_id FROM workers WHERE heartbeat > ? ORDER BY worker_id",
+                                          (self._clock() - self.worker_timeout,)).fetchall()
+        return [row[0] for row in rows]
+
+    def assigned(self, athletes: Sequence[str]) -> List[str]:
+        """Athletes this worker is responsible for according to the hash ring.
+
+        Args:
+            athletes: All athlete ids
+
+        Returns:
+            The athletes mapped to this worker
+        """
+        ring = HashRing(set(self.live_workers()) | {self.worker_id})
+        return [athlete for athlete in athletes if ring.node_for(athlete) == self.worker_id]
+
+    def acquire(self, athlete: str) -> bool:
+        """Take the lease of an athlete if it is free, expired or already ours.
+
+        Args:
+            athlete: Athlete id
+
+        Returns:
+            True if this worker holds the lease
+        """
+        now = self._clock()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT owner, expires FROM leases WHERE athlete = ?", (athlete,)).fetchone()
+            acquired = row is None or row[0] == self.worker_id or row[1] <= now
+            if acquired:
+                connection.execute("INSERT OR REPLACE INTO leases (athlete, owner, expires) VALUES (?, ?, ?)",
+                                   (athlete, self.worker_id, now + self.lease_ttl))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return acquired
+
+    def release(self, athlete: str) -> None:
+        """Release the lease of an athlete held by this worker."""
+        self._connection().execute("DELETE FROM leases WHERE athlete = ? AND owner = ?", (athlete, self.worker_id))
+
+
+class ShardedWorker:
+    """Syncs the athletes a ShardCoordinator assigns to this worker."""
+
+    def __init__(self, coordinator: ShardCoordinator, athletes: Sequence[str],
+                 sync_athlete: Callable[[str], bool]):
+        """Initialize ShardedWorker.
+
+        Args:
+            coordinator: Coordinator shared with the other workers
+            athletes: All athlete ids
+            sync_athlete: Runs the sync of an athlete and returns its success
+        """
+        self.coordinator = coordinator
+        self.athletes = list(athletes)
+        self.sync_athlete = sync_athlete
+        self.logger = logging.getLogger(__name__)
+        self._stop = threading.Event()
+
+    def run_once(self) -> Dict[str, bool]:
+        """Sync every assigned athlete whose lease can be taken.
+
+        Returns:
+            Success per synced athlete
+        """
+        self.coordinator.heartbeat()
+        results: Dict[str, bool] = {}
+        for athlete in self.coordinator.assigned(self.athletes):
+            if not self.coordinator.acquire(athlete):
+                self.logger.info("Athlete %s is still leased by another worker", athlete)
+                continue
+            try:
+                results[athlete] = self.sync_athlete(athlete)
+            except Exception:
+                self.logger.exception("Sync of athlete %s failed", athlete)
+                results[athlete] = False
+            finally:
+                self.coordinator.release(athlete)
+            self.coordinator.heartbeat()
+        self.logger.info("Worker %s synced %s athletes", self.coordinator.worker_id, len(results))
+        return results
+
+    def run_forever(self, interval: float) -> None:
+        """Sync assigned athletes every interval seconds until stop() is called.
+
+        A background thread keeps the heartbeat (and the leases) alive
+        during long syncs.
+
+        Args:
+            interval: Seconds between sync rounds
+        """
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="shard-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            while not self._stop.is_set():
+                self.run_once()
+                self._stop.wait(interval)
+        finally:
+            self._stop.set()
+            heartbeat.join()
+            self.coordinator.leave()
+
+    def stop(self) -> None:
+        """Stop run_forever after the current round."""
+        self._stop.set()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.coordinator.worker_timeout / 3):
+            self.coordinator.heartbeat()
@@ -0,0 +1,388 @@
+"""Trace spans of the activity pipeline, exported as OTLP JSON to a local file."""
+
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+import functools
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+DEFAULT_SERVICE_NAME = "zwift-to-runalyze"
+SCOPE_NAME = "services.tracing"
+ACTIVITY_ID = "activity.id"
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+# Activity ids of the FIT files of the run (see link_file)
+_file_activities: Dict[str, str] = {}
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Attribute value in the OTLP JSON encoding (64-bit integers as strings)."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    """One timed operation of a trace.
+
+    Attributes:
+        name: Operation name, e.g. "zwift.download"
+        trace_id: 32 hex digits shared by all spans of a trace
+        span_id: 16 hex digits
+        parent_id: Span id of the parent, None for a root span
+        attributes: Span attributes; the activity id is inherited from the parent
+        start_ns: Start as epoch nanoseconds
+        end_ns: End as epoch nanoseconds (None while running)
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_ns", "end_ns",
+                 "status", "status_message", "events")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = STATUS_OK
+        self.status_message = ""
+        self.events: List[Dict[str, Any]] = []
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Set an attribute, e.g. a result known only at the end of the operation."""
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException) -> None:
+        """Mark the span as failed by an exception."""
+        self.status = STATUS_ERROR
+        self.status_message = str(error)
+        self.events.append({"timeUnixNano": str(time.time_ns()), "name": "exception",
+                            "attributes": _otlp_attributes({"exception.type": type(error).__name__,
+                                                            "exception.message": str(error)})})
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """The span in the OTLP JSON encoding."""
+        span = {"traceId": self.trace_id, "spanId": self.span_id, "name": self.name, "kind": SPAN_KIND_INTERNAL,
+                "startTimeUnixNano": str(self.start_ns), "endTimeUnixNano": str(self.end_ns),
+                "attributes": _otlp_attributes(self.attributes),
+                "status": {"code": self.status, "message": self.status_message}}
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = self.events
+        return span
+
+
+class _NoopSpan:
+    """Span handed out while tracing is off."""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_exception(self, error: BaseException) -> None:
+        pass
+
+
+class _NoopContext:
+    """Context manager of a span that is not recorded."""
+
+    _span = _NoopSpan()
+
+    def __enter__(self) -> _NoopSpan:
+        return self._span
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
+_NOOP = _NoopContext()
+
+
+class FileSpanExporter:
+    """Appends finished spans to a file, one OTLP JSON export request per line.
+
+    The lines have the format of the OpenTelemetry collector's file
+    exporter, so the collector's otlpjsonfile receiver (and tools reading
+    OTLP JSON) can load them. Spans are buffered and written in batches.
+    Spans ended in forked worker processes are dropped, as those processes
+    do not own the file.
+    """
+
+    def __init__(self, path: str, service_name: str = DEFAULT_SERVICE_NAME, batch_size: int = 64):
+        """Initialize FileSpanExporter and open the file for appending.
+
+        Args:
+            path: Trace file (JSON lines)
+            service_name: service.name resource attribute
+            batch_size: Spans per written line
+        """
+        self.path = os.path.expanduser(path)
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._spans: List[Dict[str, Any]] = []
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def export(self, span: Span) -> None:
+        """Buffer a finished span, writing the buffer once a batch is full."""
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            self._spans.append(span.to_otlp())
+            if len(self._spans) >= self.batch_size:
+                self._flush()
+
+    def _flush(self) -> None:
+        if not self._spans or self._file is None:
+            return
+        request = {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service_name,
+                                                         "process.pid": self._pid})},
+            "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": self._spans}],
+        }]}
+        self._file.write(json.dumps(request) + "\n")
+        self._file.flush()
+        self._spans = []
+
+    def shutdown(self) -> None:
+        """Write the buffered spans and close the file."""
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Tracer:
+    """Creates spans and hands finished ones to an exporter.
+
+    Used as a context manager, the tracer is installed process-wide (see
+    configure) and flushed on exit. The current span is tracked in a
+    context variable, so nested spans become children without passing
+    spans around. Work submitted to a
+    thread pool starts without the caller's context; wrap it with
+    propagate() to keep it in the caller's trace.
+    """
+
+    def __init__(self, exporter: FileSpanExporter):
+        """Initialize Tracer.
+
+        Args:
+            exporter: Receives every finished span
+        """
+        self.exporter = exporter
+
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> "_SpanContext":
+        """Context manager timing an operation as a child of the current span.
+
+        Args:
+            name: Operation name
+            attributes: Span attributes (None values are left out)
+
+        Returns:
+            Context manager yielding the Span
+        """
+        return _SpanContext(self, name, dict(attributes) if attributes else {})
+
+    def record(self, name: str, start_ns: int, end_ns: int, attributes: Optional[Dict[str, Any]] = None,
+               error: Optional[BaseException] = None) -> Span:
+        """Export an operation timed elsewhere (e.g. in a worker process) as a child of the current span.
+
+        Args:
+            name: Operation name
+            start_ns: Start as epoch nanoseconds
+            end_ns: End as epoch nanoseconds
+            attributes: Span attributes (None values are left out)
+            error: Exception the operation failed with
+
+        Returns:
+            The exported span
+        """
+        span = _start_span(name, dict(attributes) if attributes else {})
+        span.start_ns = start_ns
+        if error is not None:
+            span.record_exception(error)
+        _end_span(self, span, end_ns)
+        return span
+
+    def __enter__(self) -> "Tracer":
+        configure(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        configure(None)
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        """Flush and close the exporter."""
+        self.exporter.shutdown()
+
+
+class _SpanContext:
+    """Starts a span on enter and ends and exports it on exit."""
+
+    __slots__ = ("tracer", "name", "attributes", "span", "token")
+
+    def __init__(self, tracer: Tracer, name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> Span:
+        self.span = _start_span(self.name, self.attributes)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_span.reset(self.token)
+        if exc is not None:
+            self.span.record_exception(exc)
+        _end_span(self.tracer, self.span, time.time_ns())
+
+
+def _start_span(name: str, attributes: Dict[str, Any]) -> Span:
+    """New child of the current span; the activity id comes from the FIT file or the parent."""
+    parent = _current_span.get()
+    if ACTIVITY_ID not in attributes and attributes.get("fit.file") in _file_activities:
+        attributes[ACTIVITY_ID] = _file_activities[attributes["fit.file"]]
+    if parent is None:
+        return Span(name, os.urandom(16).hex(), None, attributes)
+    if ACTIVITY_ID in parent.attributes:
+        attributes.setdefault(ACTIVITY_ID, parent.attributes[ACTIVITY_ID])
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def _end_span(tracer: Tracer, span: Span, end_ns: int) -> None:
+    span.end_ns = end_ns
+    try:
+        tracer.exporter.export(span)
+    except (OSError, ValueError) as e:
+        logging.getLogger(__name__).warning("Dropping span %s: %s", span.name, e)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure(tracer: Optional[Tracer]) -> None:
+    """Install the process-wide tracer; None turns tracing off."""
+    global _tracer
+    _tracer = tracer
+    _file_activities.clear()
+
+
+def get_tracer() -> Optional[Tracer]:
+    """The process-wide tracer, or None if tracing is off."""
+    return _tracer
+
+
+def span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """Time an operation as a span of the process-wide tracer.
+
+    Costs a function call and nothing else while tracing is off.
+
+    Args:
+        name: Operation name
+        attributes: Span attributes, e.g. {"activity.id": ...}
+
+    Returns:
+        Context manager yielding the span (a no-op span while tracing is off)
+    """
+    if _tracer is None:
+        return _NOOP
+    return _tracer.span(name, attributes)
+
+
+def record(name: str, start_ns: int, end_ns: int, attributes: Optional[Dict[str, Any]] = None,
+           error: Optional[BaseException] = None) -> None:
+    """Export an operation timed elsewhere as a span of the process-wide tracer, see Tracer.record."""
+    if _tracer is not None:
+        _tracer.record(name, start_ns, end_ns, attributes, error)
+
+
+def link_file(fit_file_path: str, activity_id: Optional[Any]) -> None:
+    """Record the activity a FIT file belongs to.
+
+    Spans with a "fit.file" attribute get the activity id of the file, so
+    services that only see paths still tag their spans with the activity.
+    """
+    if _tracer is not None and fit_file_path and activity_id is not None:
+        _file_activities[fit_file_path] = str(activity_id)
+
+
+def unlink_file(fit_file_path: str) -> None:
+    """Forget the activity of a FIT file that was cleaned up, see link_file."""
+    _file_activities.pop(fit_file_path, None)
+
+
+def activity_of(fit_file_path: str) -> Optional[str]:
+    """Activity id linked to a FIT file, see link_file."""
+    return _file_activities.get(fit_file_path)
+
+
+def activity_ids(fit_file_paths: Iterable[str]) -> Optional[str]:
+    """Comma-separated activity ids of several FIT files, for spans covering a batch."""
+    ids = [_file_activities[path] for path in fit_file_paths if path in _file_activities]
+    return ",".join(ids) if ids else None
+
+
+def current_span():
+    """The innermost span of the caller, to add attributes known only later."""
+    current = _current_span.get() if _tracer is not None else None
+    return current if current is not None else _NoopContext._span
+
+
+def traced(name: str, attributes: Optional[Callable[..., Dict[str, Any]]] = None) -> Callable:
+    """Decorator running each call of a function in a span.
+
+    Args:
+        name: Operation name
+        attributes: Computes the span attributes from the call arguments
+
+    Returns:
+        The decorator
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def run_in_span(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with _tracer.span(name, attributes(*args, **kwargs) if attributes else None):
+                return fn(*args, **kwargs)
+
+        return run_in_span
+
+    return decorator
+
+
+def propagate(fn: Callable) -> Callable:
+    """Bind a function to the caller's trace context, for running it in another thread."""
+    if _tracer is None:
+        return fn
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run_in_context(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run_in_context
@@ -0,0 +1,244 @@
+"""HTTP trigger endpoint and coalescing sync queue for the daemon mode."""
+
+import hmac
+import json
+import queue
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class SyncQueue:
+    """In-process queue of sync jobs with one pending job per athlete.
+
+    A trigger for an athlete whose sync is already queued is coalesced into
+    that job. A trigger arriving while the athlete's sync is running queues
+    exactly one follow-up sync, so a ride finishing mid-sync is not missed
+    and an athlete is never synced by two workers at once.
+    """
+
+    def __init__(self, handler: Callable[[str], bool], workers: int = 1):
+        """Initialize SyncQueue.
+
+        Args:
+            handler: Runs the sync of an athlete and returns its success
+            workers: Number of worker threads consuming the queue
+        """
+        self.handler = handler
+        self.workers = workers
+        self.logger = logging.getLogger(__name__)
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._pending: Set[str] = set()
+        self._running: Set[str] = set()
+        self._rerun: Set[str] = set()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stats = {"triggers": 0, "coalesced": 0, "succeeded": 0, "failed": 0}
+
+    def submit(self, athlete: str) -> bool:
+        """Request a sync of an athlete.
+
+        Args:
+            athlete: Athlete id
+
+        Returns:
+            True if a new sync was queued, False if the trigger was coalesced
+            into an already queued one
+        """
+        with self._lock:
+            self._stats["triggers"] += 1
+            if athlete in self._pending or athlete in self._rerun:
+                self._stats["coalesced"] += 1
+                return False
+            self._pending.add(athlete)
+        self._queue.put(athlete)
+        return True
+
+    def start(self) -> None:
+        """Start the worker threads."""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"sync-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the workers after the jobs already queued.
+
+        Args:
+            timeout: Seconds to wait for each worker
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait until no sync is queued or running.
+
+        Args:
+            timeout: Seconds to wait
+
+        Returns:
+            True if the queue became idle within the timeout
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not (self._pending or self._running or self._rerun), timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Trigger and job counters plus the athletes currently queued/running."""
+        with self._lock:
+            return dict(self._stats, pending=sorted(self._pending | self._rerun), running=sorted(self._running))
+
+    def _work(self) -> None:
+        """Worker loop: run queued syncs until stopped."""
+        while True:
+            athlete = self._queue.get()
+            if athlete is None:
+                return
+            with self._lock:
+                self._pending.discard(athlete)
+                if athlete in self._running:
+                    # Another worker is syncing this athlete; follow up afterwards
+                    self._rerun.add(athlete)
+                    continue
+                self._running.add(athlete)
+
+            try:
+                success = self.handler(athlete)
+            except Exception:
+                self.logger.exception("Sync of %s failed", athlete)
+                success = False
+
+            with self._lock:
+                self._stats["succeeded" if success else "failed"] += 1
+                self._running.discard(athlete)
+                if athlete in self._rerun:
+                    self._rerun.discard(athlete)
+                    self._pending.add(athlete)
+                    self._queue.put(athlete)
+                self._idle.notify_all()
+
+
+class _TriggerRequestHandler(BaseHTTPRequestHandler):
+    """Routes POST /sync[/<athlete>] and GET /health to the TriggerServer."""
+
+    server_version = "ZwiftSyncTrigger/1.0"
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") != "/health":
+            self._reply(404, {"error": "not found"})
+            return
+        self._reply(200, self.server.trigger.health())
+
+    def do_POST(self) -> None:
+        status, body = self.server.trigger.handle_trigger(self.path, self.headers)
+        self._reply(status, body)
+
+    def _reply(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        self.server.trigger.logger.debug("%s %s", self.address_string(), format % args)
+
+
+class TriggerServer:
+    """Small HTTP server that turns webhook calls into queued syncs.
+
+    POST /sync/<athlete> (or POST /sync when a single athlete is served)
+    queues a sync and answers 202 immediately; GET /health reports the
+    queue counters without naming athletes, so it needs no token.
+    """
+
+    def __init__(self, sync_queue: SyncQueue, athletes: Iterable[str], host: str = "127.0.0.1",
+                 port: int = 8080, token: Optional[str] = None):
+        """Initialize TriggerServer and bind its socket.
+
+        Args:
+            sync_queue: Queue the triggered syncs are submitted to
+            athletes: Athlete ids that may be triggered
+            host: Interface to listen on
+            port: Port to listen on (0 picks a free port)
+            token: Shared secret expected as "Authorization: Bearer <token>";
+                None accepts unauthenticated triggers
+        """
+        self.sync_queue = sync_queue
+        self.athletes = list(athletes)
+        self.token = token
+        self.logger = logging.getLogger(__name__)
+        self.httpd = ThreadingHTTPServer((host, port), _TriggerRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.trigger = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """Host and port the server is bound to."""
+        return self.httpd.server_address[:2]
+
+    def health(self) -> Dict[str, Any]:
+        """Aggregate queue state for GET /health.
+
+        Athlete ids (in daemon mode the Zwift username) are replaced by
+        the number of queued and running syncs.
+        """
+        stats = self.sync_queue.stats()
+        for key in ("pending", "running"):
+            if key in stats:
+                stats[key] = len(stats[key])
+        return dict(stats, status="ok")
+
+    def handle_trigger(self, path: str, headers) -> Tuple[int, Dict[str, Any]]:
+        """Validate a trigger request and queue the sync.
+
+        Args:
+            path: Request path
+            headers: Request headers
+
+        Returns:
+            HTTP status and JSON body of the reply
+        """
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if not parts or parts[0] != "sync" or len(parts) > 2:
+            return 404, {"error": "not found"}
+        if self.token and not hmac.compare_digest(headers.get("Authorization", ""), f"Bearer {self.token}"):
+            return 401, {"error": "invalid token"}
+
+        if len(parts) == 2:
+            athlete = parts[1]
+        elif len(self.athletes) == 1:
+            athlete = self.athletes[0]
+        else:
+            return 400, {"error": "athlete required, use /sync/<athlete>"}
+        if athlete not in self.athletes:
+            return 404, {"error": f"unknown athlete {athlete}"}
+
+        queued = self.sync_queue.submit(athlete)
+        self.logger.info("Sync of %s %s", athlete, 'queued' if queued else 'already queued')
+        return 202, {"athlete": athlete, "queued": queued}
+
+    def serve_forever(self) -> None:
+        """Serve triggers until shutdown() is called."""
+        host, port = self.address
+        self.logger.info("Listening for sync triggers on http://%s:%s/sync", host, port)
+        self.httpd.serve_forever()
+
+    def start(self) -> None:
+        """Serve triggers in a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name="trigger-server", daemon=True)
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        """Stop serving and close the socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
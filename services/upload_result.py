@@ -0,0 +1,109 @@
+"""Structured upload outcomes and the per-run report built from them."""
+
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+
+class UploadStatus(Enum):
+    """Outcome of uploading one file to one destination."""
+
+    SUCCESS = "success"
+    DUPLICATE = "duplicate"
+    FAILED = "failed"
+
+
+@dataclass
+class UploadResult:
+    """Result of uploading one FIT file to one destination.
+
+    Attributes:
+        file_path: Path of the uploaded file
+        destination: Name of the destination
+        status: Upload outcome
+        activity_id: Activity id assigned by the destination, if known
+        latency: Wall time of the upload request(s) in seconds
+        bytes_sent: Number of file bytes transferred
+        retryable: Whether a failed upload may succeed when retried
+            (network errors, rate limits, server errors)
+        error: Error description for failed uploads
+        response: Raw destination response
+    """
+
+    file_path: str
+    destination: str
+    status: UploadStatus
+    activity_id: Optional[str] = None
+    latency: float = 0.0
+    bytes_sent: int = 0
+    retryable: bool = False
+    error: Optional[str] = None
+    response: Any = None
+
+    @property
+    def duplicate(self) -> bool:
+        """True if the destination already had this activity."""
+        return self.status is UploadStatus.DUPLICATE
+
+    @property
+    def ok(self) -> bool:
+        """True if the activity is present at the destination after the upload."""
+        return self.status is not UploadStatus.FAILED
+
+
+@dataclass
+class RunReport:
+    """Aggregated upload results of one processing run.
+
+    Attributes:
+        results: Upload results in upload order
+        metrics: Ride metrics by downloaded file path (see services.ride_metrics)
+    """
+
+    results: List[UploadResult] = field(default_factory=list)
+    metrics: Dict[str, Any] = field(default_factory=dict)
+
+    def add(self, result: UploadResult) -> None:
+        """Record an upload result."""
+        self.results.append(result)
+
+    @property
+    def success(self) -> bool:
+        """True if every upload of the run succeeded or was a known duplicate."""
+        return all(result.ok for result in self.results)
+
+    @property
+    def failed(self) -> List[UploadResult]:
+        """Failed uploads."""
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def retryable(self) -> List[UploadResult]:
+        """Failed uploads that are worth retrying."""
+        return [result for result in self.failed if result.retryable]
+
+    @property
+    def duplicates(self) -> List[UploadResult]:
+        """Uploads the destination already had."""
+        return [result for result in self.results if result.duplicate]
+
+    @property
+    def bytes_sent(self) -> int:
+        """Total number of file bytes transferred."""
+        return sum(result.bytes_sent for result in self.results)
+
+    def outcomes(self) -> Dict[str, Dict[str, bool]]:
+        """Per file, per destination success of the run."""
+        outcomes: Dict[str, Dict[str, bool]] = {}
+        for result in self.results:
+            outcomes.setdefault(result.file_path, {})[result.destination] = result.ok
+        return outcomes
+
+    def summary(self) -> str:
+        """One-line summary for the run log."""
+        counts = {status: 0 for status in UploadStatus}
+        for result in self.results:
+            counts[result.status] += 1
+        return (f"{len(self.results)} uploads: {counts[UploadStatus.SUCCESS]} succeeded, "
+                f"{counts[UploadStatus.DUPLICATE]} duplicates, {counts[UploadStatus.FAILED]} failed "
+                f"({len(self.retryable)} retryable), {self.bytes_sent} bytes sent")
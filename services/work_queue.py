@@ -0,0 +1,280 @@
+"""Durable SQLite-backed queue of activity jobs."""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# Job states, in pipeline order
+LISTED = "listed"
+DOWNLOADED = "downloaded"
+TRANSFORMED = "transformed"
+UPLOADED = "uploaded"
+FAILED = "failed"
+STATES = (LISTED, DOWNLOADED, TRANSFORMED, UPLOADED, FAILED)
+FINAL_STATES = (UPLOADED, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claimable ON jobs (state, lease_expires, created);
+"""
+
+
+@dataclass
+class Job:
+    """One activity moving through the pipeline.
+
+    Attributes:
+        id: Job id (the Zwift activity id)
+        state: Pipeline state, see STATES
+        payload: Stage data, e.g. the catalog entry and downloaded file paths
+        attempts: Failed attempts so far
+        lease_owner: Worker currently holding the job
+        waited: Seconds the job waited in the queue since its last state
+            change, as of the claim
+    """
+
+    id: str
+    state: str
+    payload: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    lease_owner: Optional[str] = None
+    waited: float = 0.0
+
+
+class WorkQueue:
+    """Crash-safe job queue in a SQLite database in WAL mode.
+
+    Several worker processes on one host can consume the same database. A
+    worker claims a job by taking a lease on it; if the worker dies, the
+    lease expires after the visibility timeout and another worker resumes
+    the job from its last recorded state.
+    """
+
+    def __init__(self, db_path: str, visibility_timeout: float = 300.0, max_attempts: int = 5,
+                 retry_delay: float = 60.0, renew_interval: Optional[float] = None,
+                 clock: Callable[[], float] = time.time):
+        """Initialize WorkQueue and create the database if needed.
+
+        Args:
+            db_path: Path of the SQLite database
+            visibility_timeout: Seconds a claimed job stays invisible to
+                other workers; extended whenever the job advances and
+                while it is held with keep_leased
+            max_attempts: Failed attempts after which a job is marked failed
+            retry_delay: Seconds a failed job waits before it is retried
+            renew_interval: Seconds between lease renewals in keep_leased
+                (defaults to a third of the visibility timeout)
+            clock: Wall clock (epoch seconds), shared by all processes
+        """
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self.renew_interval = renew_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._clock = clock
+        self._local = threading.local()
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """SQLite connection of the calling thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit; writes use explicit IMMEDIATE transactions
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def close(self) -> None:
+        """Close the connection of the calling thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def enqueue(self, job_id: str, payload: Dict[str, Any]) -> bool:
+        """Add a listed activity unless it is already queued.
+
+        Args:
+            job_id: Job id (the Zwift activity id)
+            payload: Initial stage data
+
+        Returns:
+            True if the job was added, False if it already exists
+        """
+        now = self._clock()
+        cursor = self._connection().execute(
+            "INSERT OR IGNORE INTO jobs (id, state, payload, created, updated) VALUES (?, ?, ?, ?, ?)",
+            (str(job_id), LISTED, json.dumps(payload), now, now))
+        return cursor.rowcount == 1
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """Lease the oldest job that is not final and not leased.
+
+        Args:
+            worker_id: Id of the claiming worker
+
+        Returns:
+            The claimed job, or None if no job is available
+        """
+        now = self._clock()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT id, state, payload, attempts, updated FROM jobs WHERE state NOT IN (?, ?) AND lease_expires <= ? "
+                "ORDER BY created, id LIMIT 1", (*FINAL_STATES, now)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE jobs SET lease_owner = ?, lease_expires = ?, updated = ? WHERE id = ?",
+                                   (worker_id, now + self.visibility_timeout, now, row[0]))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), row[3], worker_id, max(0.0, now - row[4]))
+
+    def advance(self, job: Job, state: str) -> bool:
+        """Record that a job reached a state, saving its payload.
+
+        Final states release the lease; other states extend it.
+
+        Args:
+            job: Claimed job (its payload is saved as is)
+            state: New state
+
+        Returns:
+            False if the worker lost the lease (the job expired and was
+            claimed by another worker); the caller must stop working on it
+        """
+        now = self._clock()
+        final = state in FINAL_STATES
+        cursor = self._connection().execute(
+            "UPDATE jobs SET state = ?, payload = ?, lease_owner = ?, lease_expires = ?, error = NULL, updated = ? "
+            "WHERE id = ? AND lease_owner = ?",
+            (state, json.dumps(job.payload), None if final else job.lease_owner,
+             0 if final else now + self.visibility_timeout, now, job.id, job.lease_owner))
+        if cursor.rowcount != 1:
+            self.logger.warning("Lost the lease on job %s", job.id)
+            return False
+        job.state = state
+        if final:
+            job.lease_owner = None
+        return True
+
+    def renew(self, job: Job) -> bool:
+        """Extend the lease on a claimed job by the visibility timeout.
+
+        Args:
+            job: Claimed job
+
+        Returns:
+            False if the worker lost the lease
+        """
+        cursor = self._connection().execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ?",
+            (self._clock() + self.visibility_timeout, job.id, job.lease_owner))
+        return cursor.rowcount == 1
+
+    @contextmanager
+    def keep_leased(self, job: Job) -> Iterator[Job]:
+        """Renew the lease on a job from a background thread while working on it.
+
+        A single stage (e.g. an upload with retries) may take longer than
+        the visibility timeout; without renewals another worker would claim
+        the job and repeat the stage.
+
+        Args:
+            job: Claimed job
+        """
+        interval = self.renew_interval or self.visibility_timeout / 3
+        if interval <= 0:
+            yield job
+            return
+        done = threading.Event()
+
+        def heartbeat():
+            try:
+                while not done.wait(interval):
+                    if not self.renew(job):
+                        self.logger.warning("Lost the lease on job %s", job.id)
+                        return
+            finally:
+                self.close()
+
+        thread = threading.Thread(target=heartbeat, name=f"lease-{job.id}", daemon=True)
+        thread.start()
+        try:
+            yield job
+        finally:
+            done.set()
+            thread.join()
+
+    def fail(self, job: Job, error: str, retryable: bool = True) -> str:
+        """Record a failed attempt of a job.
+
+        The job keeps its state and becomes claimable again after
+        retry_delay, unless the error is permanent or the attempts are used up.
+
+        Args:
+            job: Claimed job
+            error: Error description
+            retryable: Whether another attempt may succeed
+
+        Returns:
+            The resulting state of the job; if the worker lost the lease,
+            the state recorded by the worker that took the job over
+        """
+        now = self._clock()
+        attempts = job.attempts + 1
+        state = job.state if retryable and attempts < self.max_attempts else FAILED
+        cursor = self._connection().execute(
+            "UPDATE jobs SET state = ?, payload = ?, attempts = ?, error = ?, lease_owner = NULL, "
+            "lease_expires = ?, updated = ? WHERE id = ? AND lease_owner = ?",
+            (state, json.dumps(job.payload), attempts, error, now + self.retry_delay, now,
+             job.id, job.lease_owner))
+        if cursor.rowcount != 1:
+            self.logger.warning("Lost the lease on job %s, not recording its failure: %s", job.id, error)
+            current = self.get(job.id)
+            state = current.state if current else job.state
+        else:
+            job.attempts = attempts
+        job.state, job.lease_owner = state, None
+        return state
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by id."""
+        row = self._connection().execute(
+            "SELECT id, state, payload, attempts, lease_owner FROM jobs WHERE id = ?", (str(job_id),)).fetchone()
+        return Job(row[0], row[1], json.loads(row[2]), row[3], row[4]) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per state."""
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(self._connection().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        return counts
+
+    def pending(self) -> int:
+        """Number of jobs that are not in a final state."""
+        counts = self.counts()
+        return sum(count for state, count in counts.items() if state not in FINAL_STATES)
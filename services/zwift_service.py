@@ -2,58 +2,175 @@
 
 import os
 import tempfile
-import requests
 import logging
-from typing import Optional, Dict, Any
-from zwift import Client as ZwiftClient
-from datetime import datetime, timezone
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Union
+from services import tracing
+from services.activity_record import ActivityRecord, as_record, format_timestamp, parse_timestamp
+from services.fit_cache import FitCache
+from services.rate_limiter import RateLimiter
+from services.retry import CircuitOpenError, Retrier
+
+ZWIFT_API_HOST = "us-or-rly101.zwift.com"
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_PAGE_CONCURRENCY = 4
+
+# zwift-client pulls in its protobuf stack on import; it is loaded on first
+# authentication instead of at startup (see _zwift_client_class).
+ZwiftClient = None
+
+
+def _zwift_client_class():
+    """Import the Zwift client class on first use."""
+    global ZwiftClient
+    if ZwiftClient is None:
+        from zwift import Client
+        ZwiftClient = Client
+    return ZwiftClient
+
+
+def date_cutoff(start_date: str) -> int:
+    """Midnight (UTC) of a YYYY-MM-DD date as epoch seconds."""
+    return parse_timestamp(f"{start_date}T00:00:00")
+
+
+def started_after(activity: Union[ActivityRecord, Dict[str, Any]], start_date: str) -> bool:
+    """Check whether a catalog activity started after a YYYY-MM-DD date."""
+    start = as_record(activity).start
+    return start is not None and start > date_cutoff(start_date)
+
 
 class ZwiftService:
     """Service for interacting with Zwift API."""
 
-    def __init__(self, username: str, password: str):
+    def __init__(self, username: str, password: str, cache_dir: Optional[str] = None,
+                 retrier: Optional[Retrier] = None, rate_limiter: Optional[RateLimiter] = None,
+                 fit_cache: Optional[FitCache] = None, page_size: int = DEFAULT_PAGE_SIZE,
+                 page_concurrency: int = DEFAULT_PAGE_CONCURRENCY):
         """Initialize ZwiftService with credentials.
 
         Args:
             username: Zwift username
             password: Zwift password
+            cache_dir: Directory for downloaded FIT files (defaults to the temp dir)
+            retrier: Shared retry/circuit-breaker component
+            rate_limiter: Shared per-host request rate limiter
+            fit_cache: Local cache checked before downloading from S3
+            page_size: Activities requested per catalog page
+            page_concurrency: Catalog pages fetched concurrently once the
+                first page came back full
         """
         self.username = username
         self.password = password
-        self.client: Optional[ZwiftClient] = None
+        self.retrier = retrier or Retrier()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.fit_cache = fit_cache
+        self.page_size = page_size
+        self.page_concurrency = max(1, page_concurrency)
+        self.client: Optional[Any] = None
+        # Catalog entry of every downloaded file, by path
+        self._downloaded: Dict[str, ActivityRecord] = {}
         self.logger = logging.getLogger(__name__)
-        # Save the .fit file to a temporary location
-        self.temp_dir = tempfile.gettempdir()        
+        # Save the .fit file to the cache directory or a temporary location
+        self.temp_dir = cache_dir or tempfile.gettempdir()
+        os.makedirs(self.temp_dir, exist_ok=True)
 
     def authenticate(self) -> None:
-        """Authenticate with Zwift."""
+        """Authenticate with Zwift.
+
+        The client refreshes its access token itself, so a long-running
+        process logs in only once.
+        """
+        if self.client is not None:
+            return
         self.logger.info("Authenticating with Zwift...")
-        self.client = ZwiftClient(self.username, self.password)
+        self.client = _zwift_client_class()(self.username, self.password)
         self.logger.info("Successfully authenticated with Zwift")
 
 
-    def _get_activities(self) -> []:
+    def _get_activities(self, max_count: Optional[int] = None) -> Optional[List[ActivityRecord]]:
         if not self.client:
             raise RuntimeError("Must authenticate before downloading activities")
 
         profile = self.client.get_profile()
-        start = 0
-        limit = 10
-        activities = []
-        while True:
-            act = profile.get_activities(start, limit)
-            activities.extend(act)
-            start += limit
-            if len(act) != limit:
-                break
-
-        self.logger.info(f"Activities found: {len(activities)}")
+        limit = self.page_size
+
+        def get_page(start: int):
+            self.rate_limiter.acquire(ZWIFT_API_HOST)
+            # Only the fields the pipeline needs are kept of each entry
+            return [ActivityRecord.from_dict(activity) for activity in profile.get_activities(start, limit)]
+
+        def fetch_page(start: int):
+            with tracing.span("zwift.list_page", {"zwift.page_start": start, "zwift.page_size": limit}) as span:
+                page = self.retrier.call("zwift.activities", get_page, start)
+                span.set_attribute("activity.count", len(page))
+                return page
+
+        # The API reports no total, so the first page is fetched alone; if it
+        # is full, the following pages are fetched speculatively in parallel.
+        with tracing.span("zwift.list", {"zwift.max_count": max_count}) as span:
+            activities = list(fetch_page(0))
+            if len(activities) == limit and not (max_count and len(activities) >= max_count):
+                activities.extend(self._fetch_following_pages(fetch_page, limit, max_count))
+            span.set_attribute("activity.count", len(activities))
+
+        self.logger.info("Activities found: %s", len(activities))
 
         if len(activities) == 0:
             self.logger.info("No activities found on Zwift")
             return None
+        return activities[:max_count] if max_count else activities
+
+    def _fetch_following_pages(self, fetch_page, limit: int, max_count: Optional[int]) -> List[ActivityRecord]:
+        """Fetch the catalog pages after the first one, several at a time.
+
+        Up to page_concurrency pages are in flight; pages are consumed in
+        order and fetching stops at the first short page (or once max_count
+        is reached), cancelling the speculative requests not yet started.
+
+        Args:
+            fetch_page: Fetches the page starting at an offset
+            limit: Page size
+            max_count: Stop after this many activities in total
+
+        Returns:
+            The activities of the following pages, newest first
+        """
+        wanted_pages = -(-max_count // limit) - 1 if max_count else None
+        activities: List[ActivityRecord] = []
+        next_start = limit
+        in_flight = deque()
+        executor = ThreadPoolExecutor(self.page_concurrency, thread_name_prefix="zwift-pages")
+        try:
+            while True:
+                while len(in_flight) < self.page_concurrency and (
+                        wanted_pages is None or next_start // limit <= wanted_pages):
+                    in_flight.append(executor.submit(tracing.propagate(fetch_page), next_start))
+                    next_start += limit
+                if not in_flight:
+                    break
+                page = in_flight.popleft().result()
+                activities.extend(page)
+                if len(page) != limit:
+                    break
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.logger.debug("Requested %s catalog pages of %s activities", next_start // limit, limit)
         return activities
-    
+
+    def list_activities(self, max_count: Optional[int] = None) -> List[ActivityRecord]:
+        """Fetch the activity catalog, newest first, authenticating if needed.
+
+        Args:
+            max_count: Stop after this many activities (fetches whole pages)
+
+        Returns:
+            Activity records, newest first
+        """
+        self.authenticate()
+        return self._get_activities(max_count) or []
+
 
     def download_last_activity(self) -> Optional[str]:
         """Downloads the last activity's .fit file from Zwift.
@@ -65,52 +182,93 @@ class ZwiftService:
             RuntimeError: If not authenticated or download fails
         """
 
-        activities = self._get_activities()
+        activities = self._get_activities(max_count=1)
+        if not activities:
+            return None
         return self.download_activity(activities[0])
 
 
-    def download_activity(self, activity):
-        activity_id = activity['id']
-        self.logger.info(f"Downloading activity {activity_id}...")
+    @tracing.traced("zwift.download", lambda self, activity: {tracing.ACTIVITY_ID: as_record(activity).id})
+    def download_activity(self, activity: Union[ActivityRecord, Dict[str, Any]]) -> str:
+        import requests
 
-        link = f"https://{activity['fitFileBucket']}.s3.amazonaws.com/{activity['fitFileKey']}"
-        self.logger.info(f"Download link: {link}")
+        activity = as_record(activity)
+        activity_id = activity.id
+        fit_file_path = os.path.join(self.temp_dir, f"zwift_activity_{activity_id}.fit")
+        cache_key = f"zwift:{activity_id}"
+        self._downloaded[fit_file_path] = activity
+        tracing.link_file(fit_file_path, activity_id)
+        span = tracing.current_span()
+        span.set_attribute("fit.file", fit_file_path)
+        if self.fit_cache and self.fit_cache.get_file(cache_key, fit_file_path):
+            span.set_attribute("fit.cache_hit", True)
+            self.logger.info("Activity %s restored from the FIT cache to %s", activity_id, fit_file_path)
+            return fit_file_path
 
-        try:
+        self.logger.info("Downloading activity %s...", activity_id)
+
+        host = f"{activity.fit_file_bucket}.s3.amazonaws.com"
+        link = f"https://{host}/{activity.fit_file_key}"
+        self.logger.info("Download link: %s", link)
+
+        def fetch():
+            self.rate_limiter.acquire(host)
             response = requests.get(link, timeout=10)
             response.raise_for_status()
-        except requests.RequestException as e:
-            raise RuntimeError(f"Failed to download activity: {e}") from e
-
+            return response
 
-        fit_file_path = os.path.join(self.temp_dir, f"zwift_activity_{activity_id}.fit")
+        try:
+            response = self.retrier.call("zwift.s3", fetch)
+        except (requests.RequestException, CircuitOpenError) as e:
+            raise RuntimeError(f"Failed to download activity: {e}") from e
 
         with open(fit_file_path, "wb") as file:
             file.write(response.content)
+        span.set_attribute("fit.bytes", len(response.content))
+        if self.fit_cache:
+            self.fit_cache.put(cache_key, response.content)
 
-        self.logger.info(f"Activity {activity_id} downloaded to {fit_file_path}")
+        self.logger.info("Activity %s downloaded to %s", activity_id, fit_file_path)
         return fit_file_path
 
 
+    def activity_for(self, fit_file_path: str) -> Optional[ActivityRecord]:
+        """Catalog entry of a file returned by one of the download methods."""
+        return self._downloaded.get(fit_file_path)
+
+    def forget(self, fit_file_path: str) -> None:
+        """Drop the catalog entry of a downloaded file once it is cleaned up."""
+        self._downloaded.pop(fit_file_path, None)
+
     def download_last_x_activities(self, x: int) -> Optional[str]:
-        activities = self._get_activities()
+        activities = self._get_activities(max_count=x) or []
         fit_file_path_list = []
-        for i in range(0,x):
-            self.logger.info(f"Download activitiy {i}")
-            fit_file_path_list.append(self.download_activity(activities[i]))
+        for i, activity in enumerate(activities):
+            self.logger.info("Download activitiy %s", i)
+            fit_file_path_list.append(self.download_activity(activity))
         return fit_file_path_list
 
 
     def download_activities_since_date(self, start_date: str) -> Optional[str]:
-        start_date_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        activities = self._get_activities()
+        activities = self._get_activities() or []
+        cutoff = date_cutoff(start_date)
         fit_file_path_list = []
         for i, activity in enumerate(activities):
-            activity_start_date_dt = datetime.strptime(activity["startDate"], "%Y-%m-%dT%H:%M:%S.%f%z")
-            self.logger.info(f"Check activity with start_date {activity_start_date_dt}")
-            if start_date_dt < activity_start_date_dt.replace(tzinfo=None):
-                self.logger.info(f"Download activitiy {i}")
-                print(f"Download activitiy {i}: {activity_start_date_dt}")
+            if activity.start is not None and activity.start > cutoff:
+                self.logger.info("Download activitiy %s: %s", i, format_timestamp(activity.start))
                 fit_file_path_list.append(self.download_activity(activity))
         return fit_file_path_list
 
+
+    def download_all_activities(self) -> list:
+        """Downloads the .fit files of every activity in the catalog.
+
+        Returns:
+            Paths to the downloaded .fit files
+        """
+        activities = self._get_activities() or []
+        fit_file_path_list = []
+        for i, activity in enumerate(activities):
+            self.logger.info("Download activitiy %s", i)
+            fit_file_path_list.append(self.download_activity(activity))
+        return fit_file_path_list
@@ -0,0 +1,86 @@
+"""Tests for ActivityIndex."""
+
+import json
+import numpy as np
+import pytest
+from services.activity_index import ActivityFingerprint, ActivityIndex, fingerprint_from_fit
+from services.fit_encoder import RECORD, SESSION, FitEncoder, MessageDefinition, fit_timestamp
+
+
+def test_fingerprint_from_fit(tmp_path):
+    """Test that the fingerprint is read from the session after the records."""
+    # Given
+    encoder = FitEncoder()
+    encoder.define(0, MessageDefinition.from_profile(RECORD, ["timestamp", "power", "distance"]))
+    seconds = np.arange(3600)
+    encoder.write_rows(0, {"timestamp": fit_timestamp(1760000000) + seconds, "power": 200 + seconds % 50,
+                           "distance": seconds * 8.3675})
+    encoder.define(1, MessageDefinition.from_profile(
+        SESSION, ["timestamp", "start_time", "total_elapsed_time", "total_distance"]))
+    encoder.write(1, {"timestamp": fit_timestamp(1760003600), "start_time": fit_timestamp(1760000000),
+                      "total_elapsed_time": 3600.4, "total_distance": 30123.0})
+    fit_file = tmp_path / "ride.fit"
+    encoder.to_file(str(fit_file))
+    (tmp_path / "broken.fit").write_bytes(b"not a fit file")
+
+    # Then
+    assert fingerprint_from_fit(str(fit_file)) == ActivityFingerprint(1760000000, 3600, 30123)
+    assert fingerprint_from_fit(str(tmp_path / "broken.fit")) is None
+
+
+class TestActivityIndex:
+    """Test cases for ActivityIndex."""
+
+    @pytest.fixture
+    def fingerprint(self):
+        """Fingerprint of a one hour ride."""
+        return ActivityFingerprint(start_time=1760000000, duration=3600, distance=30123)
+
+    def test_contains_with_tolerance(self, fingerprint):
+        """Test that fingerprints match within the rounding tolerances."""
+        # Given
+        index = ActivityIndex()
+        index.add(fingerprint)
+
+        # Then
+        assert ActivityFingerprint(1760000000, 3601, 30130) in index
+        assert ActivityFingerprint(1760000000, 3700, 30123) not in index
+        assert ActivityFingerprint(1760000001, 3600, 30123) not in index
+
+    def test_add_persists_and_reloads(self, fingerprint, tmp_path):
+        """Test that added fingerprints survive a restart."""
+        # Given
+        index_path = str(tmp_path / "state" / "index.json")
+
+        # When
+        ActivityIndex(index_path).add(fingerprint)
+
+        # Then
+        with open(index_path) as f:
+            assert json.load(f) == [[1760000000, 3600, 30123]]
+        assert fingerprint in ActivityIndex(index_path)
+
+    def test_update_does_not_persist(self, fingerprint, tmp_path):
+        """Test that remote fingerprints are only kept in memory."""
+        # Given
+        index_path = str(tmp_path / "index.json")
+        index = ActivityIndex(index_path)
+
+        # When
+        index.update([fingerprint, fingerprint])
+
+        # Then
+        assert len(index) == 1
+        assert not (tmp_path / "index.json").exists()
+
+    def test_unreadable_index_is_ignored(self, tmp_path):
+        """Test that a corrupt index file does not break the run."""
+        # Given
+        index_path = tmp_path / "index.json"
+        index_path.write_text("not json")
+
+        # When
+        index = ActivityIndex(str(index_path))
+
+        # Then
+        assert len(index) == 0
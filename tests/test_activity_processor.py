@@ -1,11 +1,32 @@
 """Tests for ActivityProcessor."""
 
+import json
+import time
+import numpy as np
 import pytest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 from services.activity_processor import ActivityProcessor
+from services.activity_record import ActivityRecord
 from services.zwift_service import ZwiftService
 from services.fit_file_service import FitFileService
+from services.runalyze_service import RunalyzeService
 from services.garmin_service import GarminService
+from services.archive_service import ArchiveService
+from services.destination import Destination
+from services.power_curve import PowerCurveIndex
+from services import tracing
+from services.tracing import FileSpanExporter, Tracer
+from services.upload_result import UploadResult, UploadStatus
+from services.work_queue import FAILED, LISTED, TRANSFORMED, UPLOADED, WorkQueue
+
+
+def mock_destination(spec, name):
+    """Create a mock destination whose batch upload goes through its upload() mock."""
+    destination = Mock(spec=spec)
+    destination.name = name
+    destination.upload.side_effect = lambda path: UploadResult(path, name, UploadStatus.SUCCESS)
+    destination.upload_batch.side_effect = lambda paths: Destination.upload_batch(destination, paths)
+    return destination
 
 
 class TestActivityProcessor:
@@ -15,41 +36,37 @@ class TestActivityProcessor:
     def mock_services(self):
         """Create mock services for testing."""
         zwift_service = Mock(spec=ZwiftService)
+        runalyze_service = mock_destination(RunalyzeService, "runalyze")
         fit_file_service = Mock(spec=FitFileService)
-        garmin_service = Mock(spec=GarminService)
-        return zwift_service, fit_file_service, garmin_service
+        return zwift_service, runalyze_service, fit_file_service
 
     @pytest.fixture
     def activity_processor(self, mock_services):
         """Create an ActivityProcessor instance with mock services."""
-        zwift_service, fit_file_service, garmin_service = mock_services
-        return ActivityProcessor(zwift_service, fit_file_service, garmin_service)
+        zwift_service, runalyze_service, fit_file_service = mock_services
+        return ActivityProcessor(zwift_service, [runalyze_service], fit_file_service)
 
     def test_init(self, mock_services):
         """Test ActivityProcessor initialization."""
         # Given
-        zwift_service, fit_file_service, garmin_service = mock_services
+        zwift_service, runalyze_service, fit_file_service = mock_services
 
         # When
-        processor = ActivityProcessor(zwift_service, fit_file_service, garmin_service)
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service)
 
         # Then
         assert processor.zwift_service == zwift_service
+        assert processor.destinations == [runalyze_service]
         assert processor.fit_file_service == fit_file_service
-        assert processor.garmin_service == garmin_service
+        assert processor.dry_run is False
 
     def test_process_latest_activity_success(self, activity_processor, mock_services):
         """Test successful activity processing."""
         # Given
-        zwift_service, fit_file_service, garmin_service = mock_services
+        zwift_service, runalyze_service, fit_file_service = mock_services
 
         original_file_path = "/tmp/original.fit"
-        modified_file_path = "/tmp/modified.fit"
-        upload_response = {"upload_id": "12345", "status": "success"}
-
         zwift_service.download_last_activity.return_value = original_file_path
-        fit_file_service.modify_device_info.return_value = modified_file_path
-        garmin_service.upload_activity.return_value = upload_response
 
         # When
         result = activity_processor.process_latest_activity()
@@ -60,18 +77,17 @@ class TestActivityProcessor:
         # Verify service calls
         zwift_service.authenticate.assert_called_once()
         zwift_service.download_last_activity.assert_called_once()
-        fit_file_service.modify_device_info.assert_called_once_with(original_file_path)
-        garmin_service.authenticate.assert_called_once()
-        garmin_service.upload_activity.assert_called_once_with(modified_file_path)
+        fit_file_service.modify_device_info_batch.assert_not_called()
+        runalyze_service.upload.assert_called_once_with(original_file_path)
 
         # Verify cleanup
-        fit_file_service.cleanup_file.assert_any_call(original_file_path)
-        fit_file_service.cleanup_file.assert_any_call(modified_file_path)
+        fit_file_service.cleanup_file.assert_called_once_with(original_file_path)
+        zwift_service.forget.assert_called_once_with(original_file_path)
 
     def test_process_latest_activity_no_activities(self, activity_processor, mock_services):
         """Test processing when no activities are found."""
         # Given
-        zwift_service, fit_file_service, garmin_service = mock_services
+        zwift_service, runalyze_service, fit_file_service = mock_services
 
         zwift_service.download_last_activity.return_value = None
 
@@ -86,14 +102,13 @@ class TestActivityProcessor:
         zwift_service.download_last_activity.assert_called_once()
 
         # Verify other services are not called
-        fit_file_service.modify_device_info.assert_not_called()
-        garmin_service.authenticate.assert_not_called()
-        garmin_service.upload_activity.assert_not_called()
+        fit_file_service.modify_device_info_batch.assert_not_called()
+        runalyze_service.upload.assert_not_called()
 
     def test_process_latest_activity_zwift_auth_failure(self, activity_processor, mock_services):
         """Test processing failure during Zwift authentication."""
         # Given
-        zwift_service, fit_file_service, garmin_service = mock_services
+        zwift_service, runalyze_service, fit_file_service = mock_services
 
         zwift_service.authenticate.side_effect = Exception("Zwift auth failed")
 
@@ -110,7 +125,7 @@ class TestActivityProcessor:
     def test_process_latest_activity_download_failure(self, activity_processor, mock_services):
         """Test processing failure during activity download."""
         # Given
-        zwift_service, fit_file_service, garmin_service = mock_services
+        zwift_service, runalyze_service, fit_file_service = mock_services
 
         zwift_service.download_last_activity.side_effect = Exception("Download failed")
 
@@ -124,38 +139,41 @@ class TestActivityProcessor:
         zwift_service.authenticate.assert_called_once()
         zwift_service.download_last_activity.assert_called_once()
 
-    def test_process_latest_activity_fit_modification_failure(self, activity_processor, mock_services):
+    def test_process_latest_activity_fit_modification_failure(self, mock_services):
         """Test processing failure during FIT file modification."""
         # Given
-        zwift_service, fit_file_service, garmin_service = mock_services
+        zwift_service, runalyze_service, fit_file_service = mock_services
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service, modify_device=True)
 
         original_file_path = "/tmp/original.fit"
         zwift_service.download_last_activity.return_value = original_file_path
-        fit_file_service.modify_device_info.side_effect = Exception("Modification failed")
+        fit_file_service.modify_device_info_batch.side_effect = Exception("Modification failed")
 
         # When
-        result = activity_processor.process_latest_activity()
+        result = processor.process_latest_activity()
 
         # Then
         assert result is False
+        runalyze_service.upload.assert_not_called()
 
         # Verify cleanup is still called
         fit_file_service.cleanup_file.assert_called_with(original_file_path)
 
-    def test_process_latest_activity_garmin_auth_failure(self, activity_processor, mock_services):
-        """Test processing failure during Garmin authentication."""
+    def test_process_latest_activity_upload_failure(self, mock_services):
+        """Test processing failure during activity upload."""
         # Given
-        zwift_service, fit_file_service, garmin_service = mock_services
+        zwift_service, runalyze_service, fit_file_service = mock_services
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service, modify_device=True)
 
         original_file_path = "/tmp/original.fit"
         modified_file_path = "/tmp/modified.fit"
 
         zwift_service.download_last_activity.return_value = original_file_path
-        fit_file_service.modify_device_info.return_value = modified_file_path
-        garmin_service.authenticate.side_effect = Exception("Garmin auth failed")
+        fit_file_service.modify_device_info_batch.return_value = {original_file_path: modified_file_path}
+        runalyze_service.upload.side_effect = Exception("Upload failed")
 
         # When
-        result = activity_processor.process_latest_activity()
+        result = processor.process_latest_activity()
 
         # Then
         assert result is False
@@ -164,47 +182,409 @@ class TestActivityProcessor:
         fit_file_service.cleanup_file.assert_any_call(original_file_path)
         fit_file_service.cleanup_file.assert_any_call(modified_file_path)
 
-    def test_process_latest_activity_upload_failure(self, activity_processor, mock_services):
-        """Test processing failure during activity upload."""
+    def test_process_latest_activity_dry_run(self, mock_services):
+        """Test that a dry run downloads but does not upload."""
         # Given
-        zwift_service, fit_file_service, garmin_service = mock_services
+        zwift_service, runalyze_service, fit_file_service = mock_services
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service, dry_run=True)
+        zwift_service.download_last_activity.return_value = "/tmp/original.fit"
 
-        original_file_path = "/tmp/original.fit"
-        modified_file_path = "/tmp/modified.fit"
+        # When
+        result = processor.process_latest_activity()
 
-        zwift_service.download_last_activity.return_value = original_file_path
-        fit_file_service.modify_device_info.return_value = modified_file_path
-        garmin_service.upload_activity.side_effect = Exception("Upload failed")
+        # Then
+        assert result is True
+        runalyze_service.upload.assert_not_called()
+        fit_file_service.cleanup_file.assert_called_once_with("/tmp/original.fit")
+
+    def test_process_all_activities(self, activity_processor, mock_services):
+        """Test backfilling every activity in the catalog."""
+        # Given
+        zwift_service, runalyze_service, fit_file_service = mock_services
+        zwift_service.download_all_activities.return_value = ["/tmp/a.fit", "/tmp/b.fit"]
 
         # When
-        result = activity_processor.process_latest_activity()
+        result = activity_processor.process_all_activities()
+
+        # Then
+        assert result is True
+        assert runalyze_service.upload.call_count == 2
+        assert fit_file_service.cleanup_file.call_count == 2
+
+    def test_ride_metrics_are_recorded_with_ftp(self, mock_services):
+        """Test that each downloaded ride gets metrics when an FTP is set."""
+        # Given
+        zwift_service, runalyze_service, fit_file_service = mock_services
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service, ftp=250, max_hr=190)
+        zwift_service.download_all_activities.return_value = ["/tmp/a.fit", "/tmp/b.fit"]
+        streams = {"timestamp": np.arange(60.0), "power": np.full(60, 200.0)}
+
+        # When
+        with patch('services.ride_metrics.read_streams', side_effect=[streams, ValueError("corrupt")]) as read:
+            result = processor.process_all_activities()
+
+        # Then
+        assert result is True
+        read.assert_any_call("/tmp/b.fit")
+        assert list(processor.report.metrics) == ["/tmp/a.fit"]
+        assert processor.report.metrics["/tmp/a.fit"]["average_power"] == 200.0
+
+    def test_power_curve_is_updated(self, mock_services, tmp_path):
+        """Test that downloaded rides are added to the power curve index."""
+        # Given
+        zwift_service, runalyze_service, fit_file_service = mock_services
+        power_curve = PowerCurveIndex(str(tmp_path / "power_curve.json"))
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service, power_curve=power_curve)
+        zwift_service.download_all_activities.return_value = ["/tmp/a.fit"]
+        streams = {"timestamp": 1760000000.0 + np.arange(600.0), "power": np.full(600, 300.0)}
+
+        # When
+        with patch('services.ride_metrics.read_streams', return_value=streams):
+            processor.process_all_activities()
+
+        # Then
+        assert power_curve.curve()[300] == (300.0, 1760000000)
+        assert processor.report.metrics == {}
+
+
+class TestActivityProcessorBatchTransform:
+    """Test cases for the batch transformation mode of ActivityProcessor."""
+
+    @pytest.fixture
+    def mock_services(self):
+        """Create mock services for testing."""
+        zwift_service = Mock(spec=ZwiftService)
+        runalyze_service = mock_destination(RunalyzeService, "runalyze")
+        fit_file_service = Mock(spec=FitFileService)
+        return zwift_service, runalyze_service, fit_file_service
+
+    def test_process_last_x_activities_transforms_in_process_pool(self, mock_services):
+        """Test that batch runs transform all files before uploading them."""
+        # Given
+        zwift_service, runalyze_service, fit_file_service = mock_services
+        original_paths = ["/tmp/a.fit", "/tmp/b.fit"]
+        modified_paths = {"/tmp/a.fit": "/tmp/modified_a.fit", "/tmp/b.fit": "/tmp/modified_b.fit"}
+        zwift_service.download_last_x_activities.return_value = list(original_paths)
+        fit_file_service.modify_device_info_batch.return_value = modified_paths
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service,
+                                      modify_device=True, transform_workers=4)
+
+        # When
+        result = processor.process_last_x_activities(2)
+
+        # Then
+        assert result is True
+        fit_file_service.modify_device_info_batch.assert_called_once_with(original_paths, max_workers=4)
+        assert [c.args[0] for c in runalyze_service.upload.call_args_list] == \
+            ["/tmp/modified_a.fit", "/tmp/modified_b.fit"]
+        cleaned = {c.args[0] for c in fit_file_service.cleanup_file.call_args_list}
+        assert cleaned == set(original_paths) | set(modified_paths.values())
+
+    def test_process_last_x_activities_skips_failed_transforms(self, mock_services):
+        """Test that files which failed to transform are not uploaded."""
+        # Given
+        zwift_service, runalyze_service, fit_file_service = mock_services
+        zwift_service.download_last_x_activities.return_value = ["/tmp/a.fit", "/tmp/b.fit"]
+        fit_file_service.modify_device_info_batch.return_value = {"/tmp/b.fit": "/tmp/modified_b.fit"}
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service, modify_device=True)
+
+        # When
+        result = processor.process_last_x_activities(2)
 
         # Then
         assert result is False
+        runalyze_service.upload.assert_called_once_with("/tmp/modified_b.fit")
 
-        # Verify cleanup is still called
-        fit_file_service.cleanup_file.assert_any_call(original_file_path)
-        fit_file_service.cleanup_file.assert_any_call(modified_file_path)
+    def test_split_rides_are_merged_before_upload(self, mock_services):
+        """Test that adjacent activities are uploaded as one merged file."""
+        # Given
+        zwift_service, runalyze_service, fit_file_service = mock_services
+        records = {"/tmp/c.fit": ActivityRecord("c", start=20000, end=21000, sport="CYCLING"),
+                   "/tmp/b.fit": ActivityRecord("b", start=3700, end=7200, sport="CYCLING"),
+                   "/tmp/a.fit": ActivityRecord("a", start=0, end=3600, sport="CYCLING")}
+        zwift_service.download_last_x_activities.return_value = list(records)
+        zwift_service.activity_for.side_effect = records.get
+        fit_file_service.merge_activities.return_value = "/tmp/merged_a.fit"
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service, merge_gap=600)
+
+        # When
+        result = processor.process_last_x_activities(3)
+
+        # Then
+        assert result is True
+        fit_file_service.merge_activities.assert_called_once_with(["/tmp/a.fit", "/tmp/b.fit"])
+        assert [c.args[0] for c in runalyze_service.upload.call_args_list] == ["/tmp/c.fit", "/tmp/merged_a.fit"]
+        cleaned = {c.args[0] for c in fit_file_service.cleanup_file.call_args_list}
+        assert cleaned == set(records) | {"/tmp/merged_a.fit"}
+
+
+class TestActivityProcessorFanOut:
+    """Test cases for uploading one download to several destinations."""
+
+    @pytest.fixture
+    def mock_services(self):
+        """Create mock services with three destinations."""
+        zwift_service = Mock(spec=ZwiftService)
+        fit_file_service = Mock(spec=FitFileService)
+        destinations = [mock_destination(RunalyzeService, "runalyze"),
+                        mock_destination(GarminService, "garmin"),
+                        mock_destination(ArchiveService, "archive")]
+        return zwift_service, destinations, fit_file_service
 
-    def test_process_latest_activity_cleanup_on_success(self, activity_processor, mock_services):
-        """Test that cleanup is performed even on successful processing."""
+    def test_one_download_fans_out_to_all_destinations(self, mock_services):
+        """Test that each file is downloaded once and uploaded everywhere."""
         # Given
-        zwift_service, fit_file_service, garmin_service = mock_services
+        zwift_service, destinations, fit_file_service = mock_services
+        zwift_service.download_last_x_activities.return_value = ["/tmp/a.fit", "/tmp/b.fit"]
+        processor = ActivityProcessor(zwift_service, destinations, fit_file_service)
 
-        original_file_path = "/tmp/original.fit"
-        modified_file_path = "/tmp/modified.fit"
+        # When
+        result = processor.process_last_x_activities(2)
 
-        zwift_service.download_last_activity.return_value = original_file_path
-        fit_file_service.modify_device_info.return_value = modified_file_path
-        garmin_service.upload_activity.return_value = {"status": "success"}
+        # Then
+        assert result is True
+        zwift_service.download_last_x_activities.assert_called_once_with(2)
+        for destination in destinations:
+            destination.upload_batch.assert_called_once_with(["/tmp/a.fit", "/tmp/b.fit"])
+        assert processor.report.outcomes() == {
+            "/tmp/a.fit": {"runalyze": True, "garmin": True, "archive": True},
+            "/tmp/b.fit": {"runalyze": True, "garmin": True, "archive": True},
+        }
+
+    def test_fan_out_is_traced(self, mock_services, tmp_path):
+        """Test that uploads in pool threads are spans of the run's trace, tagged with the activity."""
+        # Given
+        zwift_service, destinations, fit_file_service = mock_services
+
+        def download(x):
+            # Like ZwiftService.download_activity
+            tracing.link_file("/tmp/a.fit", "42")
+            return ["/tmp/a.fit"]
+        zwift_service.download_last_x_activities.side_effect = download
+        processor = ActivityProcessor(zwift_service, destinations, fit_file_service)
+        trace_path = tmp_path / "trace.jsonl"
 
         # When
-        result = activity_processor.process_latest_activity()
+        with Tracer(FileSpanExporter(str(trace_path))):
+            processor.process_last_x_activities(1)
+
+        # Then
+        spans = [span for line in trace_path.read_text().splitlines()
+                 for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+        by_name = {}
+        for span in spans:
+            by_name.setdefault(span["name"], []).append(span)
+        run, batch = by_name["sync.last_x_activities"][0], by_name["sync.batch"][0]
+        assert batch["parentSpanId"] == run["spanId"]
+        assert len(by_name["upload"]) == 3
+        assert {span["parentSpanId"] for span in by_name["upload"]} == {batch["spanId"]}
+        assert {span["traceId"] for span in spans} == {run["traceId"]}
+        for span in by_name["upload"]:
+            assert {"key": "activity.id", "value": {"stringValue": "42"}} in span["attributes"]
+
+    def test_failed_destination_is_tracked_separately(self, mock_services):
+        """Test that one failing destination does not block the others."""
+        # Given
+        zwift_service, destinations, fit_file_service = mock_services
+        runalyze, garmin, archive = destinations
+        zwift_service.download_last_activity.return_value = "/tmp/a.fit"
+        garmin.upload.side_effect = RuntimeError("Upload failed")
+        processor = ActivityProcessor(zwift_service, destinations, fit_file_service)
+
+        # When
+        result = processor.process_latest_activity()
+
+        # Then
+        assert result is False
+        runalyze.upload.assert_called_once_with("/tmp/a.fit")
+        archive.upload.assert_called_once_with("/tmp/a.fit")
+        assert processor.report.outcomes() == {
+            "/tmp/a.fit": {"runalyze": True, "garmin": False, "archive": True}
+        }
+        assert [r.error for r in processor.report.failed] == ["Upload failed"]
+        fit_file_service.cleanup_file.assert_called_once_with("/tmp/a.fit")
+
+    def test_destination_batch_failure_marks_all_files(self, mock_services):
+        """Test that a destination whose whole batch fails is tracked as failed."""
+        # Given
+        zwift_service, destinations, fit_file_service = mock_services
+        zwift_service.download_last_x_activities.return_value = ["/tmp/a.fit", "/tmp/b.fit"]
+        destinations[1].upload_batch.side_effect = RuntimeError("Authentication failed")
+        processor = ActivityProcessor(zwift_service, destinations, fit_file_service)
+
+        # When
+        result = processor.process_last_x_activities(2)
+
+        # Then
+        assert result is False
+        assert {path: r["garmin"] for path, r in processor.report.outcomes().items()} == \
+            {"/tmp/a.fit": False, "/tmp/b.fit": False}
+        assert all(r["runalyze"] and r["archive"] for r in processor.report.outcomes().values())
+
+    def test_duplicates_count_as_success(self, mock_services):
+        """Test that activities a destination already has do not fail the run."""
+        # Given
+        zwift_service, destinations, fit_file_service = mock_services
+        zwift_service.download_last_activity.return_value = "/tmp/a.fit"
+        destinations[0].upload.side_effect = lambda path: UploadResult(path, "runalyze", UploadStatus.DUPLICATE)
+        processor = ActivityProcessor(zwift_service, destinations, fit_file_service)
+
+        # When
+        result = processor.process_latest_activity()
+
+        # Then
+        assert result is True
+        assert [r.destination for r in processor.report.duplicates] == ["runalyze"]
+
+
+class TestActivityProcessorWorkQueue:
+    """Test cases for processing through the durable work queue."""
+
+    @pytest.fixture
+    def work_queue(self, tmp_path):
+        """Create a queue that retries failed jobs immediately."""
+        return WorkQueue(str(tmp_path / "queue.sqlite"), retry_delay=0, max_attempts=3)
+
+    @pytest.fixture
+    def mock_services(self, tmp_path):
+        """Create mock services that download to real files."""
+        zwift_service = Mock(spec=ZwiftService)
+        zwift_service.list_activities.return_value = [
+            {"id": "2", "startDate": "2025-10-16T17:00:00.000+0000"},
+            {"id": "1", "startDate": "2025-10-14T17:00:00.000+0000"},
+        ]
+
+        def download(activity):
+            path = tmp_path / f"zwift_activity_{activity['id']}.fit"
+            path.write_bytes(b"fit")
+            return str(path)
+
+        zwift_service.download_activity.side_effect = download
+        fit_file_service = Mock(spec=FitFileService)
+        return zwift_service, fit_file_service
+
+    def test_enqueue_activities_filters_by_date(self, mock_services, work_queue):
+        """Test that the since filter applies when listing into the queue."""
+        # Given
+        zwift_service, fit_file_service = mock_services
+        processor = ActivityProcessor(zwift_service, [], fit_file_service)
+
+        # When
+        added = processor.enqueue_activities(work_queue, since="2025-10-15")
+        added_again = processor.enqueue_activities(work_queue, since="2025-10-15")
+
+        # Then
+        assert (added, added_again) == (1, 0)
+        zwift_service.list_activities.assert_called_with(None)
+        assert work_queue.get("2").state == LISTED
+
+    def test_worker_processes_jobs_to_uploaded(self, mock_services, work_queue):
+        """Test that each job is downloaded, uploaded and cleaned up."""
+        # Given
+        zwift_service, fit_file_service = mock_services
+        runalyze_service = mock_destination(RunalyzeService, "runalyze")
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service)
+        processor.enqueue_activities(work_queue)
+
+        # When
+        result = processor.run_queue_worker(work_queue, worker_id="worker-a")
 
         # Then
         assert result is True
+        assert work_queue.counts()[UPLOADED] == 2
+        assert runalyze_service.upload.call_count == 2
+        assert fit_file_service.cleanup_file.call_count == 2
 
-        # Verify cleanup is called
+    def test_retry_only_uploads_to_missing_destinations(self, mock_services, work_queue):
+        """Test that a failed destination is retried without re-uploading elsewhere."""
+        # Given
+        zwift_service, fit_file_service = mock_services
+        zwift_service.list_activities.return_value = zwift_service.list_activities.return_value[:1]
+        runalyze_service = mock_destination(RunalyzeService, "runalyze")
+        garmin_service = mock_destination(GarminService, "garmin")
+        garmin_service.upload.side_effect = [
+            UploadResult("x", "garmin", UploadStatus.FAILED, retryable=True, error="HTTP 503"),
+            UploadResult("x", "garmin", UploadStatus.SUCCESS),
+        ]
+        processor = ActivityProcessor(zwift_service, [runalyze_service, garmin_service], fit_file_service)
+        processor.enqueue_activities(work_queue)
+
+        # When
+        result = processor.run_queue_worker(work_queue, worker_id="worker-a")
+
+        # Then
+        assert result is False
+        assert work_queue.get("2").state == UPLOADED
+        assert runalyze_service.upload.call_count == 1
+        assert garmin_service.upload.call_count == 2
+        zwift_service.download_activity.assert_called_once()
+
+    def test_resumes_transformed_job_without_download(self, mock_services, work_queue, tmp_path):
+        """Test that a job left by a crashed worker continues from its state."""
+        # Given
+        zwift_service, fit_file_service = mock_services
+        runalyze_service = mock_destination(RunalyzeService, "runalyze")
+        fit_path = tmp_path / "zwift_activity_7.fit"
+        fit_path.write_bytes(b"fit")
+        work_queue.enqueue("7", {"activity": {"id": "7"}})
+        job = work_queue.claim("crashed-worker")
+        job.payload.update(file_path=str(fit_path), upload_path=str(fit_path))
+        # The crashed worker's lease expires right away
+        work_queue.visibility_timeout = 0
+        work_queue.advance(job, TRANSFORMED)
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service)
+
+        # When
+        processor.run_queue_worker(work_queue, worker_id="worker-b")
+
+        # Then
+        zwift_service.download_activity.assert_not_called()
+        runalyze_service.upload.assert_called_once_with(str(fit_path))
+        assert work_queue.get("7").state == UPLOADED
+
+    def test_lease_outlives_a_slow_upload(self, mock_services, tmp_path):
+        """Test that a job is not taken over while its upload runs past the visibility timeout."""
+        # Given
+        zwift_service, fit_file_service = mock_services
+        clock = Mock(return_value=1000.0)
+        work_queue = WorkQueue(str(tmp_path / "queue.sqlite"), visibility_timeout=300, renew_interval=0.01,
+                               clock=clock)
+        taken = []
+
+        def slow_upload(path):
+            clock.return_value += 301
+            time.sleep(0.2)
+            taken.append(work_queue.claim("worker-b"))
+            return UploadResult(path, "runalyze", UploadStatus.SUCCESS)
+
+        runalyze_service = mock_destination(RunalyzeService, "runalyze")
+        runalyze_service.upload.side_effect = slow_upload
+        zwift_service.list_activities.return_value = zwift_service.list_activities.return_value[:1]
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service)
+        processor.enqueue_activities(work_queue)
+
+        # When
+        result = processor.run_queue_worker(work_queue, worker_id="worker-a")
+
+        # Then
+        assert result is True
+        assert taken == [None]
+        assert work_queue.get("2").state == UPLOADED
+
+    def test_permanent_failure_marks_job_failed(self, mock_services, work_queue):
+        """Test that a non-retryable upload error fails the job and cleans up."""
+        # Given
+        zwift_service, fit_file_service = mock_services
+        runalyze_service = mock_destination(RunalyzeService, "runalyze")
+        runalyze_service.upload.side_effect = lambda path: UploadResult(
+            path, "runalyze", UploadStatus.FAILED, error="HTTP 401")
+        processor = ActivityProcessor(zwift_service, [runalyze_service], fit_file_service)
+        processor.enqueue_activities(work_queue)
+
+        # When
+        result = processor.run_queue_worker(work_queue, worker_id="worker-a")
+
+        # Then
+        assert result is False
+        assert work_queue.counts()[FAILED] == 2
         assert fit_file_service.cleanup_file.call_count == 2
-        fit_file_service.cleanup_file.assert_any_call(original_file_path)
-        fit_file_service.cleanup_file.assert_any_call(modified_file_path)
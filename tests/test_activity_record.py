@@ -0,0 +1,110 @@
+"""Tests for ActivityRecord and the timestamp parser."""
+
+import pytest
+from datetime import datetime
+from services.activity_record import (ActivityRecord, as_record, format_timestamp, parse_timestamp,
+                                     split_session_groups)
+
+ZWIFT_ENTRY = {
+    "id": 1234567890123456789,
+    "name": "Watopia",
+    "startDate": "2025-10-14T18:00:00.000+0000",
+    "endDate": "2025-10-14T19:00:00.000+0000",
+    "fitFileBucket": "s3-fit-prd-uswest2-zwift",
+    "fitFileKey": "prod/123/abc",
+    "sport": "CYCLING",
+    "movingTimeInMs": 3600000,
+    "distanceInMeters": 32000.5,
+    "snapshotList": [{"url": "https://example.com/1.jpg"}],
+}
+
+
+class TestParseTimestamp:
+    """Test cases for parse_timestamp."""
+
+    @pytest.mark.parametrize("value", [
+        "2025-10-14T18:00:00.000+0000",
+        "2025-10-14T18:00:00+00:00",
+        "2025-10-14T18:00:00Z",
+        "2025-10-14T20:00:00.123456+0200",
+        "2025-10-14T13:30:00-0430",
+        "2025-10-14 18:00:00",
+    ])
+    def test_formats(self, value):
+        """Test that the variants all parse to the same instant."""
+        assert parse_timestamp(value) == 1760464800
+
+    def test_matches_strptime(self):
+        """Test that the fast path agrees with datetime.strptime."""
+        # Given
+        values = [f"{year}-{month:02d}-28T23:59:59.999+0100" for year in (1999, 2000, 2024) for month in range(1, 13)]
+
+        # Then
+        for value in values:
+            assert parse_timestamp(value) == int(datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z").timestamp())
+
+    @pytest.mark.parametrize("value", ["", "2025-10-14", "2025-13-14T18:00:00Z", "2025-10-14T18:00:00+01", None])
+    def test_invalid(self, value):
+        """Test that malformed timestamps raise ValueError."""
+        with pytest.raises(ValueError):
+            parse_timestamp(value)
+
+
+class TestActivityRecord:
+    """Test cases for ActivityRecord."""
+
+    def test_from_dict_keeps_pipeline_fields(self):
+        """Test that a catalog entry is reduced to the needed fields."""
+        # When
+        record = ActivityRecord.from_dict(ZWIFT_ENTRY)
+
+        # Then
+        assert record.id == ZWIFT_ENTRY["id"]
+        assert (record.start, record.end) == (1760464800, 1760468400)
+        assert (record.fit_file_bucket, record.fit_file_key) == ("s3-fit-prd-uswest2-zwift", "prod/123/abc")
+        assert (record.sport, record.duration_ms, record.distance) == ("CYCLING", 3600000, 32000.5)
+        assert not hasattr(record, "__dict__")
+
+    def test_round_trip(self):
+        """Test that to_dict output converts back to an equal record."""
+        # Given
+        record = ActivityRecord.from_dict(ZWIFT_ENTRY)
+
+        # When
+        entry = record.to_dict()
+
+        # Then
+        assert entry["startDate"] == format_timestamp(1760464800) == "2025-10-14T18:00:00.000+0000"
+        assert "snapshotList" not in entry
+        assert ActivityRecord.from_dict(entry) == record
+
+    def test_as_record(self):
+        """Test that records pass through and partial entries convert."""
+        # Given
+        record = ActivityRecord("1")
+
+        # Then
+        assert as_record(record) is record
+        assert as_record({"id": "2", "fitFileKey": "k"}) == ActivityRecord("2", fit_file_key="k")
+
+
+class TestSplitSessionGroups:
+    """Test cases for split_session_groups."""
+
+    def test_groups_adjacent_activities(self):
+        """Test that pieces of one ride are grouped oldest first."""
+        # Given: catalog order is newest first
+        records = [
+            ActivityRecord("later", start=20000, end=21000, sport="CYCLING"),
+            ActivityRecord("piece2", start=3700, end=7200, sport="CYCLING"),
+            ActivityRecord("run", start=7300, end=9000, sport="RUNNING"),
+            ActivityRecord("piece1", start=0, end=3600, sport="CYCLING"),
+            ActivityRecord("untimed"),
+        ]
+
+        # When
+        groups = split_session_groups(records, max_gap=300)
+
+        # Then
+        assert [[record.id for record in group] for group in groups] == \
+            [["untimed"], ["piece1", "piece2"], ["run"], ["later"]]
@@ -0,0 +1,39 @@
+"""Tests for ArchiveService."""
+
+import os
+import pytest
+from services.archive_service import ArchiveService
+from services.upload_result import UploadStatus
+
+
+class TestArchiveService:
+    """Test cases for ArchiveService."""
+
+    @pytest.fixture
+    def archive_service(self, tmp_path):
+        """Create an ArchiveService writing into a temporary directory."""
+        return ArchiveService(str(tmp_path / "archive"))
+
+    def test_upload_copies_file(self, archive_service, tmp_path):
+        """Test that uploading copies the file into the archive directory."""
+        # Given
+        fit_file_path = tmp_path / "zwift_activity_12345.fit"
+        fit_file_path.write_bytes(b"fake fit file content")
+
+        # When
+        result = archive_service.upload(str(fit_file_path))
+
+        # Then
+        archive_path = os.path.join(archive_service.archive_dir, "zwift_activity_12345.fit")
+        assert result.status is UploadStatus.SUCCESS
+        assert result.response == archive_path
+        assert result.bytes_sent == len(b"fake fit file content")
+        with open(archive_path, "rb") as f:
+            assert f.read() == b"fake fit file content"
+        assert fit_file_path.exists()
+
+    def test_upload_file_not_found(self, archive_service):
+        """Test that archiving a missing file fails."""
+        # When & Then
+        with pytest.raises(FileNotFoundError, match="FIT file not found"):
+            archive_service.upload("/non/existent/file.fit")
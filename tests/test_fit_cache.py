@@ -0,0 +1,88 @@
+"""Tests for FitCache."""
+
+import os
+import pytest
+from services.fit_cache import FitCache
+
+
+class FakeClock:
+    """Manually advanced wall clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        self.now += 1
+        return self.now
+
+
+class TestFitCache:
+    """Test cases for FitCache."""
+
+    @pytest.fixture
+    def fit_cache(self, tmp_path):
+        """Create a compressed cache with room for about three small files."""
+        return FitCache(str(tmp_path / "cache"), max_bytes=3 * 1100, clock=FakeClock())
+
+    def test_put_and_get(self, fit_cache, tmp_path):
+        """Test that a stored file is returned unchanged."""
+        # Given
+        data = b"\x0e\x10fit" * 1000
+
+        # When
+        fit_cache.put("zwift:1", data)
+
+        # Then
+        assert fit_cache.get("zwift:1") == data
+        assert fit_cache.get("zwift:2") is None
+        target = tmp_path / "restored.fit"
+        assert fit_cache.get_file("zwift:1", str(target))
+        assert target.read_bytes() == data
+
+    def test_content_is_stored_once(self, fit_cache):
+        """Test that identical files share one compressed object."""
+        # When
+        fit_cache.put("zwift:1", b"same ride" * 100)
+        fit_cache.put("zwift:2", b"same ride" * 100)
+
+        # Then
+        stats = fit_cache.stats()
+        assert (stats["keys"], stats["objects"]) == (2, 1)
+        assert stats["stored_bytes"] < 900
+
+    def test_evicts_least_recently_used(self, fit_cache):
+        """Test that the oldest unused file is evicted beyond the budget."""
+        # Given
+        for i in range(3):
+            fit_cache.put(f"zwift:{i}", os.urandom(1000))
+        fit_cache.get("zwift:0")
+
+        # When
+        fit_cache.put("zwift:3", os.urandom(1000))
+
+        # Then
+        assert fit_cache.get("zwift:1") is None
+        assert fit_cache.get("zwift:0") is not None
+        assert fit_cache.get("zwift:3") is not None
+        assert fit_cache.stats()["stored_bytes"] <= fit_cache.max_bytes
+
+    def test_missing_object_is_a_miss(self, fit_cache):
+        """Test that a deleted object file is dropped from the index."""
+        # Given
+        fit_cache.put("zwift:1", b"ride")
+        for directory, _, files in os.walk(os.path.join(fit_cache.root, "objects")):
+            for name in files:
+                os.remove(os.path.join(directory, name))
+
+        # Then
+        assert fit_cache.get("zwift:1") is None
+        assert fit_cache.stats()["objects"] == 0
+
+    def test_uncompressed_and_reopened(self, tmp_path):
+        """Test the uncompressed mode and that the index persists."""
+        # Given
+        root = str(tmp_path / "cache")
+        FitCache(root, compress=False).put("zwift:1", b"ride")
+
+        # Then
+        assert FitCache(root).get("zwift:1") == b"ride"
@@ -0,0 +1,154 @@
+"""Tests for the struct-based FIT encoder and rewriter."""
+
+import os
+import fitparse
+import numpy as np
+import pytest
+from fit_tool.fit_file import FitFile
+from fit_tool.utils.crc import crc16 as reference_crc16
+from services.fit_encoder import (DEVICE_INFO, FILE_ID, RECORD, SESSION, FitEncoder, MessageDefinition, crc16,
+                                  fit_timestamp, merge, rewrite)
+
+START = 1760000000
+
+
+def encode_ride(num_records: int = 60, start: int = START, sport: int = None) -> bytes:
+    """Encode a file_id message, num_records one second records and optionally a session."""
+    encoder = FitEncoder(capacity=32)
+    encoder.define(0, MessageDefinition.from_profile(FILE_ID, ["type", "manufacturer", "product", "time_created"]))
+    encoder.write(0, {"type": 4, "manufacturer": 260, "product": 0, "time_created": fit_timestamp(START)})
+    encoder.define(1, MessageDefinition.from_profile(RECORD, ["timestamp", "power", "heart_rate", "distance", "speed"]))
+    i = np.arange(num_records)
+    heart_rate = np.full(num_records, 140.0)
+    heart_rate[1] = np.nan
+    encoder.write_rows(1, {"timestamp": fit_timestamp(start) + i, "power": 200 + i % 50, "heart_rate": heart_rate,
+                           "distance": i * 8.5, "speed": np.full(num_records, 8.5)})
+    if sport is not None:
+        encoder.define(2, MessageDefinition.from_profile(SESSION, ["timestamp", "sport", "total_distance"]))
+        encoder.write(2, {"timestamp": fit_timestamp(start) + num_records, "sport": sport, "total_distance": 1.0})
+    return encoder.getvalue()
+
+
+def messages(data: bytes, tmp_path, name: str):
+    """Values of the named messages, decoded by fitparse."""
+    path = tmp_path / "file.fit"
+    path.write_bytes(data)
+    return [message.get_values() for message in fitparse.FitFile(str(path)).get_messages(name)]
+
+
+class TestCrc16:
+    """Test cases for crc16."""
+
+    @pytest.mark.parametrize("size", [0, 1, 2, 1001])
+    def test_matches_reference(self, size):
+        """Test the two-bytes-per-lookup CRC against the FIT SDK algorithm."""
+        data = os.urandom(size)
+        assert crc16(data) == reference_crc16(data)
+
+
+class TestFitEncoder:
+    """Test cases for FitEncoder."""
+
+    def test_scalar_and_bulk_messages(self, tmp_path):
+        """Test that encoded messages decode to the written values."""
+        # When
+        data = encode_ride()
+
+        # Then
+        file_id = messages(data, tmp_path, "file_id")[0]
+        assert file_id["manufacturer"] == "zwift" and file_id["type"] == "activity"
+        records = messages(data, tmp_path, "record")
+        assert len(records) == 60
+        assert records[0]["timestamp"].timestamp() == START
+        assert (records[10]["power"], records[10]["heart_rate"]) == (210, 140)
+        assert records[10]["distance"] == 85.0 and records[10]["speed"] == 8.5
+        assert records[1]["heart_rate"] is None
+
+    def test_readable_by_fit_tool(self, tmp_path):
+        """Test that fit_tool accepts the header, definitions and CRC."""
+        # Given
+        path = tmp_path / "ride.fit"
+        path.write_bytes(encode_ride(5))
+
+        # Then
+        assert len(FitFile.from_file(str(path)).records) == 2 + 1 + 5
+
+
+class TestRewrite:
+    """Test cases for rewrite."""
+
+    def test_transforms_selected_messages_only(self, tmp_path):
+        """Test that records are copied byte for byte while file_id changes."""
+        # Given
+        data = encode_ride()
+
+        # When
+        rewritten = rewrite(data, {FILE_ID: lambda values: dict(values, manufacturer=1, product=3122)})
+
+        # Then
+        assert messages(rewritten, tmp_path, "file_id")[0]["manufacturer"] == "garmin"
+        assert messages(rewritten, tmp_path, "record") == messages(data, tmp_path, "record")
+        assert len(rewritten) == len(data)
+
+    def test_adds_missing_fields(self, tmp_path):
+        """Test that fields missing from a definition are appended."""
+        # Given
+        encoder = FitEncoder()
+        encoder.define(0, MessageDefinition.from_profile(DEVICE_INFO, ["timestamp", "device_index"]))
+        encoder.write(0, {"timestamp": fit_timestamp(START), "device_index": 0})
+
+        # When
+        rewritten = rewrite(encoder.getvalue(), {DEVICE_INFO: lambda values: dict(values, software_version=975)},
+                            add_fields={DEVICE_INFO: ("software_version",)})
+
+        # Then
+        assert messages(rewritten, tmp_path, "device_info")[0]["software_version"] == 9.75
+
+    def test_invalid_file(self):
+        """Test that data without a FIT header is rejected."""
+        with pytest.raises(ValueError, match="Invalid FIT file"):
+            rewrite(b"not a fit file at all", {})
+
+
+class TestMerge:
+    """Test cases for merge."""
+
+    def test_appends_records_and_recomputes_summaries(self, tmp_path):
+        """Test that a split ride becomes one file with continuous distance and new totals."""
+        # Given
+        first = encode_ride(60, sport=2)
+        second = encode_ride(30, start=START + 120, sport=2)
+
+        # When
+        merged = merge([first, second])
+
+        # Then
+        records = messages(merged, tmp_path, "record")
+        assert len(records) == 90
+        assert records[60]["distance"] == pytest.approx(59 * 8.5)
+        assert records[-1]["distance"] == pytest.approx(59 * 8.5 + 29 * 8.5)
+        assert len(messages(merged, tmp_path, "file_id")) == 1
+        sessions = messages(merged, tmp_path, "session")
+        assert len(sessions) == 1
+        session = sessions[0]
+        assert session["sport"] == "cycling"
+        assert session["start_time"].timestamp() == START
+        assert session["total_elapsed_time"] == 149 and session["total_timer_time"] == 59 + 29
+        assert session["total_distance"] == pytest.approx(88 * 8.5)
+        assert session["max_power"] == 249 and session["max_heart_rate"] == 140
+        assert len(messages(merged, tmp_path, "lap")) == 1
+        assert messages(merged, tmp_path, "activity")[0]["num_sessions"] == 1
+
+    def test_readable_by_fit_tool(self, tmp_path):
+        """Test that the merged file has a valid header and CRC."""
+        # Given
+        path = tmp_path / "merged.fit"
+        path.write_bytes(merge([encode_ride(5), encode_ride(5, start=START + 10)]))
+
+        # Then
+        assert len(FitFile.from_file(str(path)).records) > 10
+
+    def test_nothing_to_merge(self):
+        """Test that an empty list is rejected."""
+        with pytest.raises(ValueError, match="Nothing to merge"):
+            merge([])
@@ -0,0 +1,204 @@
+"""Tests for FitFileService."""
+
+import os
+import json
+import time
+import fitparse
+import pytest
+from fit_tool.fit_file import FitFile
+from fit_tool.fit_file_builder import FitFileBuilder
+from fit_tool.profile.messages.file_id_message import FileIdMessage
+from fit_tool.profile.messages.record_message import RecordMessage
+from fit_tool.profile.profile_type import FileType, Manufacturer
+from services import tracing
+from services.fit_file_service import FitFileService
+from services.tracing import FileSpanExporter, Tracer
+
+
+def write_sample_fit_file(file_path: str, num_records: int = 10, start: int = None) -> str:
+    """Write a small activity FIT file for testing (start in epoch milliseconds)."""
+    start = start or round(time.time() * 1000)
+    builder = FitFileBuilder(auto_define=True)
+
+    file_id_message = FileIdMessage()
+    file_id_message.type = FileType.ACTIVITY
+    file_id_message.manufacturer = Manufacturer.ZWIFT.value
+    file_id_message.product = 0
+    file_id_message.time_created = start
+    file_id_message.serial_number = 1
+    builder.add(file_id_message)
+
+    for i in range(num_records):
+        record_message = RecordMessage()
+        record_message.timestamp = start + i * 1000
+        record_message.power = 200 + i
+        record_message.heart_rate = 140
+        builder.add(record_message)
+
+    builder.build().to_file(file_path)
+    return file_path
+
+
+class TestFitFileService:
+    """Test cases for FitFileService."""
+
+    @pytest.fixture
+    def fit_file_service(self, tmp_path):
+        """Create a FitFileService instance writing to a work directory."""
+        return FitFileService(cache_dir=str(tmp_path / "work"))
+
+    @pytest.fixture
+    def sample_fit_files(self, tmp_path):
+        """Create sample FIT files for testing."""
+        return [write_sample_fit_file(str(tmp_path / f"zwift_activity_{i}.fit")) for i in range(3)]
+
+    def test_modify_device_info_file_not_found(self, fit_file_service):
+        """Test modify_device_info with non-existent file."""
+        # When & Then
+        with pytest.raises(FileNotFoundError, match="FIT file not found"):
+            fit_file_service.modify_device_info("/non/existent/file.fit")
+
+    def test_modify_device_info_sets_device(self, fit_file_service, tmp_path):
+        """Test that the creator device becomes a Garmin Edge 530."""
+        # Given
+        original_path = write_sample_fit_file(str(tmp_path / "zwift_activity_1.fit"))
+
+        # When
+        modified_path = fit_file_service.modify_device_info(original_path, software_version=9.8)
+
+        # Then
+        modified = fitparse.FitFile(modified_path)
+        file_id = next(modified.get_messages("file_id")).get_values()
+        assert file_id["manufacturer"] == "garmin"
+        assert file_id["garmin_product"] == 3122
+        original_records = [m.get_values() for m in fitparse.FitFile(original_path).get_messages("record")]
+        assert [m.get_values() for m in modified.get_messages("record")] == original_records
+        fit_file_service.cleanup_file(modified_path)
+
+    def test_modify_device_info_invalid_file(self, fit_file_service, tmp_path):
+        """Test that a file that is not a FIT file fails with RuntimeError."""
+        # Given
+        broken_path = tmp_path / "broken.fit"
+        broken_path.write_bytes(b"not a fit file")
+
+        # When & Then
+        with pytest.raises(RuntimeError, match="Failed to modify FIT file"):
+            fit_file_service.modify_device_info(str(broken_path))
+
+    def test_merge_activities(self, fit_file_service, tmp_path):
+        """Test that the pieces of a split ride become one activity."""
+        # Given
+        start = round(time.time() * 1000)
+        paths = [write_sample_fit_file(str(tmp_path / "zwift_activity_1.fit"), 10, start),
+                 write_sample_fit_file(str(tmp_path / "zwift_activity_2.fit"), 5, start + 60000)]
+
+        # When
+        merged_path = fit_file_service.merge_activities(paths)
+
+        # Then
+        merged = fitparse.FitFile(merged_path)
+        assert len(list(merged.get_messages("record"))) == 15
+        session = next(merged.get_messages("session")).get_values()
+        assert session["total_timer_time"] == 9 + 4
+        assert session["max_power"] == 209
+        assert os.path.dirname(merged_path) == fit_file_service.cache_dir
+        assert fit_file_service.merge_activities(paths) != merged_path
+        fit_file_service.cleanup_file(merged_path)
+
+    def test_merge_activities_invalid_file(self, fit_file_service, tmp_path):
+        """Test that an unreadable piece fails the merge with RuntimeError."""
+        # Given
+        broken_path = tmp_path / "broken.fit"
+        broken_path.write_bytes(b"not a fit file")
+        path = write_sample_fit_file(str(tmp_path / "zwift_activity_1.fit"))
+
+        # When & Then
+        with pytest.raises(RuntimeError, match="Failed to merge FIT files"):
+            fit_file_service.merge_activities([path, str(broken_path)])
+
+    def test_modify_device_info_batch_process_pool(self, fit_file_service, sample_fit_files):
+        """Test batch transformation across worker processes."""
+        # When
+        result = fit_file_service.modify_device_info_batch(sample_fit_files, max_workers=2)
+
+        # Then
+        assert list(result) == sample_fit_files
+        for original_path, modified_path in result.items():
+            assert os.path.dirname(modified_path) == fit_file_service.cache_dir
+            assert os.path.basename(modified_path).startswith("modified_" + os.path.basename(original_path)[:-4])
+            assert len(FitFile.from_file(modified_path).records) == len(FitFile.from_file(original_path).records)
+            fit_file_service.cleanup_file(modified_path)
+
+    def test_modify_device_info_outputs_do_not_collide(self, fit_file_service, sample_fit_files):
+        """Test that transforming the same file twice gives two distinct output files."""
+        # When
+        first = fit_file_service.modify_device_info(sample_fit_files[0])
+        second = fit_file_service.modify_device_info(sample_fit_files[0])
+
+        # Then
+        assert first != second
+        assert os.path.exists(first) and os.path.exists(second)
+
+    def test_modify_device_info_batch_traces_worker_processes(self, fit_file_service, sample_fit_files, tmp_path):
+        """Test that transforms in worker processes are recorded as spans of the parent's trace."""
+        # Given
+        trace_path = tmp_path / "trace.jsonl"
+
+        # When
+        with Tracer(FileSpanExporter(str(trace_path))):
+            for i, path in enumerate(sample_fit_files):
+                tracing.link_file(path, str(i))
+            result = fit_file_service.modify_device_info_batch(sample_fit_files + ["/non/existent.fit"],
+                                                               max_workers=2)
+            linked = {tracing.activity_of(path) for path in result.values()}
+
+        # Then
+        spans = [span for line in trace_path.read_text().splitlines()
+                 for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+        batch = next(span for span in spans if span["name"] == "fit.transform_batch")
+        transforms = [span for span in spans if span["name"] == "fit.transform"]
+        assert len(transforms) == 4
+        assert {span["parentSpanId"] for span in transforms} == {batch["spanId"]}
+        activity_ids = {a["value"]["stringValue"] for span in transforms for a in span["attributes"]
+                        if a["key"] == "activity.id"}
+        assert activity_ids == linked == {"0", "1", "2"}
+        assert sum(span["status"]["code"] == tracing.STATUS_ERROR for span in transforms) == 1
+
+    def test_modify_device_info_batch_single_worker(self, fit_file_service, sample_fit_files):
+        """Test batch transformation in the current process."""
+        # When
+        result = fit_file_service.modify_device_info_batch(sample_fit_files, max_workers=1)
+
+        # Then
+        assert list(result) == sample_fit_files
+        for modified_path in result.values():
+            assert os.path.exists(modified_path)
+            fit_file_service.cleanup_file(modified_path)
+
+    def test_modify_device_info_batch_skips_failures(self, fit_file_service, sample_fit_files):
+        """Test that a broken file does not abort the rest of the batch."""
+        # Given
+        missing_path = "/non/existent/file.fit"
+
+        # When
+        result = fit_file_service.modify_device_info_batch(
+            [missing_path] + sample_fit_files, max_workers=2)
+
+        # Then
+        assert missing_path not in result
+        assert list(result) == sample_fit_files
+        for modified_path in result.values():
+            fit_file_service.cleanup_file(modified_path)
+
+    def test_cleanup_file_forgets_its_activity(self, fit_file_service, sample_fit_files, tmp_path):
+        """Test that a cleaned up file is no longer linked to its activity."""
+        # Given
+        with Tracer(FileSpanExporter(str(tmp_path / "trace.jsonl"))):
+            tracing.link_file(sample_fit_files[0], "42")
+
+            # When
+            fit_file_service.cleanup_file(sample_fit_files[0])
+
+            # Then
+            assert not os.path.exists(sample_fit_files[0])
+            assert tracing.activity_of(sample_fit_files[0]) is None
@@ -0,0 +1,205 @@
+"""Tests for GarminService."""
+
+import json
+import pytest
+from unittest.mock import Mock
+from garminconnect import (GarminConnectAuthenticationError, GarminConnectConnectionError,
+                           GarminConnectTooManyRequestsError)
+from garth.exc import GarthHTTPError
+from requests import HTTPError
+from services.garmin_service import GarminService
+from services.retry import Retrier
+from services.upload_result import UploadStatus
+
+
+class TestGarminService:
+    """Test cases for GarminService."""
+
+    @pytest.fixture
+    def token_dir(self, tmp_path):
+        """Create an (empty) cached session directory."""
+        path = tmp_path / "garth"
+        path.mkdir()
+        return str(path)
+
+    @pytest.fixture
+    def mock_sleep(self):
+        """Sleep function of the retrier."""
+        return Mock()
+
+    @pytest.fixture
+    def garmin_service(self, token_dir, mock_sleep):
+        """Create a GarminService instance with a mock client."""
+        # Full backoff instead of a random share of it
+        retrier = Retrier(sleep=mock_sleep, jitter=lambda low, high: high)
+        service = GarminService("test_user", "test_pass", token_dir=token_dir, retrier=retrier)
+        service.client = Mock()
+        return service
+
+    def test_init_token_dir(self, monkeypatch):
+        """Test that the session path is configurable and not hard-coded."""
+        # Given
+        monkeypatch.setenv("GARMINTOKENS", "/srv/garth")
+
+        # Then
+        assert GarminService("u", "p").token_dir == "/srv/garth"
+        assert GarminService("u", "p", token_dir="/opt/tokens").token_dir == "/opt/tokens"
+
+    def test_authenticate_reuses_cached_session(self, garmin_service, token_dir):
+        """Test that a valid cached session avoids a credential login."""
+        # When
+        garmin_service.authenticate()
+
+        # Then
+        garmin_service.client.login.assert_called_once_with(token_dir)
+        garmin_service.client.garth.login.assert_not_called()
+        assert garmin_service.is_authenticated()
+
+    def test_authenticate_falls_back_to_credentials(self, garmin_service, token_dir):
+        """Test that an invalid cached session triggers a login that is saved."""
+        # Given
+        garmin_service.client.login.side_effect = GarminConnectAuthenticationError("expired")
+        garmin_service.client.garth.profile = {"displayName": "rider", "fullName": "Test Rider"}
+
+        # When
+        garmin_service.authenticate()
+
+        # Then
+        garmin_service.client.garth.login.assert_called_once_with("test_user", "test_pass")
+        garmin_service.client.garth.dump.assert_called_once_with(token_dir)
+        garmin_service.client.login.assert_called_once_with(token_dir)
+        assert garmin_service.client.display_name == "rider"
+        assert garmin_service.is_authenticated()
+
+    @pytest.mark.parametrize("error", [
+        GarthHTTPError(msg="Unauthorized", error=HTTPError(response=Mock(status_code=401))),
+        json.JSONDecodeError("Expecting value", "", 0),
+        KeyError("oauth_token"),
+    ])
+    def test_authenticate_replaces_damaged_session(self, garmin_service, error):
+        """Test that expired or unreadable cached tokens fall back to credentials."""
+        # Given
+        garmin_service.client.login.side_effect = error
+
+        # When
+        garmin_service.authenticate()
+
+        # Then
+        garmin_service.client.garth.login.assert_called_once_with("test_user", "test_pass")
+        assert garmin_service.is_authenticated()
+
+    def test_authenticate_connection_error_is_not_a_damaged_session(self, garmin_service):
+        """Test that a network outage surfaces instead of falling back to a credential login."""
+        # Given
+        garmin_service.client.login.side_effect = GarminConnectConnectionError("Connection refused")
+
+        # When
+        with pytest.raises(GarminConnectConnectionError):
+            garmin_service.authenticate()
+
+        # Then
+        garmin_service.client.garth.login.assert_not_called()
+        assert not garmin_service.is_authenticated()
+
+    def test_authenticate_without_cached_session(self, tmp_path):
+        """Test the credential login when no session has been cached yet."""
+        # Given
+        token_dir = str(tmp_path / "missing")
+        service = GarminService("test_user", "test_pass", token_dir=token_dir)
+        service.client = Mock()
+
+        # When
+        service.authenticate()
+
+        # Then
+        service.client.garth.login.assert_called_once_with("test_user", "test_pass")
+        service.client.garth.dump.assert_called_once_with(token_dir)
+        service.client.login.assert_not_called()
+
+    def test_upload_activity_backs_off_on_rate_limit(self, mock_sleep, garmin_service):
+        """Test that 429 responses are retried with exponential backoff."""
+        # Given
+        garmin_service._authenticated = True
+        garmin_service.client.upload_activity.side_effect = [
+            GarminConnectTooManyRequestsError("429"),
+            GarminConnectTooManyRequestsError("429"),
+            {"detailedImportResult": {}},
+        ]
+
+        # When
+        result = garmin_service.upload_activity("/tmp/a.fit")
+
+        # Then
+        assert result == {"detailedImportResult": {}}
+        assert [c.args[0] for c in mock_sleep.call_args_list] == [2.0, 4.0]
+        assert garmin_service.retrier.metrics()["garmin.upload"]["retries"] == 2
+
+    def test_upload_activity_is_rate_limited(self, garmin_service):
+        """Test that every upload attempt takes a Garmin Connect token."""
+        # Given
+        garmin_service.rate_limiter = Mock()
+        garmin_service._authenticated = True
+        garmin_service.client.upload_activity.side_effect = [
+            GarminConnectTooManyRequestsError("429"),
+            {"detailedImportResult": {}},
+        ]
+
+        # When
+        garmin_service.upload_activity("/tmp/a.fit")
+
+        # Then
+        assert garmin_service.rate_limiter.acquire.call_count == 2
+        garmin_service.rate_limiter.acquire.assert_called_with("connectapi.garmin.com")
+
+    def test_upload_activity_does_not_retry_other_errors(self, garmin_service):
+        """Test that non rate-limit errors fail immediately."""
+        # Given
+        garmin_service._authenticated = True
+        garmin_service.client.upload_activity.side_effect = ValueError("bad file")
+
+        # When & Then
+        with pytest.raises(RuntimeError, match="Upload failed"):
+            garmin_service.upload_activity("/tmp/a.fit")
+        garmin_service.client.upload_activity.assert_called_once()
+
+    def test_upload_activities_batch(self, garmin_service, token_dir, tmp_path):
+        """Test batch upload with one login and per-file results."""
+        # Given
+        paths = []
+        for name in ["a.fit", "bad.fit", "b.fit"]:
+            (tmp_path / name).write_bytes(b"fit")
+            paths.append(str(tmp_path / name))
+
+        def upload(path):
+            if path.endswith("bad.fit"):
+                raise ValueError("bad file")
+            return {"detailedImportResult": {"successes": [{"internalId": 42}]}}
+        garmin_service.client.upload_activity.side_effect = upload
+
+        # When
+        result = garmin_service.upload_activities(paths)
+
+        # Then
+        assert [r.status for r in result.values()] == \
+            [UploadStatus.SUCCESS, UploadStatus.FAILED, UploadStatus.SUCCESS]
+        assert result[paths[0]].activity_id == "42"
+        assert result[paths[0]].bytes_sent == 3
+        assert result[paths[1]].retryable is False
+        garmin_service.client.login.assert_called_once_with(token_dir)
+        garmin_service.client.garth.dump.assert_called_once_with(token_dir)
+
+    def test_upload_duplicate_activity(self, garmin_service, tmp_path):
+        """Test that Garmin's 409 response is reported as a duplicate."""
+        # Given
+        fit_file_path = tmp_path / "a.fit"
+        fit_file_path.write_bytes(b"fit")
+        error = GarthHTTPError(msg="Conflict", error=HTTPError(response=Mock(status_code=409)))
+        garmin_service._authenticated = True
+        garmin_service.client.upload_activity.side_effect = error
+
+        # When
+        result = garmin_service.upload(str(fit_file_path))
+
+        # Then
+        assert result.duplicate
+        assert result.ok
@@ -0,0 +1,103 @@
+"""Tests for the HTTP record/replay cassette."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from services.http_cassette import RECORD, REPLAY, SCRUBBED, CassetteMissError, HttpCassette, scrub
+
+TOKEN_RESPONSE = {"access_token": "secret-access", "refresh_token": "secret-refresh", "expires_in": 3600}
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves a token endpoint and a binary download."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self._reply("application/json", json.dumps(TOKEN_RESPONSE).encode())
+
+    def do_GET(self):
+        self._reply("application/octet-stream", bytes(range(256)))
+
+    def _reply(self, content_type: str, body: bytes):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Set-Cookie", "session=secret-cookie")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    """Base URL of a local HTTP server, shut down after the test."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_scrub():
+    """Test that tokens in JSON, form data and URLs are replaced."""
+    assert scrub('{"access_token": "abc", "expires_in": 5}') == f'{{"access_token": "{SCRUBBED}", "expires_in": 5}}'
+    assert scrub("username=me&password=pw&grant_type=password") == \
+        f"username={SCRUBBED}&password={SCRUBBED}&grant_type=password"
+    assert scrub("https://sso/embed?ticket=ST-123") == f"https://sso/embed?ticket={SCRUBBED}"
+
+
+class TestHttpCassette:
+    """Test cases for HttpCassette."""
+
+    def test_record_then_replay_offline(self, server_url, tmp_path):
+        """Test that recorded traffic is scrubbed and replayed without the server."""
+        # Given
+        path = tmp_path / "run.cassette"
+        with HttpCassette(str(path), RECORD):
+            session = requests.Session()
+            session.post(f"{server_url}/token", data={"username": "me", "password": "pw"})
+            recorded = session.get(f"{server_url}/file.fit").content
+
+        # When
+        sleeps = []
+        with HttpCassette(str(path), REPLAY, speed=2, sleep=sleeps.append) as cassette:
+            token = requests.post(f"{server_url}/token", data={"username": "other", "password": "x"}).json()
+            replayed = requests.get(f"{server_url}/file.fit", stream=True)
+
+        # Then
+        cassette_text = path.read_text()
+        assert "secret" not in cassette_text and "pw" not in cassette_text
+        assert token == {"access_token": SCRUBBED, "refresh_token": SCRUBBED, "expires_in": 3600}
+        assert b"".join(replayed.iter_content(64)) == recorded
+        assert replayed.status_code == 200 and replayed.content == recorded == bytes(range(256))
+        assert replayed.headers["Set-Cookie"] == SCRUBBED
+        assert cassette.interactions == 2 and len(sleeps) == 2
+
+    def test_unrecorded_request(self, tmp_path):
+        """Test that a request missing from the cassette fails as a request error."""
+        # Given
+        path = tmp_path / "empty.cassette"
+        path.write_text("")
+
+        # When & Then
+        with HttpCassette(str(path), REPLAY, speed=0):
+            with pytest.raises(CassetteMissError, match="No recorded response for GET"):
+                requests.get("https://example.com/activities")
+
+    def test_uninstall_restores_live_http(self, tmp_path):
+        """Test that leaving the cassette restores the original adapter."""
+        # Given
+        original_send = requests.adapters.HTTPAdapter.send
+        path = tmp_path / "empty.cassette"
+        path.write_text("")
+
+        # When
+        with HttpCassette(str(path), REPLAY):
+            assert requests.adapters.HTTPAdapter.send is not original_send
+
+        # Then
+        assert requests.adapters.HTTPAdapter.send is original_send
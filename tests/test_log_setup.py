@@ -0,0 +1,76 @@
+"""Tests for the queued logging setup."""
+
+import io
+import json
+import logging
+import threading
+import pytest
+from services import tracing
+from services.log_setup import JSON, TEXT, configure_logging, stop_logging
+from services.tracing import FileSpanExporter, Tracer
+
+
+class TestConfigureLogging:
+    """Test cases for configure_logging."""
+
+    @pytest.fixture
+    def stream(self):
+        level = logging.getLogger().level
+        stream = io.StringIO()
+        yield stream
+        stop_logging()
+        logging.getLogger().setLevel(level)
+
+    def test_json_lines(self, stream, tmp_path):
+        """Test the fields of a JSON log line logged inside a span."""
+        # Given
+        configure_logging("INFO", JSON, stream)
+        logger = logging.getLogger("services.test")
+
+        # When
+        with Tracer(FileSpanExporter(str(tmp_path / "trace.jsonl"))):
+            with tracing.span("zwift.download") as span:
+                logger.info("Activity %s downloaded", 42, extra={"fit_bytes": 2048})
+        try:
+            raise ValueError("Invalid FIT file")
+        except ValueError:
+            logger.exception("Transform failed")
+        logger.debug("Not logged")
+        stop_logging()
+
+        # Then
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert first["message"] == "Activity 42 downloaded" and first["level"] == "INFO"
+        assert first["logger"] == "services.test" and first["thread"] == threading.current_thread().name
+        assert first["fit_bytes"] == 2048
+        assert (first["trace_id"], first["span_id"]) == (span.trace_id, span.span_id)
+        assert "ValueError: Invalid FIT file" in second["exception"]
+
+    def test_mutable_arguments_are_rendered_at_the_call(self, stream):
+        """Test that an argument changed after the call is logged as it was."""
+        # Given
+        configure_logging("INFO", TEXT, stream)
+        files = ["a.fit"]
+
+        # When
+        logging.getLogger("services.test").info("Files: %s", files)
+        files.append("b.fit")
+        stop_logging()
+
+        # Then
+        assert stream.getvalue().rstrip().endswith("Files: ['a.fit']")
+
+    def test_writer_thread_is_replaced(self, stream):
+        """Test that configuring again replaces the previous queue handler and writer."""
+        # Given
+        configure_logging("INFO", TEXT, io.StringIO())
+        root_handlers = len(logging.getLogger().handlers)
+
+        # When
+        configure_logging("WARNING", TEXT, stream)
+        logging.getLogger("services.test").warning("Retry budget exhausted")
+        stop_logging()
+
+        # Then
+        assert len(logging.getLogger().handlers) == root_handlers - 1
+        assert stream.getvalue().count("Retry budget exhausted") == 1
@@ -1,51 +1,65 @@
 """Tests for main.py."""
 
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 import os
-from main import main
+import json
+import subprocess
+import sys
+from main import main, parse_args
 
 
 class TestMain:
     """Test cases for main function."""
 
+    @pytest.fixture(autouse=True)
+    def configure_logging(self):
+        with patch('main.configure_logging') as configure_logging:
+            yield configure_logging
+
     @patch.dict(os.environ, {
         'ZWIFT_USERNAME': 'zwift_user',
         'ZWIFT_PASSWORD': 'zwift_pass',
         'GARMIN_USERNAME': 'garmin_user',
-        'GARMIN_PASSWORD': 'garmin_pass'
+        'GARMIN_PASSWORD': 'garmin_pass',
+        'RUNANLYZE_TOKEN': 'runalyze_token'
     })
     @patch('main.ActivityProcessor')
-    @patch('main.GarminService')
+    @patch('main.RunalyzeService')
     @patch('main.FitFileService')
     @patch('main.ZwiftService')
     @patch('main.load_dotenv')
     def test_main_success(self, mock_load_dotenv, mock_zwift_service,
-                         mock_fit_service, mock_garmin_service, mock_processor):
+                         mock_fit_service, mock_runalyze_service, mock_processor):
         """Test successful main execution."""
         # Given
         mock_zwift_instance = Mock()
         mock_fit_instance = Mock()
-        mock_garmin_instance = Mock()
+        mock_runalyze_instance = Mock()
         mock_processor_instance = Mock()
 
         mock_zwift_service.return_value = mock_zwift_instance
         mock_fit_service.return_value = mock_fit_instance
-        mock_garmin_service.return_value = mock_garmin_instance
+        mock_runalyze_service.return_value = mock_runalyze_instance
         mock_processor.return_value = mock_processor_instance
 
         mock_processor_instance.process_latest_activity.return_value = True
 
         # When
-        main()
+        main([])
 
         # Then
         mock_load_dotenv.assert_called_once()
-        mock_zwift_service.assert_called_once_with('zwift_user', 'zwift_pass')
+        mock_zwift_service.assert_called_once_with('zwift_user', 'zwift_pass', cache_dir=None, retrier=ANY,
+                                                   rate_limiter=ANY, fit_cache=None, page_size=50)
         mock_fit_service.assert_called_once()
-        mock_garmin_service.assert_called_once_with('garmin_user', 'garmin_pass')
+        mock_runalyze_service.assert_called_once_with('runalyze_token', index_path=os.path.join(
+            os.path.expanduser("~/.zwift-to-runalyze"), "runalyze_uploads.json"), compress=False, retrier=ANY, rate_limiter=ANY)
+        assert mock_runalyze_service.call_args.kwargs["retrier"] is mock_zwift_service.call_args.kwargs["retrier"]
         mock_processor.assert_called_once_with(
-            mock_zwift_instance, mock_fit_instance, mock_garmin_instance
+            mock_zwift_instance, [mock_runalyze_instance], mock_fit_instance,
+            modify_device=False, transform_workers=None, dry_run=False, ftp=None, max_hr=None, power_curve=None,
+            merge_gap=None
         )
         mock_processor_instance.process_latest_activity.assert_called_once()
 
@@ -53,15 +67,16 @@ class TestMain:
         'ZWIFT_USERNAME': 'zwift_user',
         'ZWIFT_PASSWORD': 'zwift_pass',
         'GARMIN_USERNAME': 'garmin_user',
-        'GARMIN_PASSWORD': 'garmin_pass'
+        'GARMIN_PASSWORD': 'garmin_pass',
+        'RUNANLYZE_TOKEN': 'runalyze_token'
     })
     @patch('main.ActivityProcessor')
-    @patch('main.GarminService')
+    @patch('main.RunalyzeService')
     @patch('main.FitFileService')
     @patch('main.ZwiftService')
     @patch('main.load_dotenv')
     def test_main_processing_failure(self, mock_load_dotenv, mock_zwift_service,
-                                   mock_fit_service, mock_garmin_service, mock_processor):
+                                   mock_fit_service, mock_runalyze_service, mock_processor):
         """Test main execution with processing failure."""
         # Given
         mock_processor_instance = Mock()
@@ -70,10 +85,235 @@ class TestMain:
 
         # When & Then
         with pytest.raises(SystemExit) as exc_info:
-            main()
+            main([])
 
         assert exc_info.value.code == 1
 
+    @pytest.mark.parametrize("argv, method, expected_args", [
+        (["--last", "5"], "process_last_x_activities", (5,)),
+        (["--since", "2025-10-15"], "process_activities_since_date", ("2025-10-15",)),
+        (["--backfill"], "process_all_activities", ()),
+        (["--latest"], "process_latest_activity", ()),
+    ])
+    @patch.dict(os.environ, {
+        'ZWIFT_USERNAME': 'zwift_user',
+        'ZWIFT_PASSWORD': 'zwift_pass',
+        'GARMIN_USERNAME': 'garmin_user',
+        'GARMIN_PASSWORD': 'garmin_pass',
+        'RUNANLYZE_TOKEN': 'runalyze_token'
+    })
+    @patch('main.ActivityProcessor')
+    @patch('main.RunalyzeService')
+    @patch('main.FitFileService')
+    @patch('main.ZwiftService')
+    @patch('main.load_dotenv')
+    def test_main_sync_modes(self, mock_load_dotenv, mock_zwift_service, mock_fit_service,
+                             mock_runalyze_service, mock_processor, argv, method, expected_args):
+        """Test that each sync mode calls the matching processor method."""
+        # Given
+        mock_processor_instance = mock_processor.return_value
+
+        # When
+        main(argv)
+
+        # Then
+        getattr(mock_processor_instance, method).assert_called_once_with(*expected_args)
+
+    @patch.dict(os.environ, {
+        'ZWIFT_USERNAME': 'zwift_user',
+        'ZWIFT_PASSWORD': 'zwift_pass',
+        'GARMIN_USERNAME': 'garmin_user',
+        'GARMIN_PASSWORD': 'garmin_pass',
+        'RUNANLYZE_TOKEN': 'runalyze_token'
+    })
+    @patch('main.ActivityProcessor')
+    @patch('main.RunalyzeService')
+    @patch('main.FitFileService')
+    @patch('main.ZwiftService')
+    @patch('main.load_dotenv')
+    def test_main_tuning_options(self, mock_load_dotenv, mock_zwift_service, mock_fit_service,
+                                 mock_runalyze_service, mock_processor):
+        """Test that concurrency, dry run, cache dir and device options are passed on."""
+        # When
+        main(["--last", "3", "--concurrency", "4", "--dry-run", "--modify-device",
+              "--cache-dir", "/tmp/zwift-cache", "--log-level", "warning"])
+
+        # Then
+        mock_zwift_service.assert_called_once_with('zwift_user', 'zwift_pass', cache_dir="/tmp/zwift-cache", retrier=ANY,
+                                                   rate_limiter=ANY, fit_cache=None, page_size=50)
+        mock_fit_service.assert_called_once_with(cache_dir="/tmp/zwift-cache")
+        mock_processor.assert_called_once_with(
+            mock_zwift_service.return_value, [mock_runalyze_service.return_value], mock_fit_service.return_value,
+            modify_device=True, transform_workers=4, dry_run=True, ftp=None, max_hr=None, power_curve=None,
+            merge_gap=None
+        )
+
+    @patch.dict(os.environ, {
+        'ZWIFT_USERNAME': 'zwift_user',
+        'ZWIFT_PASSWORD': 'zwift_pass',
+        'GARMIN_USERNAME': 'garmin_user',
+        'GARMIN_PASSWORD': 'garmin_pass',
+        'RUNANLYZE_TOKEN': 'runalyze_token'
+    })
+    @patch('main.ActivityProcessor')
+    @patch('main.ArchiveService')
+    @patch('main.GarminService')
+    @patch('main.RunalyzeService')
+    @patch('main.FitFileService')
+    @patch('main.ZwiftService')
+    @patch('main.load_dotenv')
+    def test_main_multiple_destinations(self, mock_load_dotenv, mock_zwift_service, mock_fit_service,
+                                        mock_runalyze_service, mock_garmin_service, mock_archive_service,
+                                        mock_processor):
+        """Test that every requested destination is wired into one processor."""
+        # When
+        main(["--destination", "runalyze", "--destination", "garmin",
+              "--destination", "archive", "--archive-dir", "/tmp/fit-archive",
+              "--garmin-token-dir", "/tmp/garth"])
+
+        # Then
+        mock_garmin_service.assert_called_once_with('garmin_user', 'garmin_pass', token_dir="/tmp/garth", retrier=ANY,
+                                                    rate_limiter=ANY)
+        mock_archive_service.assert_called_once_with("/tmp/fit-archive")
+        destinations = mock_processor.call_args.args[1]
+        assert destinations == [mock_runalyze_service.return_value, mock_garmin_service.return_value,
+                                mock_archive_service.return_value]
+
+    @patch.dict(os.environ, {
+        'ZWIFT_USERNAME': 'zwift_user',
+        'ZWIFT_PASSWORD': 'zwift_pass',
+        'RUNANLYZE_TOKEN': 'runalyze_token'
+    })
+    @patch('main.run_daemon')
+    @patch('main.ActivityProcessor')
+    @patch('main.RunalyzeService')
+    @patch('main.FitFileService')
+    @patch('main.ZwiftService')
+    @patch('main.load_dotenv')
+    def test_main_serve(self, mock_load_dotenv, mock_zwift_service, mock_fit_service,
+                        mock_runalyze_service, mock_processor, mock_run_daemon):
+        """Test that --serve hands the processor to the daemon instead of syncing once."""
+        # When
+        main(["--serve", "--listen", "0.0.0.0:9000", "--last", "2"])
+
+        # Then
+        mock_run_daemon.assert_called_once_with(mock_processor.return_value, ANY, "zwift_user")
+        assert mock_run_daemon.call_args.args[1].listen == ("0.0.0.0", 9000)
+        mock_processor.return_value.process_last_x_activities.assert_not_called()
+
+    @pytest.mark.parametrize("argv, expected_enqueue", [
+        (["--last", "3"], {"max_count": 3, "since": None}),
+        (["--since", "2025-10-15"], {"max_count": None, "since": "2025-10-15"}),
+        ([], {"max_count": 1, "since": None}),
+        (["--worker"], None),
+    ])
+    @patch.dict(os.environ, {
+        'ZWIFT_USERNAME': 'zwift_user',
+        'ZWIFT_PASSWORD': 'zwift_pass',
+        'RUNANLYZE_TOKEN': 'runalyze_token'
+    })
+    @patch('main.ActivityProcessor')
+    @patch('main.RunalyzeService')
+    @patch('main.FitFileService')
+    @patch('main.ZwiftService')
+    @patch('main.load_dotenv')
+    def test_main_queue(self, mock_load_dotenv, mock_zwift_service, mock_fit_service,
+                        mock_runalyze_service, mock_processor, tmp_path, argv, expected_enqueue):
+        """Test that --queue-db lists the selected activities into the queue and consumes it."""
+        # Given
+        processor = mock_processor.return_value
+        processor.run_queue_worker.return_value = True
+
+        # When
+        main(argv + ["--queue-db", str(tmp_path / "queue.sqlite")])
+
+        # Then
+        if expected_enqueue is None:
+            processor.enqueue_activities.assert_not_called()
+        else:
+            processor.enqueue_activities.assert_called_once_with(ANY, **expected_enqueue)
+        processor.run_queue_worker.assert_called_once()
+        processor.process_latest_activity.assert_not_called()
+
+    @patch.dict(os.environ, {'RUNANLYZE_TOKEN': 'shared_token'}, clear=True)
+    @patch('main.run_sharded')
+    @patch('main.load_dotenv')
+    def test_main_sharded(self, mock_load_dotenv, mock_run_sharded, tmp_path):
+        """Test that --shard-db merges each athlete's credentials over the environment."""
+        # Given
+        athletes_file = tmp_path / "athletes.json"
+        athletes_file.write_text(json.dumps({
+            "alice": {"ZWIFT_USERNAME": "alice@zwift", "ZWIFT_PASSWORD": "a"},
+            "bob": {"ZWIFT_USERNAME": "bob@zwift", "ZWIFT_PASSWORD": "b", "RUNANLYZE_TOKEN": "bob_token"},
+        }))
+
+        # When
+        main(["--shard-db", str(tmp_path / "shard.sqlite"), "--athletes", str(athletes_file)])
+
+        # Then
+        athletes = mock_run_sharded.call_args.args[1]
+        assert athletes["alice"]["RUNANLYZE_TOKEN"] == "shared_token"
+        assert athletes["bob"]["RUNANLYZE_TOKEN"] == "bob_token"
+        assert athletes["bob"]["ZWIFT_USERNAME"] == "bob@zwift"
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('main.load_dotenv')
+    def test_main_sharded_missing_credentials(self, mock_load_dotenv, tmp_path):
+        """Test that an athlete without credentials is reported before any sync."""
+        # Given
+        athletes_file = tmp_path / "athletes.json"
+        athletes_file.write_text(json.dumps({"alice": {"ZWIFT_USERNAME": "alice@zwift"}}))
+
+        # When & Then
+        with pytest.raises(ValueError, match="athlete alice"):
+            main(["--shard-db", str(tmp_path / "shard.sqlite"), "--athletes", str(athletes_file)])
+
+    @patch.dict(os.environ, {
+        'ZWIFT_USERNAME': 'zwift_user',
+        'ZWIFT_PASSWORD': 'zwift_pass'
+    }, clear=True)
+    @patch('main.load_dotenv')
+    def test_main_missing_runalyze_token(self, mock_load_dotenv):
+        """Test main execution with missing Runalyze token."""
+        # When & Then
+        with pytest.raises(ValueError, match="Missing required environment variables"):
+            main([])
+
+    @pytest.mark.parametrize("argv", [
+        ["--since", "15.10.2025"],
+        ["--last", "0"],
+        ["--last", "2", "--backfill"],
+        ["--log-level", "verbose"],
+        ["--serve", "--listen", "localhost"],
+        ["--poll"],
+        ["--worker"],
+        ["--shard-db", "shard.sqlite"],
+        ["--queue-db", "q.sqlite", "--dry-run"],
+        ["--profile", "--serve"],
+        ["--profile", "tracing"],
+        ["--record-http", "a.cassette", "--replay-http", "b.cassette"],
+        ["--replay-http", "a.cassette", "--replay-speed", "-1"],
+    ])
+    def test_parse_args_rejects_invalid_arguments(self, argv):
+        """Test that invalid command lines are rejected."""
+        # When & Then
+        with pytest.raises(SystemExit) as exc_info:
+            parse_args(argv)
+
+        assert exc_info.value.code == 2
+
+    def test_parse_args_defaults(self):
+        """Test the default command line options."""
+        # When
+        args = parse_args([])
+
+        # Then
+        assert args.log_level == "INFO"
+        assert args.log_format == "text"
+        assert args.dry_run is False
+        assert args.concurrency is None
+        assert args.last is None and args.since is None and not args.backfill
+
     @patch.dict(os.environ, {
         'ZWIFT_USERNAME': '',
         'ZWIFT_PASSWORD': 'zwift_pass',
@@ -85,7 +325,7 @@ class TestMain:
         """Test main execution with missing Zwift username."""
         # When & Then
         with pytest.raises(ValueError, match="Missing required environment variables"):
-            main()
+            main([])
 
     @patch.dict(os.environ, {
         'ZWIFT_USERNAME': 'zwift_user',
@@ -98,7 +338,7 @@ class TestMain:
         """Test main execution with missing Zwift password."""
         # When & Then
         with pytest.raises(ValueError, match="Missing required environment variables"):
-            main()
+            main([])
 
     @patch.dict(os.environ, {
         'ZWIFT_USERNAME': 'zwift_user',
@@ -111,7 +351,7 @@ class TestMain:
         """Test main execution with missing Garmin username."""
         # When & Then
         with pytest.raises(ValueError, match="Missing required environment variables"):
-            main()
+            main(["--destination", "garmin"])
 
     @patch.dict(os.environ, {
         'ZWIFT_USERNAME': 'zwift_user',
@@ -124,7 +364,7 @@ class TestMain:
         """Test main execution with missing Garmin password."""
         # When & Then
         with pytest.raises(ValueError, match="Missing required environment variables"):
-            main()
+            main(["--destination", "garmin"])
 
     @patch.dict(os.environ, {}, clear=True)
     @patch('main.load_dotenv')
@@ -132,4 +372,49 @@ class TestMain:
         """Test main execution with all environment variables missing."""
         # When & Then
         with pytest.raises(ValueError, match="Missing required environment variables"):
-            main()
+            main([])
+
+
+class TestStartupTime:
+    """Startup budget for the CLI entry point."""
+
+    # Cumulative `python -X importtime` budget for `import main`, in microseconds.
+    # Eagerly importing zwift, fit_tool, garminconnect and requests cost ~360ms.
+    IMPORT_TIME_BUDGET_US = 100_000
+
+    LAZY_MODULES = ("zwift", "fit_tool", "garminconnect", "garth", "requests")
+
+    @pytest.fixture
+    def import_profile(self):
+        """Import main in a fresh interpreter with -X importtime."""
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c",
+             "import sys, main; print(','.join(sorted(sys.modules)))"],
+            cwd=repo_root, capture_output=True, text=True, check=True
+        )
+        return result.stdout.strip().split(","), result.stderr
+
+    def test_optional_backends_are_not_imported(self, import_profile):
+        """Test that importing main does not load the optional backends."""
+        # Given
+        modules, _ = import_profile
+
+        # Then
+        loaded = [name for name in modules if name.split(".")[0] in self.LAZY_MODULES]
+        assert loaded == []
+
+    def test_import_time_within_budget(self, import_profile):
+        """Test that importing main stays within the startup budget."""
+        # Given
+        _, importtime_log = import_profile
+
+        # When
+        cumulative_us = next(
+            int(line.split("|")[1])
+            for line in importtime_log.splitlines()
+            if line.startswith("import time:") and line.split("|")[2].strip() == "main"
+        )
+
+        # Then
+        assert cumulative_us < self.IMPORT_TIME_BUDGET_US
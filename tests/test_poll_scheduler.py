@@ -0,0 +1,165 @@
+"""Tests for the adaptive poll scheduler."""
+
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+from services.poll_scheduler import WEEK_S, PollScheduler, RidePattern, ride_end_time
+
+# Tuesday 2025-10-14 19:00 UTC
+TUESDAY_EVENING = datetime(2025, 10, 14, 19, 0, tzinfo=timezone.utc).timestamp()
+
+
+def catalog_entry(activity_id: str, end: float) -> dict:
+    """Create a Zwift catalog entry of a one hour ride ending at end."""
+    def iso(timestamp):
+        return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000+0000")
+    return {"id": activity_id, "startDate": iso(end - 3600), "endDate": iso(end)}
+
+
+def weekly_rides(weeks: int = 8):
+    """Catalog of rides ending every Tuesday at 19:00, newest first."""
+    return [catalog_entry(str(week), TUESDAY_EVENING - week * WEEK_S) for week in range(weeks)]
+
+
+class TestRidePattern:
+    """Test cases for RidePattern."""
+
+    def test_ride_end_time(self):
+        """Test parsing the end time from a catalog entry."""
+        assert ride_end_time(catalog_entry("1", TUESDAY_EVENING)) == TUESDAY_EVENING
+        assert ride_end_time({"startDate": "2025-10-14T18:00:00.000+0000"}) == TUESDAY_EVENING - 3600
+        assert ride_end_time({}) is None
+
+    def test_likelihood_follows_weekly_rides(self):
+        """Test that the likelihood is high at the usual ride end and low otherwise."""
+        # Given
+        pattern = RidePattern([TUESDAY_EVENING - week * WEEK_S for week in range(8)], window=1800)
+
+        # Then
+        assert pattern.likelihood(TUESDAY_EVENING + WEEK_S + 600) == 1.0
+        assert pattern.likelihood(TUESDAY_EVENING + WEEK_S + 3 * 3600) == 0.0
+
+    def test_window_wraps_around_the_week(self):
+        """Test rides near the start of the (epoch) week."""
+        # Given
+        pattern = RidePattern([WEEK_S * 100 + 60], window=600)
+
+        # Then
+        assert pattern.likelihood(WEEK_S * 101 - 60) == 1.0
+
+    def test_old_rides_are_forgotten(self):
+        """Test that only the recent history is learned from."""
+        # Given
+        old = TUESDAY_EVENING - 52 * WEEK_S + 6 * 3600
+        pattern = RidePattern([old, TUESDAY_EVENING], history_weeks=12)
+
+        # Then
+        assert len(pattern) == 1
+
+    def test_until_window(self):
+        """Test the wait until the next window of a likely ride end."""
+        # Given
+        rare = TUESDAY_EVENING + 2 * 3600
+        pattern = RidePattern([rare] + [TUESDAY_EVENING - week * WEEK_S for week in range(8)], window=1800)
+
+        # Then
+        assert pattern.until_window(TUESDAY_EVENING + 6 * 3600) == pytest.approx(WEEK_S - 6.5 * 3600)
+        assert pattern.until_window(TUESDAY_EVENING - 3600, min_likelihood=0.5) == pytest.approx(1800)
+        assert pattern.until_window(TUESDAY_EVENING + 3600, min_likelihood=0.5) == pytest.approx(WEEK_S - 5400)
+        assert RidePattern([]).until_window(TUESDAY_EVENING) is None
+
+
+class TestPollScheduler:
+    """Test cases for PollScheduler."""
+
+    @pytest.fixture
+    def catalog(self):
+        """Catalog function of one athlete."""
+        return Mock(side_effect=lambda max_count: weekly_rides()[:max_count])
+
+    @pytest.fixture
+    def scheduler(self, catalog):
+        """Create a scheduler with a fixed clock."""
+        return PollScheduler(Mock(), {"alice": catalog}, min_interval=300, max_interval=21600,
+                             clock=lambda: TUESDAY_EVENING + WEEK_S)
+
+    def test_interval_adapts_to_riding_times(self, scheduler):
+        """Test short intervals around ride ends and long ones otherwise."""
+        # Given
+        scheduler.learn("alice", weekly_rides())
+        next_tuesday = TUESDAY_EVENING + WEEK_S
+
+        # Then
+        assert scheduler.next_interval("alice", next_tuesday) == pytest.approx(300)
+        assert scheduler.next_interval("alice", next_tuesday + 12 * 3600) == pytest.approx(21600)
+        assert scheduler.next_interval("unknown", next_tuesday) == pytest.approx(21600)
+
+    def test_first_poll_learns_and_syncs(self, scheduler, catalog):
+        """Test that the first poll learns from the full catalog and queues a sync."""
+        # When
+        queued = scheduler.poll("alice")
+
+        # Then
+        assert queued is True
+        catalog.assert_called_once_with(None)
+        scheduler.submit.assert_called_once_with("alice")
+
+    def test_polls_queue_sync_only_for_new_activities(self, scheduler, catalog):
+        """Test that later polls fetch the newest activity and sync only on change."""
+        # Given
+        scheduler.poll("alice")
+
+        # When
+        unchanged = scheduler.poll("alice")
+        catalog.side_effect = lambda max_count: [catalog_entry("new", TUESDAY_EVENING + WEEK_S)]
+        changed = scheduler.poll("alice")
+
+        # Then
+        assert (unchanged, changed) == (False, True)
+        catalog.assert_called_with(1)
+        assert scheduler.submit.call_count == 2
+        assert scheduler.stats() == {"polls": 3, "syncs": 2, "errors": 0}
+
+    def test_poll_errors_are_counted(self, scheduler, catalog):
+        """Test that a failing catalog request does not queue a sync."""
+        # Given
+        catalog.side_effect = RuntimeError("503 - Service Unavailable")
+
+        # When
+        queued = scheduler.poll("alice")
+
+        # Then
+        assert queued is False
+        scheduler.submit.assert_not_called()
+        assert scheduler.stats()["errors"] == 1
+
+    def test_tick_reschedules_adaptively(self, scheduler):
+        """Test that tick polls due athletes and returns the adaptive delay."""
+        # Given
+        now = TUESDAY_EVENING + WEEK_S
+
+        # When
+        first = scheduler.tick(now)
+        early = scheduler.tick(now + 10)
+
+        # Then
+        assert first == pytest.approx(300)
+        assert early == pytest.approx(290)
+        assert scheduler.stats()["polls"] == 1
+
+    def test_polls_land_in_ride_windows(self, scheduler):
+        """Test that long intervals do not sleep past a learned ride-end window."""
+        # Given
+        days = [catalog_entry(str(day), TUESDAY_EVENING - day * 24 * 3600) for day in range(56)]
+        scheduler.catalogs["alice"] = Mock(side_effect=lambda max_count: days[:max_count])
+        now = datetime(2025, 10, 15, 0, 0, tzinfo=timezone.utc).timestamp()
+        polled = []
+
+        # When
+        while now < TUESDAY_EVENING + 2 * 24 * 3600:
+            polled.append(datetime.fromtimestamp(now, timezone.utc))
+            now += scheduler.tick(now)
+
+        # Then
+        in_window = {t.day for t in polled if 18 * 60 + 30 <= t.hour * 60 + t.minute <= 19 * 60 + 30}
+        assert in_window == {15, 16}
@@ -0,0 +1,99 @@
+"""Tests for the power-duration curve index."""
+
+import json
+import numpy as np
+import pytest
+from services.power_curve import PowerCurveIndex, best_efforts, format_duration
+
+DAY = 24 * 3600
+
+
+def brute_force_best(power, duration):
+    """Reference maximal mean power by scanning every window."""
+    return max(np.mean(power[i:i + duration]) for i in range(len(power) - duration + 1))
+
+
+class TestBestEfforts:
+    """Test cases for best_efforts."""
+
+    def test_matches_brute_force(self):
+        """Test the cumulative sum maxima against a window scan."""
+        # Given
+        power = np.random.default_rng(3).uniform(0, 800, 400)
+
+        # When
+        efforts = best_efforts(power, (1, 5, 60, 300))
+
+        # Then
+        for duration, watts in zip((1, 5, 60, 300), efforts):
+            assert watts == pytest.approx(brute_force_best(power, duration), abs=0.05)
+
+    def test_shorter_ride(self):
+        """Test that durations longer than the ride have no effort."""
+        assert best_efforts(np.full(90, 200.0), (5, 60, 120)) == [200.0, 200.0, None]
+
+    def test_format_duration(self):
+        """Test the duration labels."""
+        assert [format_duration(d) for d in (5, 60, 1200, 3600, 5400)] == ["5s", "1min", "20min", "1h", "90min"]
+
+
+class TestPowerCurveIndex:
+    """Test cases for PowerCurveIndex."""
+
+    @pytest.fixture
+    def index_path(self, tmp_path):
+        """Path of the persisted index."""
+        return str(tmp_path / "state" / "power_curve.json")
+
+    def test_all_time_and_window_curves(self, index_path):
+        """Test that the all-time curve keeps the best of every ride."""
+        # Given
+        index = PowerCurveIndex(index_path, durations=(5, 60))
+        old_sprint = np.r_[np.full(5, 1000.0), np.full(100, 150.0)]
+        recent_tempo = np.full(100, 300.0)
+
+        # When
+        index.add(1000 * DAY, old_sprint)
+        index.add(1100 * DAY, recent_tempo)
+
+        # Then
+        assert index.curve() == {5: (1000.0, 1000 * DAY), 60: (300.0, 1100 * DAY)}
+        assert index.curve(since=1050 * DAY) == {5: (300.0, 1100 * DAY), 60: (300.0, 1100 * DAY)}
+        assert index.summary() == "5s 1000 W, 1min 300 W"
+
+    def test_reprocessed_ride_replaces_its_efforts(self, index_path):
+        """Test that adding a ride twice does not keep the old efforts."""
+        # Given
+        index = PowerCurveIndex(index_path, durations=(5,))
+        index.add(1000, np.full(10, 500.0))
+
+        # When
+        index.add(1000, np.full(10, 200.0))
+
+        # Then
+        assert len(index) == 1
+        assert index.curve() == {5: (200.0, 1000)}
+
+    def test_persists_and_reloads(self, index_path):
+        """Test that the efforts survive a restart."""
+        # Given
+        PowerCurveIndex(index_path, durations=(5, 60)).add(1000, np.full(30, 250.0))
+
+        # When
+        index = PowerCurveIndex(index_path, durations=(5, 60))
+
+        # Then
+        assert index.curve() == {5: (250.0, 1000)}
+        with open(index_path) as f:
+            assert json.load(f) == {"durations": [5, 60], "rides": {"1000": [250.0, None]}}
+
+    def test_unreadable_or_outdated_index_is_ignored(self, index_path, tmp_path):
+        """Test that a corrupt index or one with other durations starts empty."""
+        # Given
+        PowerCurveIndex(index_path, durations=(5,)).add(1000, np.full(30, 250.0))
+
+        # Then
+        assert len(PowerCurveIndex(index_path, durations=(5, 60))) == 0
+        broken = tmp_path / "broken.json"
+        broken.write_text("{")
+        assert len(PowerCurveIndex(str(broken))) == 0
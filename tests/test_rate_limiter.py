@@ -0,0 +1,115 @@
+"""Tests for the token-bucket rate limiter."""
+
+import pytest
+import threading
+from unittest.mock import Mock
+from services.rate_limiter import RateLimit, RateLimiter, TokenBucket
+
+
+class FakeClock:
+    """Clock that advances when the code under test sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket:
+    """Test cases for TokenBucket."""
+
+    def test_burst_then_sustained_rate(self):
+        """Test that a full bucket allows a burst, then paces at the rate."""
+        # Given
+        clock = FakeClock()
+        bucket = TokenBucket(RateLimit(rate=2.0, burst=3), clock=clock, sleep=clock.sleep)
+
+        # When
+        waits = [bucket.acquire() for _ in range(5)]
+
+        # Then
+        assert waits == [0.0, 0.0, 0.0, 0.5, 0.5]
+        assert clock.now == 1.0
+
+    def test_refills_while_idle(self):
+        """Test that tokens accumulate up to the burst size while idle."""
+        # Given
+        clock = FakeClock()
+        bucket = TokenBucket(RateLimit(rate=1.0, burst=2), clock=clock, sleep=clock.sleep)
+        bucket.acquire()
+        bucket.acquire()
+
+        # When
+        clock.now += 60
+
+        # Then
+        assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 1.0]
+
+    def test_concurrent_callers_reserve_distinct_slots(self):
+        """Test that waiting threads are spread over the rate instead of bursting."""
+        # Given
+        sleep = Mock()
+        bucket = TokenBucket(RateLimit(rate=10.0, burst=1), clock=lambda: 0.0, sleep=sleep)
+        waits = []
+
+        def worker():
+            waits.append(bucket.acquire())
+
+        # When
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Then
+        assert sorted(waits) == pytest.approx([0.0, 0.1, 0.2, 0.3])
+
+
+class TestRateLimiter:
+    """Test cases for RateLimiter."""
+
+    def test_hosts_share_the_bucket_of_their_domain(self):
+        """Test that all S3 buckets count against the s3.amazonaws.com limit."""
+        # Given
+        clock = FakeClock()
+        limiter = RateLimiter(limits={"s3.amazonaws.com": RateLimit(rate=1.0, burst=1)},
+                              clock=clock, sleep=clock.sleep)
+
+        # When
+        limiter.acquire("bucket-a.s3.amazonaws.com")
+        waited = limiter.acquire("bucket-b.s3.amazonaws.com")
+
+        # Then
+        assert waited == 1.0
+        assert limiter.stats() == {"s3.amazonaws.com": {"requests": 2, "wait_seconds": 1.0}}
+
+    def test_unknown_hosts_are_not_throttled(self):
+        """Test that hosts without a limit pass immediately."""
+        # Given
+        sleep = Mock()
+        limiter = RateLimiter(limits={"runalyze.com": RateLimit(rate=1.0)}, sleep=sleep)
+
+        # When
+        for _ in range(10):
+            limiter.acquire("example.org")
+
+        # Then
+        sleep.assert_not_called()
+        assert limiter.stats() == {}
+
+    def test_default_limits_cover_the_service_hosts(self):
+        """Test that every API the services call is rate limited by default."""
+        # Given
+        limiter = RateLimiter()
+
+        # Then
+        for host in ["us-or-rly101.zwift.com", "my-bucket.s3.amazonaws.com", "runalyze.com",
+                     "connectapi.garmin.com"]:
+            assert limiter._limit_key(host) is not None
@@ -0,0 +1,224 @@
+"""Tests for the retry and circuit-breaker component."""
+
+import pytest
+import requests
+from unittest.mock import Mock
+from services.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    Retrier,
+    RetryPolicy,
+    is_transient_error,
+    status_code_of,
+)
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def http_error(status: int) -> requests.HTTPError:
+    """Create a requests HTTPError carrying the given status code."""
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"HTTP {status}", response=response)
+
+
+class TestTransientErrors:
+    """Test cases for the error classification."""
+
+    @pytest.mark.parametrize("error, transient", [
+        (http_error(429), True),
+        (http_error(503), True),
+        (http_error(404), False),
+        (requests.ConnectionError("reset"), True),
+        (requests.Timeout("slow"), True),
+        (Exception("500 - Internal Server Error"), True),
+        (ValueError("bad file"), False),
+    ])
+    def test_is_transient_error(self, error, transient):
+        """Test which errors are retried."""
+        assert is_transient_error(error) is transient
+
+    def test_status_code_of_response_is_falsy(self):
+        """Test that the status is read from 4xx responses, which are falsy."""
+        assert status_code_of(http_error(429)) == 429
+        assert status_code_of(None) is None
+
+
+class TestCircuitBreaker:
+    """Test cases for CircuitBreaker."""
+
+    def test_opens_after_threshold_and_half_opens(self):
+        """Test the closed, open and half-open transitions."""
+        # Given
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+        # When
+        breaker.record_failure()
+        breaker.record_failure()
+
+        # Then
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+        clock.now = 10
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow()
+        assert not breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_failed_trial_reopens(self):
+        """Test that a failed half-open trial opens the circuit again."""
+        # Given
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        breaker.allow()
+
+        # When
+        breaker.record_failure()
+
+        # Then
+        assert breaker.state == CircuitBreaker.OPEN
+
+
+class TestRetrier:
+    """Test cases for Retrier."""
+
+    @pytest.fixture
+    def sleep(self):
+        """Sleep function of the retrier."""
+        return Mock()
+
+    @pytest.fixture
+    def retrier(self, sleep):
+        """Create a Retrier that always waits the full backoff."""
+        return Retrier(policies={"api": RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=3.0)},
+                       sleep=sleep, jitter=lambda low, high: high)
+
+    def test_retries_with_capped_exponential_backoff(self, retrier, sleep):
+        """Test that transient errors are retried with doubling, capped delays."""
+        # Given
+        fn = Mock(side_effect=[http_error(503), http_error(503), http_error(429), "ok"])
+
+        # When
+        result = retrier.call("api", fn, "arg", key="value")
+
+        # Then
+        assert result == "ok"
+        assert fn.call_count == 4
+        fn.assert_called_with("arg", key="value")
+        assert [c.args[0] for c in sleep.call_args_list] == [1.0, 2.0, 3.0]
+        metrics = retrier.metrics()["api"]
+        assert metrics["retries"] == 3
+        assert metrics["successes"] == 1
+        assert metrics["backoff_seconds"] == 6.0
+
+    def test_jitter_is_drawn_below_the_backoff(self, sleep):
+        """Test that the delay is a random share of the exponential backoff."""
+        # Given
+        jitter = Mock(return_value=0.25)
+        retrier = Retrier(policies={"api": RetryPolicy(base_delay=1.0)}, sleep=sleep, jitter=jitter)
+
+        # When
+        retrier.call("api", Mock(side_effect=[http_error(500), "ok"]))
+
+        # Then
+        jitter.assert_called_once_with(0, 1.0)
+        sleep.assert_called_once_with(0.25)
+
+    def test_does_not_retry_permanent_errors(self, retrier, sleep):
+        """Test that non-transient errors are raised immediately."""
+        # Given
+        fn = Mock(side_effect=http_error(404))
+
+        # When & Then
+        with pytest.raises(requests.HTTPError):
+            retrier.call("api", fn)
+        fn.assert_called_once()
+        sleep.assert_not_called()
+        assert retrier.breaker("api").state == CircuitBreaker.CLOSED
+
+    def test_raises_last_error_after_max_attempts(self, retrier):
+        """Test that the last error is raised when all attempts fail."""
+        # Given
+        fn = Mock(side_effect=requests.ConnectionError("reset"))
+
+        # When & Then
+        with pytest.raises(requests.ConnectionError):
+            retrier.call("api", fn)
+        assert fn.call_count == 4
+        assert retrier.metrics()["api"]["failures"] == 1
+
+    def test_retry_result(self, retrier):
+        """Test that returned transient failures are retried and the last one returned."""
+        # Given
+        fn = Mock(side_effect=[503, 503, 503, 503])
+
+        # When
+        result = retrier.call("api", fn, retry_result=lambda status: status >= 500)
+
+        # Then
+        assert result == 503
+        assert fn.call_count == 4
+
+    def test_retry_budget_limits_retries_across_calls(self, sleep):
+        """Test that a failing endpoint cannot multiply the request volume."""
+        # Given
+        policy = RetryPolicy(max_attempts=10, retry_ratio=0.0, min_retries=3, failure_threshold=100)
+        retrier = Retrier(policies={"api": policy}, sleep=sleep)
+        fn = Mock(side_effect=http_error(503))
+
+        # When
+        for _ in range(3):
+            with pytest.raises(requests.HTTPError):
+                retrier.call("api", fn)
+
+        # Then
+        assert fn.call_count == 3 + 3
+        assert retrier.metrics()["api"]["retries"] == 3
+
+    def test_open_circuit_short_circuits_calls(self, sleep):
+        """Test that calls fail fast while the circuit is open, then recover."""
+        # Given
+        clock = FakeClock()
+        policy = RetryPolicy(max_attempts=1, failure_threshold=2, reset_timeout=30)
+        retrier = Retrier(policies={"api": policy}, sleep=sleep, clock=clock)
+        failing = Mock(side_effect=http_error(502))
+        for _ in range(2):
+            with pytest.raises(requests.HTTPError):
+                retrier.call("api", failing)
+
+        # When & Then
+        fn = Mock(return_value="ok")
+        with pytest.raises(CircuitOpenError):
+            retrier.call("api", fn)
+        fn.assert_not_called()
+        assert retrier.metrics()["api"]["circuit"] == CircuitBreaker.OPEN
+        assert retrier.metrics()["api"]["short_circuits"] == 1
+
+        clock.now = 30
+        assert retrier.call("api", fn) == "ok"
+        assert retrier.metrics()["api"]["circuit"] == CircuitBreaker.CLOSED
+
+    def test_endpoints_are_independent(self, retrier):
+        """Test that endpoints have separate policies, breakers and metrics."""
+        # When
+        retrier.call("api", Mock(return_value=1))
+        retrier.call("other", Mock(return_value=2))
+
+        # Then
+        assert retrier.policy("other") == RetryPolicy()
+        assert set(retrier.metrics()) == {"api", "other"}
+        assert retrier.breaker("api") is not retrier.breaker("other")
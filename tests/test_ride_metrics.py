@@ -0,0 +1,198 @@
+"""Tests for the ride metrics."""
+
+import calendar
+import struct
+import time
+import fitparse
+import numpy as np
+import pytest
+from fit_tool.fit_file_builder import FitFileBuilder
+from fit_tool.profile.messages.file_id_message import FileIdMessage
+from fit_tool.profile.messages.record_message import RecordMessage
+from fit_tool.profile.profile_type import FileType, Manufacturer
+from services.fit_encoder import EVENT, RECORD, FitEncoder, MessageDefinition, fit_timestamp
+from services.ride_metrics import compute_metrics, read_streams, ride_metrics_from_fit, rolling_mean
+
+
+def streams(power, heart_rate=None, interval=1.0, start=1760000000.0):
+    """Columnar streams of evenly spaced samples."""
+    power = np.asarray(power, dtype=np.float64)
+    timestamps = start + np.arange(len(power)) * interval
+    heart_rate = np.full(len(power), np.nan) if heart_rate is None else np.asarray(heart_rate, dtype=np.float64)
+    return {"timestamp": timestamps, "power": power, "heart_rate": heart_rate}
+
+
+class TestComputeMetrics:
+    """Test cases for compute_metrics."""
+
+    def test_steady_ride(self):
+        """Test that a steady hour at FTP gives IF 1 and TSS 100."""
+        # When
+        metrics = compute_metrics(streams(np.full(3600, 250.0)), ftp=250)
+
+        # Then
+        assert metrics.duration == 3600
+        assert metrics.normalized_power == metrics.average_power == 250.0
+        assert metrics.intensity_factor == 1.0
+        assert metrics.tss == 100.0
+        assert metrics.power_zones == [0, 0, 0, 3600, 0, 0, 0]
+
+    def test_normalized_power_weights_surges(self):
+        """Test that intervals raise NP above the average power."""
+        # Given
+        power = np.tile(np.r_[np.full(60, 400.0), np.full(60, 100.0)], 30)
+
+        # When
+        metrics = compute_metrics(streams(power), ftp=250)
+
+        # Then
+        assert metrics.average_power == 250.0
+        assert 300 < metrics.normalized_power < 340
+        assert sum(metrics.power_zones) == 3600
+
+    def test_rolling_mean_matches_convolution(self):
+        """Test the cumulative sum rolling mean against numpy.convolve."""
+        # Given
+        values = np.random.default_rng(1).uniform(0, 500, 1000)
+
+        # Then
+        np.testing.assert_allclose(rolling_mean(values, 30), np.convolve(values, np.ones(30) / 30, mode="valid"))
+
+    def test_pauses_and_missing_power(self):
+        """Test that gaps are capped and missing power counts as coasting."""
+        # Given
+        data = streams([200.0, np.nan, 200.0, 200.0])
+        data["timestamp"] = np.array([0.0, 1.0, 2.0, 600.0])
+
+        # When
+        metrics = compute_metrics(data)
+
+        # Then
+        assert metrics.duration == 1 + 1 + 5 + 1
+        assert metrics.average_power == 175.0
+        assert metrics.normalized_power is None and metrics.tss is None
+
+    def test_heart_rate_zones_and_decoupling(self):
+        """Test HR zones and that drifting heart rate shows as decoupling."""
+        # Given
+        heart_rate = np.r_[np.full(1800, 140.0), np.full(1800, 154.0)]
+
+        # When
+        metrics = compute_metrics(streams(np.full(3600, 200.0), heart_rate), ftp=250, max_hr=190)
+
+        # Then
+        assert metrics.average_heart_rate == 147.0
+        assert metrics.hr_zones == [0, 0, 1800, 1800, 0]
+        assert metrics.decoupling == pytest.approx(9.09, abs=0.01)
+
+    def test_empty(self):
+        """Test that a file without records has no metrics."""
+        assert compute_metrics(streams([])) is None
+
+    def test_six_hour_ride_is_fast(self):
+        """Test that the metrics of a six hour ride take milliseconds."""
+        # Given
+        rng = np.random.default_rng(0)
+        data = streams(rng.uniform(0, 600, 6 * 3600), rng.uniform(100, 180, 6 * 3600))
+
+        # When
+        started = time.perf_counter()
+        compute_metrics(data, ftp=250, max_hr=190)
+        elapsed = time.perf_counter() - started
+
+        # Then
+        assert elapsed < 0.05
+
+
+class TestReadStreams:
+    """Test cases for reading record streams from FIT files."""
+
+    def test_ride_metrics_from_fit(self, tmp_path):
+        """Test that records of a FIT file become columnar streams."""
+        # Given
+        builder = FitFileBuilder(auto_define=True)
+        file_id_message = FileIdMessage()
+        file_id_message.type = FileType.ACTIVITY
+        file_id_message.manufacturer = Manufacturer.ZWIFT.value
+        file_id_message.time_created = 1760000000000
+        builder.add(file_id_message)
+        for i in range(120):
+            record = RecordMessage()
+            record.timestamp = 1760000000000 + i * 1000
+            record.power = 250
+            record.heart_rate = 150
+            builder.add(record)
+        fit_file_path = str(tmp_path / "ride.fit")
+        builder.build().to_file(fit_file_path)
+
+        # When
+        data = read_streams(fit_file_path)
+        metrics = ride_metrics_from_fit(fit_file_path, ftp=250)
+
+        # Then
+        assert len(data["timestamp"]) == 120
+        assert data["timestamp"][0] == 1760000000.0
+        assert np.all(data["power"] == 250) and np.all(np.isnan(data["cadence"]))
+        assert metrics.duration == 120 and metrics.intensity_factor == 1.0
+
+    def test_six_hour_ride_is_read_into_columns(self, tmp_path):
+        """Test that the records of a long file, split by events, are decoded in bulk."""
+        # Given
+        encoder = FitEncoder()
+        encoder.define(0, MessageDefinition.from_profile(RECORD, ["timestamp", "power", "heart_rate", "speed"]))
+        encoder.define(1, MessageDefinition.from_profile(EVENT, ["timestamp", "event", "event_type"]))
+        for hour in range(6):
+            seconds = hour * 3600 + np.arange(3600)
+            heart_rate = np.full(3600, 140.0)
+            heart_rate[::60] = np.nan
+            encoder.write_rows(0, {"timestamp": fit_timestamp(1760000000) + seconds, "power": 200 + seconds % 100,
+                                   "heart_rate": heart_rate, "speed": np.full(3600, 9.5)})
+            encoder.write(1, {"timestamp": fit_timestamp(1760000000) + seconds[-1], "event": 0, "event_type": 4})
+        fit_file_path = str(tmp_path / "long.fit")
+        encoder.to_file(fit_file_path)
+
+        # When
+        started = time.perf_counter()
+        data = read_streams(fit_file_path)
+        elapsed = time.perf_counter() - started
+
+        # Then
+        assert {name: (len(values), values.dtype) for name, values in data.items()} == \
+            {name: (6 * 3600, np.float64) for name in ("timestamp", "power", "heart_rate", "cadence", "speed")}
+        assert np.array_equal(data["timestamp"], 1760000000.0 + np.arange(6 * 3600))
+        assert np.array_equal(data["power"], 200.0 + np.arange(6 * 3600) % 100)
+        assert np.isnan(data["heart_rate"]).sum() == 6 * 60 and np.all(np.isnan(data["cadence"]))
+        assert np.allclose(data["speed"], 9.5)
+        assert elapsed < 0.25
+
+    def test_compressed_timestamp_headers(self, tmp_path):
+        """Test that records with compressed timestamp headers get their time like fitparse does."""
+        # Given
+        start = fit_timestamp(1760000000)
+        encoder = FitEncoder()
+        encoder.define(0, MessageDefinition.from_profile(RECORD, ["timestamp", "power"]))
+        encoder.write(0, {"timestamp": start, "power": 100})
+        encoder.define(2, MessageDefinition.from_profile(RECORD, ["power"]))
+        for i in range(1, 40):
+            # Local type 2 in bits 5-6, 5 bits of the timestamp
+            encoder.write_bytes(bytes([0x80 | 2 << 5 | (start + i) & 0x1F]) + struct.pack("<H", 100 + i))
+        fit_file_path = str(tmp_path / "compressed.fit")
+        encoder.to_file(fit_file_path)
+
+        # When
+        data = read_streams(fit_file_path)
+
+        # Then
+        expected = [calendar.timegm(message.get_value("timestamp").utctimetuple())
+                    for message in fitparse.FitFile(fit_file_path).get_messages("record")]
+        assert list(data["timestamp"]) == expected == [1760000000.0 + i for i in range(40)]
+        assert list(data["power"]) == [100.0 + i for i in range(40)]
+
+    def test_unreadable_file(self, tmp_path):
+        """Test that a corrupt file yields no metrics instead of an error."""
+        # Given
+        fit_file_path = tmp_path / "broken.fit"
+        fit_file_path.write_bytes(b"not a fit file")
+
+        # Then
+        assert ride_metrics_from_fit(str(fit_file_path)) is None
@@ -0,0 +1,104 @@
+"""Tests for RunProfiler."""
+
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+from services.activity_processor import ActivityProcessor
+from services.fit_file_service import FitFileService
+from services.run_profiler import CPROFILE, SAMPLING, RunProfiler
+from services.runalyze_service import RunalyzeService
+from services.upload_result import UploadResult, UploadStatus
+from services.zwift_service import ZwiftService
+
+
+def busy(seconds: float) -> int:
+    """Burn CPU for a while."""
+    deadline, count = time.perf_counter() + seconds, 0
+    while time.perf_counter() < deadline:
+        count += 1
+    return count
+
+
+class TestRunProfiler:
+    """Test cases for RunProfiler."""
+
+    @pytest.fixture
+    def processor(self, tmp_path):
+        """ActivityProcessor with mock services that download and upload 2 KiB files."""
+        def download(activity):
+            fit_path = tmp_path / f"zwift_activity_{activity['id']}.fit"
+            fit_path.write_bytes(b"x" * 2048)
+            return str(fit_path)
+
+        zwift_service = Mock(spec=ZwiftService)
+        zwift_service.download_activity.side_effect = download
+        zwift_service.download_last_x_activities.side_effect = \
+            lambda x: [zwift_service.download_activity({"id": i}) for i in range(x)]
+        runalyze_service = Mock(spec=RunalyzeService)
+        runalyze_service.name = "runalyze"
+        runalyze_service.upload_batch.side_effect = lambda paths: {
+            path: UploadResult(path, "runalyze", UploadStatus.SUCCESS, bytes_sent=2048) for path in paths}
+        return ActivityProcessor(zwift_service, [runalyze_service], Mock(spec=FitFileService))
+
+    def test_stage_report(self, processor, tmp_path):
+        """Test that stages, functions and memory of a run end up in the report."""
+        # Given
+        profiler = RunProfiler(str(tmp_path / "profiles"), mode=CPROFILE)
+        profiler.instrument_processor(processor)
+
+        # When
+        with profiler:
+            processor.process_last_x_activities(2)
+
+        # Then
+        assert profiler.stages["zwift.download"].calls == 2
+        assert profiler.stages["zwift.download"].bytes == 2 * 2048
+        assert profiler.stages["upload.runalyze"].bytes == 4096
+        report = open(profiler.report_path).read()
+        assert "upload.runalyze" in report and "Peak traced memory" in report
+        assert "process_last_x_activities" in report
+
+    def test_cprofile_covers_worker_threads(self, tmp_path):
+        """Test that functions running in threads started during the run are profiled."""
+        # Given
+        profiler = RunProfiler(str(tmp_path), mode=CPROFILE, trace_memory=False)
+
+        # When
+        with profiler:
+            worker = threading.Thread(target=busy, args=(0.05,))
+            worker.start()
+            worker.join()
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                counts = list(pool.map(busy, [0.01] * 3, timeout=5))
+
+        # Then
+        assert len(counts) == 3
+        assert "busy" in profiler.report()
+
+    def test_sampling_profiler(self, tmp_path):
+        """Test that the sampling profiler attributes time to running functions."""
+        # Given
+        profiler = RunProfiler(str(tmp_path), mode=SAMPLING, trace_memory=False, sample_interval=0.001)
+
+        # When
+        with profiler:
+            busy(0.1)
+
+        # Then
+        assert "busy" in profiler.report()
+
+    def test_nested_calls_of_a_stage_count_once(self, tmp_path):
+        """Test that a stage method calling itself through the wrapper is counted once."""
+        # Given
+        profiler = RunProfiler(str(tmp_path), trace_memory=False)
+        service = Mock()
+        service.batch.side_effect = lambda items: [service.batch([]) for _ in items]
+        profiler.instrument(service, "batch", "transform")
+
+        # When
+        service.batch([1, 2])
+
+        # Then
+        assert profiler.stages["transform"].calls == 1
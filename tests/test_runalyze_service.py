@@ -0,0 +1,332 @@
+"""Tests for RunalyzeService."""
+
+import io
+import zipfile
+import pytest
+import requests
+import responses
+from responses import matchers
+from fit_tool.fit_file_builder import FitFileBuilder
+from fit_tool.profile.messages.file_id_message import FileIdMessage
+from fit_tool.profile.messages.session_message import SessionMessage
+from fit_tool.profile.profile_type import FileType, Manufacturer
+from services.activity_index import ActivityFingerprint
+from services.rate_limiter import RateLimiter
+from services.retry import Retrier
+from services.runalyze_service import RunalyzeService, RUNALYZE_API_URL, RUNALYZE_ACTIVITIES_URL, UPLOAD_TIMEOUT
+from services.upload_result import UploadStatus
+
+
+def write_session_fit_file(file_path: str) -> str:
+    """Write a FIT file holding a one hour session starting at 1760000000."""
+    builder = FitFileBuilder(auto_define=True)
+    file_id_message = FileIdMessage()
+    file_id_message.type = FileType.ACTIVITY
+    file_id_message.manufacturer = Manufacturer.ZWIFT.value
+    file_id_message.time_created = 1760000000000
+    builder.add(file_id_message)
+
+    session_message = SessionMessage()
+    session_message.start_time = 1760000000000
+    session_message.timestamp = 1760003600000
+    session_message.total_elapsed_time = 3600.0
+    session_message.total_distance = 30123.0
+    builder.add(session_message)
+
+    builder.build().to_file(file_path)
+    return file_path
+
+
+def no_wait_retrier() -> Retrier:
+    """Retrier that retries without sleeping."""
+    return Retrier(sleep=lambda delay: None)
+
+
+class TestRunalyzeService:
+    """Test cases for RunalyzeService."""
+
+    @pytest.fixture
+    def runalyze_service(self):
+        """Create a RunalyzeService instance for testing."""
+        return RunalyzeService("test_token", retrier=no_wait_retrier(), rate_limiter=RateLimiter(limits={}))
+
+    @pytest.fixture
+    def fit_file(self, tmp_path):
+        """Create a fake FIT file."""
+        path = tmp_path / "zwift_activity_12345.fit"
+        path.write_bytes(b"fake fit file content")
+        return str(path)
+
+    @responses.activate
+    def test_upload_success(self, runalyze_service, fit_file):
+        """Test a successful upload returns the Runalyze activity id."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL, json={"activity_id": 987}, status=201)
+
+        # When
+        result = runalyze_service.upload_file_to_runalyze(fit_file)
+
+        # Then
+        assert result.status is UploadStatus.SUCCESS
+        assert result.activity_id == "987"
+        assert result.bytes_sent == len(b"fake fit file content")
+        assert result.latency >= 0
+        assert responses.calls[0].request.headers["token"] == "test_token"
+        assert responses.calls[0].request.req_kwargs["timeout"] == UPLOAD_TIMEOUT
+
+    @responses.activate
+    def test_upload_duplicate(self, runalyze_service, fit_file):
+        """Test that Runalyze's duplicate rejection is not reported as a failure."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL,
+                      json={"status": "error", "message": "Duplicate activity"}, status=400)
+
+        # When
+        result = runalyze_service.upload_file_to_runalyze(fit_file)
+
+        # Then
+        assert result.duplicate
+        assert result.ok
+
+    @responses.activate
+    def test_upload_success_mentioning_duplicates(self, runalyze_service, fit_file):
+        """Test that a successful upload whose body contains the word is not a duplicate."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL,
+                      json={"id": 987, "title": "Duplicate hill repeats", "duplicates": 0}, status=201)
+
+        # When
+        result = runalyze_service.upload_file_to_runalyze(fit_file)
+
+        # Then
+        assert result.status is UploadStatus.SUCCESS
+        assert result.activity_id == "987"
+
+    @responses.activate
+    @pytest.mark.parametrize("status, retryable", [(500, True), (429, True), (401, False)])
+    def test_upload_http_error(self, runalyze_service, fit_file, status, retryable):
+        """Test that HTTP errors are classified for the retry logic."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL, body="error", status=status)
+
+        # When
+        result = runalyze_service.upload_file_to_runalyze(fit_file)
+
+        # Then
+        assert result.status is UploadStatus.FAILED
+        assert result.retryable is retryable
+        assert f"HTTP {status}" in result.error
+
+    @responses.activate
+    def test_upload_connection_error(self, runalyze_service, fit_file):
+        """Test that network errors are returned as retryable failures."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL, body=requests.ConnectionError("reset"))
+
+        # When
+        result = runalyze_service.upload_file_to_runalyze(fit_file)
+
+        # Then
+        assert result.status is UploadStatus.FAILED
+        assert result.retryable is True
+
+    @responses.activate
+    def test_upload_timeout_is_retried(self, runalyze_service, fit_file):
+        """Test that a stalled upload times out and is retried like other network errors."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL, body=requests.ReadTimeout("stalled"))
+        responses.add(responses.POST, RUNALYZE_API_URL, json={"activity_id": 987}, status=201)
+
+        # When
+        result = runalyze_service.upload_file_to_runalyze(fit_file)
+
+        # Then
+        assert result.status is UploadStatus.SUCCESS
+        assert runalyze_service.retrier.metrics()["runalyze.upload"]["retries"] == 1
+
+    @responses.activate
+    def test_upload_retries_transient_errors(self, runalyze_service, fit_file):
+        """Test that 503 responses are retried until the upload succeeds."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL, body="unavailable", status=503)
+        responses.add(responses.POST, RUNALYZE_API_URL, json={"activity_id": 987}, status=201)
+
+        # When
+        result = runalyze_service.upload_file_to_runalyze(fit_file)
+
+        # Then
+        assert result.status is UploadStatus.SUCCESS
+        assert len(responses.calls) == 2
+        assert b"fake fit file content" in responses.calls[1].request.body
+        assert runalyze_service.retrier.metrics()["runalyze.upload"]["retries"] == 1
+
+    def test_upload_file_not_found(self, runalyze_service):
+        """Test upload of a missing file."""
+        # When & Then
+        with pytest.raises(FileNotFoundError, match="FIT file not found"):
+            runalyze_service.upload_file_to_runalyze("/non/existent/file.fit")
+
+
+class TestRunalyzeServiceDuplicateCheck:
+    """Test cases for skipping uploads of known activities."""
+
+    @pytest.fixture
+    def session_fit_file(self, tmp_path):
+        """Create a FIT file with a session message."""
+        return write_session_fit_file(str(tmp_path / "zwift_activity_1.fit"))
+
+    @responses.activate
+    def test_known_activity_is_not_transferred(self, session_fit_file, tmp_path):
+        """Test that an activity in the local index is skipped without a request."""
+        # Given
+        service = RunalyzeService("test_token", index_path=str(tmp_path / "index.json"), check_remote=False)
+        service.index.add(ActivityFingerprint(1760000000, 3600, 30123))
+
+        # When
+        result = service.upload_file_to_runalyze(session_fit_file)
+
+        # Then
+        assert result.duplicate
+        assert result.bytes_sent == 0
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_uploaded_activity_is_indexed(self, session_fit_file, tmp_path):
+        """Test that a successful upload is remembered for the next run."""
+        # Given
+        index_path = str(tmp_path / "index.json")
+        responses.add(responses.POST, RUNALYZE_API_URL, json={"id": 1}, status=201)
+
+        # When
+        first = RunalyzeService("test_token", index_path=index_path, check_remote=False) \
+            .upload_file_to_runalyze(session_fit_file)
+        second = RunalyzeService("test_token", index_path=index_path, check_remote=False) \
+            .upload_file_to_runalyze(session_fit_file)
+
+        # Then
+        assert first.status is UploadStatus.SUCCESS
+        assert second.duplicate
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_remote_activities_fetched_once_per_run(self, session_fit_file, tmp_path):
+        """Test that all pages of Runalyze's activity list are queried once and used for the check."""
+        # Given
+        pages = [[{"time": 1770000000, "s": 1800, "distance": 15.0}],
+                 [{"time": 1760000000, "s": 3601, "distance": 30.12}], []]
+        for page, activities in enumerate(pages, start=1):
+            responses.add(responses.GET, RUNALYZE_ACTIVITIES_URL, json=activities, status=200,
+                          match=[matchers.query_param_matcher({"page": page})])
+        service = RunalyzeService("test_token")
+        other_fit_file = write_session_fit_file(str(tmp_path / "zwift_activity_2.fit"))
+
+        # When
+        results = [service.upload_file_to_runalyze(session_fit_file),
+                   service.upload_file_to_runalyze(other_fit_file)]
+
+        # Then
+        assert all(result.duplicate for result in results)
+        assert [call.request.method for call in responses.calls] == ["GET"] * 3
+
+    @responses.activate
+    def test_remote_list_unavailable_falls_back_to_upload(self, session_fit_file):
+        """Test that a missing activity list does not block uploads."""
+        # Given
+        responses.add(responses.GET, RUNALYZE_ACTIVITIES_URL, status=404)
+        responses.add(responses.POST, RUNALYZE_API_URL, json={"id": 1}, status=201)
+
+        # When
+        result = RunalyzeService("test_token").upload_file_to_runalyze(session_fit_file)
+
+        # Then
+        assert result.status is UploadStatus.SUCCESS
+
+
+class TestRunalyzeServiceCompression:
+    """Test cases for zip-compressed uploads."""
+
+    @pytest.fixture
+    def fit_files(self, tmp_path):
+        """Create five compressible fake FIT files."""
+        paths = []
+        for i in range(5):
+            path = tmp_path / f"zwift_activity_{i}.fit"
+            path.write_bytes(b"record data " * 500)
+            paths.append(str(path))
+        return paths
+
+    @staticmethod
+    def archive_names(call):
+        """File names inside the zip archive posted in a request."""
+        body = call.request.body
+        start = body.index(b"PK\x03\x04")
+        return sorted(zipfile.ZipFile(io.BytesIO(body[start:])).namelist())
+
+    @responses.activate
+    def test_single_upload_is_zipped(self, fit_files):
+        """Test that a single file is sent as a compressed archive."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL, json={"id": 5}, status=201)
+        service = RunalyzeService("test_token", check_remote=False, compress=True)
+
+        # When
+        result = service.upload_file_to_runalyze(fit_files[0])
+
+        # Then
+        assert result.status is UploadStatus.SUCCESS
+        assert result.activity_id == "5"
+        assert result.bytes_sent < len(b"record data " * 500)
+        assert b'filename="zwift_activity_0.zip"' in responses.calls[0].request.body
+        assert self.archive_names(responses.calls[0]) == ["zwift_activity_0.fit"]
+
+    @responses.activate
+    def test_batch_packs_rides_into_archives(self, fit_files):
+        """Test that a batch is packed into as few requests as the limits allow."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL, json={"status": "ok"}, status=201)
+        service = RunalyzeService("test_token", check_remote=False, compress=True, max_archive_files=3)
+
+        # When
+        results = service.upload_batch(fit_files)
+
+        # Then
+        assert list(results) == fit_files
+        assert all(result.status is UploadStatus.SUCCESS for result in results.values())
+        assert len(responses.calls) == 2
+        assert self.archive_names(responses.calls[0]) == \
+            ["zwift_activity_0.fit", "zwift_activity_1.fit", "zwift_activity_2.fit"]
+        assert self.archive_names(responses.calls[1]) == ["zwift_activity_3.fit", "zwift_activity_4.fit"]
+        assert sum(result.bytes_sent for result in results.values()) < 5 * len(b"record data " * 500)
+
+    @responses.activate
+    def test_batch_respects_size_limit(self, fit_files):
+        """Test that the uncompressed size limit starts a new archive."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL, json={}, status=201)
+        service = RunalyzeService("test_token", check_remote=False, compress=True,
+                                  max_archive_bytes=2 * len(b"record data " * 500))
+
+        # When
+        service.upload_batch(fit_files)
+
+        # Then
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_batch_failure_applies_to_whole_archive(self, fit_files, tmp_path):
+        """Test that a failed request fails every file it carried."""
+        # Given
+        responses.add(responses.POST, RUNALYZE_API_URL, body="unavailable", status=503)
+        service = RunalyzeService("test_token", check_remote=False, compress=True, retrier=no_wait_retrier(),
+                                  rate_limiter=RateLimiter(limits={}))
+        missing = str(tmp_path / "missing.fit")
+
+        # When
+        results = service.upload_batch(fit_files[:2] + [missing])
+
+        # Then
+        assert [r.status for r in results.values()] == [UploadStatus.FAILED] * 3
+        assert results[fit_files[0]].retryable is True
+        assert "not found" in results[missing].error
+        # One archive, sent once per attempt of the retry policy
+        assert len(responses.calls) == service.retrier.policy("runalyze.upload").max_attempts
@@ -0,0 +1,163 @@
+"""Tests for the shard coordinator."""
+
+import pytest
+from unittest.mock import Mock
+from services.shard_coordinator import HashRing, ShardCoordinator, ShardedWorker
+
+ATHLETES = [f"athlete-{i}" for i in range(60)]
+
+
+class FakeClock:
+    """Manually advanced wall clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestHashRing:
+    """Test cases for HashRing."""
+
+    def test_maps_every_key_to_a_node(self):
+        """Test that all workers get a share of the athletes."""
+        # Given
+        ring = HashRing(["w1", "w2", "w3"])
+
+        # When
+        owners = [ring.node_for(athlete) for athlete in ATHLETES]
+
+        # Then
+        assert set(owners) == {"w1", "w2", "w3"}
+        assert HashRing([]).node_for("athlete-1") is None
+
+    def test_removing_a_node_only_moves_its_keys(self):
+        """Test the consistency property of the ring."""
+        # Given
+        before = HashRing(["w1", "w2", "w3"])
+        after = HashRing(["w1", "w2"])
+
+        # Then
+        for athlete in ATHLETES:
+            if before.node_for(athlete) != "w3":
+                assert after.node_for(athlete) == before.node_for(athlete)
+
+
+class TestShardCoordinator:
+    """Test cases for ShardCoordinator."""
+
+    @pytest.fixture
+    def clock(self):
+        """Create a fake clock."""
+        return FakeClock()
+
+    @pytest.fixture
+    def coordinators(self, tmp_path, clock):
+        """Create three workers sharing one database."""
+        db_path = str(tmp_path / "shard.sqlite")
+        return [ShardCoordinator(db_path, f"w{i}", worker_timeout=60, lease_ttl=120, clock=clock)
+                for i in range(3)]
+
+    def test_live_workers_partition_the_athletes(self, coordinators):
+        """Test that each athlete is assigned to exactly one live worker."""
+        # Given
+        for coordinator in coordinators:
+            coordinator.heartbeat()
+
+        # When
+        assignments = [coordinator.assigned(ATHLETES) for coordinator in coordinators]
+
+        # Then
+        assert sorted(a for assigned in assignments for a in assigned) == sorted(ATHLETES)
+        assert all(assignments)
+
+    def test_dead_worker_athletes_fail_over(self, coordinators, clock):
+        """Test that a worker without heartbeat loses its athletes to the others."""
+        # Given
+        w0, w1, w2 = coordinators
+        for coordinator in coordinators:
+            coordinator.heartbeat()
+        orphaned = w2.assigned(ATHLETES)
+        assert w2.acquire(orphaned[0])
+
+        # When
+        clock.now += 61
+        w0.heartbeat()
+        w1.heartbeat()
+
+        # Then
+        assert w0.live_workers() == ["w0", "w1"]
+        takeover = set(w0.assigned(ATHLETES)) | set(w1.assigned(ATHLETES))
+        assert set(orphaned) <= takeover
+        # The dead worker's lease blocks a takeover until it expires
+        new_owner = w0 if orphaned[0] in w0.assigned(ATHLETES) else w1
+        assert not new_owner.acquire(orphaned[0])
+        clock.now += 60
+        assert new_owner.acquire(orphaned[0])
+
+    def test_lease_is_exclusive_and_renewed(self, coordinators, clock):
+        """Test that a lease can only be held by one worker and heartbeats renew it."""
+        # Given
+        w0, w1, _ = coordinators
+        assert w0.acquire("athlete-1")
+
+        # When
+        clock.now += 100
+        w0.heartbeat()
+        clock.now += 100
+
+        # Then
+        assert not w1.acquire("athlete-1")
+        w0.release("athlete-1")
+        assert w1.acquire("athlete-1")
+
+    def test_leave_releases_leases(self, coordinators):
+        """Test that a clean shutdown hands athletes over immediately."""
+        # Given
+        w0, w1, _ = coordinators
+        w0.heartbeat()
+        w0.acquire("athlete-1")
+
+        # When
+        w0.leave()
+
+        # Then
+        assert "w0" not in w1.live_workers()
+        assert w1.acquire("athlete-1")
+
+
+class TestShardedWorker:
+    """Test cases for ShardedWorker."""
+
+    def test_run_once_syncs_assigned_athletes(self, tmp_path):
+        """Test that two workers together sync every athlete exactly once."""
+        # Given
+        db_path = str(tmp_path / "shard.sqlite")
+        clock = FakeClock()
+        sync = Mock(return_value=True)
+        workers = [ShardedWorker(ShardCoordinator(db_path, f"w{i}", clock=clock), ATHLETES, sync)
+                   for i in range(2)]
+        for worker in workers:
+            worker.coordinator.heartbeat()
+
+        # When
+        results = [worker.run_once() for worker in workers]
+
+        # Then
+        assert results[0] and results[1]
+        assert sorted(list(results[0]) + list(results[1])) == sorted(ATHLETES)
+        assert sync.call_count == len(ATHLETES)
+
+    def test_failed_sync_releases_lease(self, tmp_path):
+        """Test that a failing athlete does not keep its lease."""
+        # Given
+        coordinator = ShardCoordinator(str(tmp_path / "shard.sqlite"), "w0")
+        worker = ShardedWorker(coordinator, ["athlete-1"], Mock(side_effect=RuntimeError("boom")))
+
+        # When
+        results = worker.run_once()
+
+        # Then
+        assert results == {"athlete-1": False}
+        assert ShardCoordinator(str(tmp_path / "shard.sqlite"), "w1").acquire("athlete-1")
@@ -0,0 +1,105 @@
+"""Tests for the span tracer and its OTLP JSON file exporter."""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from services import tracing
+from services.tracing import ACTIVITY_ID, STATUS_ERROR, FileSpanExporter, Tracer
+
+
+def read_spans(path):
+    """Spans of an OTLP JSON lines file, by name."""
+    spans = {}
+    with open(path) as f:
+        for line in f:
+            for resource_spans in json.loads(line)["resourceSpans"]:
+                for scope_spans in resource_spans["scopeSpans"]:
+                    for span in scope_spans["spans"]:
+                        span["attributes"] = {a["key"]: next(iter(a["value"].values())) for a in span["attributes"]}
+                        spans[span["name"]] = span
+    return spans
+
+
+@tracing.traced("download", lambda activity_id: {ACTIVITY_ID: activity_id})
+def download(activity_id):
+    """Traced function adding a child span and an attribute."""
+    with tracing.span("s3.get"):
+        tracing.current_span().set_attribute("fit.bytes", 2048)
+
+
+class TestTracer:
+    """Test cases for Tracer."""
+
+    @pytest.fixture
+    def trace_path(self, tmp_path):
+        return str(tmp_path / "trace.jsonl")
+
+    def test_nested_spans_share_the_trace(self, trace_path):
+        """Test parent links, inherited activity ids and the OTLP JSON layout."""
+        # When
+        with Tracer(FileSpanExporter(trace_path)):
+            with tracing.span("sync.batch", {"fit.files": 1}):
+                download("42")
+
+        # Then
+        spans = read_spans(trace_path)
+        batch, download_span, get = spans["sync.batch"], spans["download"], spans["s3.get"]
+        assert len({batch["traceId"], download_span["traceId"], get["traceId"]}) == 1
+        assert "parentSpanId" not in batch
+        assert download_span["parentSpanId"] == batch["spanId"] and get["parentSpanId"] == download_span["spanId"]
+        assert get["attributes"] == {ACTIVITY_ID: "42", "fit.bytes": "2048"}
+        assert int(get["endTimeUnixNano"]) >= int(get["startTimeUnixNano"]) >= int(batch["startTimeUnixNano"])
+
+    def test_propagate_to_pool_threads(self, trace_path):
+        """Test that work in a thread pool stays in the submitting trace."""
+        # When
+        with Tracer(FileSpanExporter(trace_path)):
+            with tracing.span("upload.fan_out", {ACTIVITY_ID: "7"}):
+                with ThreadPoolExecutor(2) as executor:
+                    executor.submit(tracing.propagate(download), "7").result()
+
+        # Then
+        spans = read_spans(trace_path)
+        assert spans["download"]["parentSpanId"] == spans["upload.fan_out"]["spanId"]
+        assert spans["s3.get"]["attributes"][ACTIVITY_ID] == "7"
+
+    def test_exception_marks_span_failed(self, trace_path):
+        """Test that an exception ends the span with an error status."""
+        # When
+        with Tracer(FileSpanExporter(trace_path)):
+            with pytest.raises(ValueError):
+                with tracing.span("fit.transform"):
+                    raise ValueError("Invalid FIT file")
+
+        # Then
+        span = read_spans(trace_path)["fit.transform"]
+        assert span["status"] == {"code": STATUS_ERROR, "message": "Invalid FIT file"}
+        assert span["events"][0]["name"] == "exception"
+
+    def test_record_span_timed_elsewhere(self, trace_path):
+        """Test that a span timed in a worker process is recorded under the current span with its activity."""
+        # When
+        with Tracer(FileSpanExporter(trace_path)):
+            tracing.link_file("/tmp/a.fit", "42")
+            with tracing.span("fit.transform_batch"):
+                tracing.record("fit.transform", 1000, 5000, {"fit.file": "/tmp/a.fit"}, RuntimeError("Invalid"))
+
+        # Then
+        spans = read_spans(trace_path)
+        transform = spans["fit.transform"]
+        assert transform["parentSpanId"] == spans["fit.transform_batch"]["spanId"]
+        assert (transform["startTimeUnixNano"], transform["endTimeUnixNano"]) == ("1000", "5000")
+        assert transform["attributes"][ACTIVITY_ID] == "42"
+        assert transform["status"]["code"] == STATUS_ERROR
+        assert tracing.activity_of("/tmp/a.fit") is None
+
+    def test_off_by_default(self, trace_path):
+        """Test that spans are no-ops without a configured tracer."""
+        # When
+        with tracing.span("zwift.list") as span:
+            span.set_attribute("activity.count", 3)
+        download("1")
+
+        # Then
+        assert tracing.get_tracer() is None
+        assert tracing.current_span().set_attribute("key", "value") is None
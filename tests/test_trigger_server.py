@@ -0,0 +1,182 @@
+"""Tests for the trigger server and sync queue."""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from unittest.mock import Mock
+from services.trigger_server import SyncQueue, TriggerServer
+
+
+def post(url: str, token: str = None):
+    """POST to the trigger server and return status and JSON body."""
+    request = urllib.request.Request(url, method="POST", data=b"")
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+class TestSyncQueue:
+    """Test cases for SyncQueue."""
+
+    def test_runs_submitted_sync(self):
+        """Test that a submitted athlete is synced by a worker."""
+        # Given
+        handler = Mock(return_value=True)
+        sync_queue = SyncQueue(handler)
+        sync_queue.start()
+
+        # When
+        queued = sync_queue.submit("alice")
+
+        # Then
+        assert queued is True
+        assert sync_queue.wait_idle(timeout=5)
+        handler.assert_called_once_with("alice")
+        assert sync_queue.stats()["succeeded"] == 1
+        sync_queue.stop()
+
+    def test_coalesces_triggers_for_queued_athlete(self):
+        """Test that triggers for an already queued athlete are merged."""
+        # Given
+        handler = Mock(return_value=True)
+        sync_queue = SyncQueue(handler)
+
+        # When
+        results = [sync_queue.submit("alice") for _ in range(3)]
+        sync_queue.start()
+
+        # Then
+        assert results == [True, False, False]
+        assert sync_queue.wait_idle(timeout=5)
+        handler.assert_called_once_with("alice")
+        assert sync_queue.stats()["coalesced"] == 2
+        sync_queue.stop()
+
+    def test_trigger_during_sync_queues_one_follow_up(self):
+        """Test that triggers arriving mid-sync lead to exactly one more sync."""
+        # Given
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def handler(athlete):
+            calls.append(athlete)
+            started.set()
+            release.wait(5)
+            return True
+
+        sync_queue = SyncQueue(handler, workers=2)
+        sync_queue.start()
+        sync_queue.submit("alice")
+        assert started.wait(5)
+
+        # When
+        sync_queue.submit("alice")
+        sync_queue.submit("alice")
+        release.set()
+
+        # Then
+        assert sync_queue.wait_idle(timeout=5)
+        assert calls == ["alice", "alice"]
+        sync_queue.stop()
+
+    def test_failed_sync_is_counted(self):
+        """Test that handler errors do not stop the worker."""
+        # Given
+        handler = Mock(side_effect=[RuntimeError("boom"), True])
+        sync_queue = SyncQueue(handler)
+        sync_queue.start()
+
+        # When
+        sync_queue.submit("alice")
+        assert sync_queue.wait_idle(timeout=5)
+        sync_queue.submit("alice")
+        assert sync_queue.wait_idle(timeout=5)
+
+        # Then
+        stats = sync_queue.stats()
+        assert (stats["failed"], stats["succeeded"]) == (1, 1)
+        sync_queue.stop()
+
+
+class TestTriggerServer:
+    """Test cases for TriggerServer."""
+
+    @pytest.fixture
+    def sync_queue(self):
+        """Create a mock sync queue."""
+        sync_queue = Mock(spec=SyncQueue)
+        sync_queue.submit.return_value = True
+        sync_queue.stats.return_value = {"triggers": 0}
+        return sync_queue
+
+    @pytest.fixture
+    def server(self, sync_queue):
+        """Start a trigger server on a free port."""
+        server = TriggerServer(sync_queue, ["alice", "bob"], port=0, token="secret")
+        server.start()
+        yield server
+        server.shutdown()
+
+    def url(self, server, path):
+        host, port = server.address
+        return f"http://{host}:{port}{path}"
+
+    def test_trigger_queues_sync(self, server, sync_queue):
+        """Test that an authenticated trigger queues the athlete's sync."""
+        # When
+        status, body = post(self.url(server, "/sync/bob"), token="secret")
+
+        # Then
+        assert status == 202
+        assert body == {"athlete": "bob", "queued": True}
+        sync_queue.submit.assert_called_once_with("bob")
+
+    @pytest.mark.parametrize("path, token, expected_status", [
+        ("/sync/bob", None, 401),
+        ("/sync/bob", "wrong", 401),
+        ("/sync/carol", "secret", 404),
+        ("/sync", "secret", 400),
+        ("/other", "secret", 404),
+    ])
+    def test_rejected_triggers(self, server, sync_queue, path, token, expected_status):
+        """Test that invalid triggers do not queue a sync."""
+        # When
+        status, _ = post(self.url(server, path), token=token)
+
+        # Then
+        assert status == expected_status
+        sync_queue.submit.assert_not_called()
+
+    def test_single_athlete_default(self, sync_queue):
+        """Test that /sync targets the only athlete when no token is configured."""
+        # Given
+        server = TriggerServer(sync_queue, ["alice"], port=0)
+        server.start()
+
+        # When
+        try:
+            status, body = post(self.url(server, "/sync"))
+        finally:
+            server.shutdown()
+
+        # Then
+        assert status == 202
+        assert body["athlete"] == "alice"
+
+    def test_health(self, server, sync_queue):
+        """Test that the health endpoint reports the queue counters without athlete ids."""
+        # Given
+        sync_queue.stats.return_value = {"triggers": 3, "pending": ["alice@example.com"], "running": []}
+
+        # When
+        with urllib.request.urlopen(self.url(server, "/health"), timeout=5) as response:
+            body = json.loads(response.read())
+
+        # Then
+        assert body == {"triggers": 3, "pending": 1, "running": 0, "status": "ok"}
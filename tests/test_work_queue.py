@@ -0,0 +1,184 @@
+"""Tests for the durable work queue."""
+
+import time
+import pytest
+from multiprocessing import get_context
+from services.work_queue import DOWNLOADED, FAILED, LISTED, UPLOADED, WorkQueue
+
+
+class FakeClock:
+    """Manually advanced wall clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _claim_all(db_path: str, worker_id: str) -> list:
+    """Claim and finish jobs until none is left (runs in a child process)."""
+    work_queue = WorkQueue(db_path)
+    claimed = []
+    while (job := work_queue.claim(worker_id)) is not None:
+        work_queue.advance(job, UPLOADED)
+        claimed.append(job.id)
+    return claimed
+
+
+class TestWorkQueue:
+    """Test cases for WorkQueue."""
+
+    @pytest.fixture
+    def clock(self):
+        """Create a fake clock."""
+        return FakeClock()
+
+    @pytest.fixture
+    def work_queue(self, tmp_path, clock):
+        """Create a queue in a temporary database."""
+        return WorkQueue(str(tmp_path / "queue.sqlite"), visibility_timeout=60, max_attempts=2,
+                         retry_delay=10, clock=clock)
+
+    def test_enqueue_is_idempotent(self, work_queue):
+        """Test that an activity is queued only once."""
+        # When
+        added = [work_queue.enqueue("1", {"activity": {"id": "1"}}), work_queue.enqueue("1", {})]
+
+        # Then
+        assert added == [True, False]
+        assert work_queue.counts()[LISTED] == 1
+        assert work_queue.get("1").payload == {"activity": {"id": "1"}}
+
+    def test_claim_leases_job(self, work_queue, clock):
+        """Test that a claimed job is invisible to other workers."""
+        # Given
+        work_queue.enqueue("1", {})
+        clock.now += 3
+
+        # When
+        job = work_queue.claim("worker-a")
+
+        # Then
+        assert job.id == "1"
+        assert job.lease_owner == "worker-a"
+        assert job.waited == 3
+        assert work_queue.claim("worker-b") is None
+
+    def test_expired_lease_is_reclaimed_from_last_state(self, work_queue, clock):
+        """Test that a crashed worker's job resumes from its recorded state."""
+        # Given
+        work_queue.enqueue("1", {})
+        job = work_queue.claim("worker-a")
+        job.payload["file_path"] = "/tmp/1.fit"
+        work_queue.advance(job, DOWNLOADED)
+
+        # When
+        clock.now += 61
+        resumed = work_queue.claim("worker-b")
+
+        # Then
+        assert resumed.state == DOWNLOADED
+        assert resumed.payload == {"file_path": "/tmp/1.fit"}
+        assert work_queue.advance(job, UPLOADED) is False
+        assert work_queue.advance(resumed, UPLOADED) is True
+        assert work_queue.counts()[UPLOADED] == 1
+
+    def test_keep_leased_renews_lease(self, tmp_path, clock):
+        """Test that a job held past the visibility timeout is not claimed by another worker."""
+        # Given
+        work_queue = WorkQueue(str(tmp_path / "queue.sqlite"), visibility_timeout=60, renew_interval=0.01,
+                               clock=clock)
+        work_queue.enqueue("1", {})
+        job = work_queue.claim("worker-a")
+
+        # When
+        with work_queue.keep_leased(job):
+            clock.now += 61
+            time.sleep(0.2)
+            taken = work_queue.claim("worker-b")
+
+        # Then
+        assert taken is None
+        assert work_queue.advance(job, UPLOADED) is True
+
+    def test_fail_after_losing_the_lease(self, work_queue, clock):
+        """Test that a worker whose job was taken over does not record its failure."""
+        # Given
+        work_queue.enqueue("1", {})
+        job = work_queue.claim("worker-a")
+        clock.now += 61
+        work_queue.advance(work_queue.claim("worker-b"), DOWNLOADED)
+
+        # When
+        state = work_queue.fail(job, "HTTP 503", retryable=False)
+
+        # Then
+        assert state == DOWNLOADED
+        assert work_queue.get("1").lease_owner == "worker-b"
+        assert work_queue.get("1").attempts == 0
+
+    def test_final_states_are_not_claimed(self, work_queue):
+        """Test that uploaded jobs are done."""
+        # Given
+        work_queue.enqueue("1", {})
+        work_queue.advance(work_queue.claim("worker-a"), UPLOADED)
+
+        # Then
+        assert work_queue.claim("worker-a") is None
+        assert work_queue.pending() == 0
+
+    def test_fail_retries_after_delay_then_gives_up(self, work_queue, clock):
+        """Test retry delay and the attempt limit."""
+        # Given
+        work_queue.enqueue("1", {})
+
+        # When
+        first = work_queue.fail(work_queue.claim("worker-a"), "HTTP 503", retryable=True)
+
+        # Then
+        assert first == LISTED
+        assert work_queue.claim("worker-a") is None
+        clock.now += 10
+        assert work_queue.fail(work_queue.claim("worker-a"), "HTTP 503") == FAILED
+        assert work_queue.counts()[FAILED] == 1
+
+    def test_permanent_failure(self, work_queue):
+        """Test that a non-retryable error fails the job at once."""
+        # Given
+        work_queue.enqueue("1", {})
+
+        # When
+        state = work_queue.fail(work_queue.claim("worker-a"), "HTTP 401", retryable=False)
+
+        # Then
+        assert state == FAILED
+
+    def test_survives_reopening(self, tmp_path):
+        """Test that queued jobs persist across processes restarts."""
+        # Given
+        db_path = str(tmp_path / "queue.sqlite")
+        WorkQueue(db_path).enqueue("1", {"activity": {"id": "1"}})
+
+        # When
+        reopened = WorkQueue(db_path)
+
+        # Then
+        assert reopened.claim("worker-a").payload == {"activity": {"id": "1"}}
+
+    def test_worker_processes_claim_each_job_once(self, tmp_path):
+        """Test that concurrent worker processes never claim the same job."""
+        # Given
+        db_path = str(tmp_path / "queue.sqlite")
+        work_queue = WorkQueue(db_path)
+        for i in range(40):
+            work_queue.enqueue(str(i), {})
+
+        # When
+        with get_context("spawn").Pool(3) as pool:
+            claimed = pool.starmap(_claim_all, [(db_path, f"worker-{i}") for i in range(3)])
+
+        # Then
+        all_claimed = [job_id for worker in claimed for job_id in worker]
+        assert sorted(all_claimed, key=int) == [str(i) for i in range(40)]
+        assert work_queue.counts()[UPLOADED] == 40
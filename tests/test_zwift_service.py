@@ -6,6 +6,8 @@ from unittest.mock import Mock, patch, MagicMock
 import tempfile
 import os
 from services.zwift_service import ZwiftService
+from services.retry import Retrier
+from services.fit_cache import FitCache
 
 
 class TestZwiftService:
@@ -95,9 +97,12 @@ class TestZwiftService:
         # Verify file content
         with open(result, 'rb') as f:
             assert f.read() == fit_file_content
+        assert zwift_service.activity_for(result).id == '12345'
 
         # Cleanup
         os.remove(result)
+        zwift_service.forget(result)
+        assert zwift_service.activity_for(result) is None
 
     @patch('services.zwift_service.ZwiftClient')
     @responses.activate
@@ -128,3 +133,154 @@ class TestZwiftService:
         # When & Then
         with pytest.raises(RuntimeError, match="Failed to download activity"):
             zwift_service.download_last_activity()
+
+    @patch('services.zwift_service.ZwiftClient')
+    @responses.activate
+    def test_download_last_activity_retries_server_errors(self, mock_client_class, tmp_path):
+        """Test that transient S3 errors are retried."""
+        # Given
+        zwift_service = ZwiftService("test_user", "test_pass", cache_dir=str(tmp_path),
+                                     retrier=Retrier(sleep=lambda delay: None))
+        mock_client = Mock()
+        mock_profile = Mock()
+        mock_profile.get_activities.return_value = [
+            {'id': '12345', 'fitFileBucket': 'test-bucket', 'fitFileKey': 'test-key.fit'}
+        ]
+        mock_client.get_profile.return_value = mock_profile
+        mock_client_class.return_value = mock_client
+
+        url = 'https://test-bucket.s3.amazonaws.com/test-key.fit'
+        responses.add(responses.GET, url, status=503)
+        responses.add(responses.GET, url, body=b'fake fit file content', status=200)
+
+        zwift_service.authenticate()
+
+        # When
+        result = zwift_service.download_last_activity()
+
+        # Then
+        assert os.path.exists(result)
+        assert len(responses.calls) == 2
+        assert zwift_service.retrier.metrics()["zwift.s3"]["retries"] == 1
+
+    @patch('services.zwift_service.ZwiftClient')
+    def test_authenticate_reuses_client(self, mock_client_class, zwift_service):
+        """Test that repeated syncs of a long-running process log in once."""
+        # When
+        zwift_service.authenticate()
+        zwift_service.authenticate()
+
+        # Then
+        mock_client_class.assert_called_once_with("test_user", "test_pass")
+
+    @patch('services.zwift_service.ZwiftClient')
+    def test_list_activities_stops_after_max_count(self, mock_client_class, zwift_service):
+        """Test that a poll of the newest activity fetches a single page."""
+        # Given
+        mock_profile = Mock()
+        mock_profile.get_activities.return_value = [{'id': str(i)} for i in range(10)]
+        mock_client_class.return_value.get_profile.return_value = mock_profile
+
+        # When
+        activities = zwift_service.list_activities(1)
+
+        # Then
+        assert [a.id for a in activities] == ['0']
+        mock_profile.get_activities.assert_called_once_with(0, 50)
+
+    @patch('services.zwift_service.ZwiftClient')
+    def test_list_activities_fetches_following_pages_in_parallel(self, mock_client_class):
+        """Test that pages after a full first page are fetched until a short page."""
+        # Given
+        zwift_service = ZwiftService("test_user", "test_pass", page_size=10, page_concurrency=3)
+        catalog = [{'id': str(i)} for i in range(45)]
+        mock_profile = Mock()
+        mock_profile.get_activities.side_effect = lambda start, limit: catalog[start:start + limit]
+        mock_client_class.return_value.get_profile.return_value = mock_profile
+
+        # When
+        activities = zwift_service.list_activities()
+
+        # Then
+        assert [a.id for a in activities] == [a['id'] for a in catalog]
+        starts = sorted(call.args[0] for call in mock_profile.get_activities.call_args_list)
+        assert starts[:5] == [0, 10, 20, 30, 40]
+        assert len(starts) <= 5 + 2
+
+    @patch('services.zwift_service.ZwiftClient')
+    def test_list_activities_fetches_only_pages_needed_for_max_count(self, mock_client_class):
+        """Test that speculative fetching does not go beyond max_count."""
+        # Given
+        zwift_service = ZwiftService("test_user", "test_pass", page_size=10, page_concurrency=4)
+        mock_profile = Mock()
+        mock_profile.get_activities.side_effect = lambda start, limit: [{'id': str(i)} for i in range(start, start + limit)]
+        mock_client_class.return_value.get_profile.return_value = mock_profile
+
+        # When
+        activities = zwift_service.list_activities(25)
+
+        # Then
+        assert [a.id for a in activities] == [str(i) for i in range(25)]
+        assert mock_profile.get_activities.call_count == 3
+
+    @patch('services.zwift_service.ZwiftClient')
+    @pytest.mark.parametrize("download, expected_pages", [
+        (lambda service: service.download_last_activity(), 1),
+        (lambda service: service.download_last_x_activities(25), 3),
+    ])
+    def test_download_latest_lists_only_the_pages_needed(self, mock_client_class, download, expected_pages):
+        """Test that --latest and --last N do not page through the whole catalog."""
+        # Given
+        zwift_service = ZwiftService("test_user", "test_pass", page_size=10, page_concurrency=4)
+        mock_profile = Mock()
+        mock_profile.get_activities.side_effect = lambda start, limit: [{'id': str(i)} for i in range(start, start + limit)]
+        mock_client_class.return_value.get_profile.return_value = mock_profile
+        zwift_service.authenticate()
+
+        # When
+        with patch.object(zwift_service, 'download_activity', side_effect=lambda a: f"{a.id}.fit"):
+            download(zwift_service)
+
+        # Then
+        assert mock_profile.get_activities.call_count == expected_pages
+
+    @patch('services.zwift_service.ZwiftClient')
+    def test_download_activities_since_date_filters_by_start(self, mock_client_class, zwift_service):
+        """Test that only activities started after the date are downloaded."""
+        # Given
+        mock_profile = Mock()
+        mock_profile.get_activities.return_value = [
+            {'id': '2', 'startDate': '2025-10-15T06:00:00.000+0000'},
+            {'id': '1', 'startDate': '2025-10-14T18:00:00.000+0000'},
+        ]
+        mock_client_class.return_value.get_profile.return_value = mock_profile
+        zwift_service.authenticate()
+
+        # When
+        with patch.object(zwift_service, 'download_activity', side_effect=lambda a: f"{a.id}.fit") as download:
+            paths = zwift_service.download_activities_since_date("2025-10-15")
+
+        # Then
+        assert paths == ["2.fit"]
+        download.assert_called_once()
+
+    @patch('services.zwift_service.ZwiftClient')
+    @responses.activate
+    def test_download_activity_uses_fit_cache(self, mock_client_class, tmp_path):
+        """Test that a cached activity is restored without an S3 request."""
+        # Given
+        fit_cache = FitCache(str(tmp_path / "fit-cache"))
+        zwift_service = ZwiftService("test_user", "test_pass", cache_dir=str(tmp_path), fit_cache=fit_cache)
+        activity = {'id': '12345', 'fitFileBucket': 'test-bucket', 'fitFileKey': 'test-key.fit'}
+        responses.add(responses.GET, 'https://test-bucket.s3.amazonaws.com/test-key.fit',
+                      body=b'fake fit file content', status=200)
+
+        # When
+        first = zwift_service.download_activity(activity)
+        os.remove(first)
+        second = zwift_service.download_activity(activity)
+
+        # Then
+        assert len(responses.calls) == 1
+        with open(second, 'rb') as f:
+            assert f.read() == b'fake fit file content'